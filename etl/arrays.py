@@ -0,0 +1,270 @@
+from typing import List
+import numpy as np
+import pandas as pd
+
+from etl import transform
+from etl.metrics import METRICS
+
+
+class ColumnBlock:
+    '''
+    Блок выровненных столбцов NumPy одинаковой длины (struct-of-arrays)
+    Конвертации и агрегации добавляют в блок новые столбцы без копирования остальных,
+    датафрейм формируется один раз при выгрузке (to_frame)
+
+    Атрибуты:
+        columns (dict): Массивы столбцов по имени в порядке добавления
+        length (int): Количество строк
+    '''
+
+    __slots__ = ('columns', 'length')
+
+    def __init__(self, length: int):
+        self.columns = {}
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def add(self, name: str, values: np.ndarray):
+        '''
+        Добавляет (заменяет) столбец блока.
+
+        Параметры:
+            name (str): Имя столбца
+            values (np.ndarray): Одномерный массив длины блока
+        '''
+
+        if values.ndim != 1 or len(values) != self.length:
+            raise ValueError(f'Столбец {name} ({values.shape}) не выровнен с блоком из {self.length} строк')
+        self.columns[name] = values
+
+    def add_block(self, names: List[str], block: np.ndarray):
+        '''
+        Добавляет столбцы двумерного массива (строки x столбцы) под именами names.
+        '''
+
+        for i, name in enumerate(names):
+            self.add(name, block[:, i])
+
+    def stack(self, names: List[str]):
+        '''
+        Собирает столбцы names в двумерный массив float64 (строки x столбцы).
+        '''
+
+        block = np.empty((self.length, len(names)))
+        for i, name in enumerate(names):
+            block[:, i] = self.columns[name]
+        return block
+
+    def to_frame(self, names: List[str], rename: dict = None):
+        '''
+        Формирует датафрейм из столбцов блока.
+
+        Параметры:
+            names (List[str]): Столбцы в порядке датафрейма
+            rename (dict): Новые имена столбцов
+        Возвращает:
+            pd.DataFrame
+        '''
+
+        rename = rename or {}
+        return pd.DataFrame({rename.get(name, name): self.columns[name] for name in names})
+
+class ArrayMeteo:
+    '''
+    Обработка данных open-meteo API на массивах NumPy - альтернатива OpenMeteo без промежуточных датафреймов
+    Почасовые и суточные данные хранятся в блоках ColumnBlock, методы добавляют в них столбцы результатов.
+    Результаты вычислений совпадают с OpenMeteo (поддерживается время в формате unixtime, без компактной схемы типов)
+
+    Атрибуты:
+        locations (List[dict]): Ответы API по местоположениям
+        json_data (dict): Ответ API первого местоположения (описание единиц измерения)
+        hourly (ColumnBlock): Почасовые данные
+        daily (ColumnBlock): Суточные данные
+        keys (List[str]): Ключ суточных данных (['date'] либо ['location', 'date'] для нескольких местоположений)
+    '''
+
+    __slots__ = ('locations', 'json_data', 'hourly', 'daily', 'keys')
+
+    @METRICS.timed()
+    def __init__(self, meteo_data):
+        self.locations = meteo_data if isinstance(meteo_data, list) else [meteo_data]
+        self.json_data = self.locations[0]
+        self.keys = ['date'] if len(self.locations) == 1 else ['location', 'date']
+
+        if self.json_data['hourly_units']['time'] != 'unixtime' or self.json_data['daily_units']['time'] != 'unixtime':
+            raise ValueError('Обработка на массивах NumPy поддерживает только время в формате unixtime')
+
+        self.hourly = self.read_block('hourly')
+        self.daily = self.read_block('daily')
+
+        # Сдвиг временных данных с учетом временной зоны каждого местоположения
+        self.hourly.add('time', self.hourly['time'] + self.utc_shift('hourly'))
+        self.hourly.add('date', self.hourly['time']//86400*86400)
+        daily_shift = self.utc_shift('daily')
+        self.daily.add('date', self.daily['time'] + daily_shift)
+        for unit in ('sunrise', 'sunset'):
+            if self.json_data['daily_units'].get(unit) == 'unixtime':
+                self.daily.add(unit, self.daily[unit] + daily_shift)
+
+    def read_block(self, section: str):
+        '''
+        Собирает столбцы раздела ответа API (hourly или daily) всех местоположений в блок.
+        Массивы NumPy (при потоковом разборе ответа) одного местоположения используются без копирования,
+        списки значений с пропусками (null) приводятся к float64
+
+        Параметры:
+            section (str): Раздел ответа
+        Возвращает:
+            ColumnBlock
+        '''
+
+        def column(values):
+            values = np.asarray(values)
+            return values.astype(np.float64) if values.dtype == object else values
+
+        parts = [{name: column(values) for name, values in loc[section].items()} for loc in self.locations]
+        lengths = [len(part['time']) for part in parts]
+        block = ColumnBlock(sum(lengths))
+        if len(parts) > 1:
+            block.add('location', np.repeat(np.arange(len(parts), dtype=np.int64), lengths))
+        for name in parts[0]:
+            block.add(name, parts[0][name] if len(parts) == 1 else np.concatenate([part[name] for part in parts]))
+        return block
+
+    def utc_shift(self, section: str):
+        '''
+        Вычисляет сдвиг (в секундах) временных данных относительно UTC для строк блока раздела section.
+
+        Возвращает:
+            Число для одного местоположения, np.ndarray по строкам для нескольких
+        '''
+
+        shifts = np.array([transform.location_shift(loc) for loc in self.locations])
+        if len(shifts) == 1:
+            return shifts[0]
+        return shifts[getattr(self, section)['location']]
+
+    def day_codes(self):
+        '''
+        Вычисляет номер строки суточных данных для каждой почасовой строки (-1, если суток нет в суточных данных).
+
+        Возвращает:
+            np.ndarray
+        '''
+
+        def key(block):
+            date = block['date'].astype(np.int64)
+            return date if len(self.keys) == 1 else block['location']*(1 << 40) + date
+
+        daily_key, hourly_key = key(self.daily), key(self.hourly)
+        if not len(daily_key):
+            return np.full(len(hourly_key), -1)
+        order = np.argsort(daily_key, kind='stable')
+        positions = np.minimum(np.searchsorted(daily_key[order], hourly_key), len(order)-1)
+        return np.where(daily_key[order][positions] == hourly_key, order[positions], -1)
+
+    @METRICS.timed()
+    def convert_units(self, units: List[str]):
+        '''
+        Конвертирует столбцы почасовых данных по реестру UNIT_CONVERSIONS и добавляет их в блок hourly
+        под новыми именами (с окончанием целевой единицы).
+
+        Параметры:
+            units (List[str]): Список имен столбцов
+        Возвращает:
+            Список новых имен столбцов в порядке units
+        '''
+
+        hourly_units = self.json_data['hourly_units']
+        unknown = [unit for unit in units if hourly_units.get(unit) not in transform.UNIT_CONVERSIONS]
+        if unknown:
+            raise ValueError(f'Для столбцов {unknown} нет правила конвертации единиц измерения, обновите список!')
+
+        units_new = [unit+transform.UNIT_CONVERSIONS[hourly_units[unit]]['suffix'] for unit in units]
+        for source_unit in dict.fromkeys(hourly_units[unit] for unit in units):
+            positions = [i for i, unit in enumerate(units) if hourly_units[unit] == source_unit]
+            block = transform.convert_values(self.hourly.stack([units[i] for i in positions]), source_unit)
+            self.hourly.add_block([units_new[i] for i in positions], block)
+        return units_new
+
+    @METRICS.timed()
+    def aggregate(self, avg_units: List[str], total_units: List[str]):
+        '''
+        Вычисляет средние и общие значения за 24 часа и за промежуток светового дня (transform.aggregate_arrays)
+        и добавляет их в блок daily.
+
+        Параметры:
+            avg_units (List[str]): Список имен столбцов для вычисления средних значений
+            total_units (List[str]): Список имен столбцов для вычисления общих значений
+        Возвращает:
+            Список имен добавленных столбцов
+        '''
+
+        def seconds(name):
+            return self.daily[name].astype(np.float64)
+
+        result = transform.aggregate_arrays(
+            self.day_codes(), self.hourly.stack(avg_units+total_units), self.hourly['time'].astype(np.float64),
+            seconds('sunrise'), seconds('sunset'), len(avg_units)
+        )
+        columns = transform.aggregate_columns(avg_units, total_units)
+        self.daily.add_block(columns, result)
+        return columns
+
+    def daylight_hours(self):
+        '''
+        Вычисляет промежуток светового дня в часах и добавляет его в блок daily (столбец daylight_hours)
+        '''
+
+        self.daily.add('daylight_hours', np.round((self.daily['sunset'] - self.daily['sunrise'])/3600, 1))
+
+    def unix_to_iso(self, units: List[str], native: bool = False):
+        '''
+        Преобразует суточные временные данные в строки ISO 8601 и добавляет их в блок daily (столбцы с окончанием _iso).
+
+        Параметры:
+            units (List[str]): Список имен столбцов
+            native (bool): Метки времени datetime64[s] вместо строк
+        '''
+
+        for unit in units:
+            self.daily.add(unit+'_iso', transform.unix_seconds(self.daily[unit])[0] if native else transform.format_iso(self.daily[unit]))
+
+@METRICS.timed()
+def build_tables(am_obj: ArrayMeteo, native_timestamps: bool = False, spec: dict = transform.OUTPUT_SPEC):
+    '''
+    Формирует итоговые таблицы из данных ArrayMeteo по описанию spec. Таблицы совпадают с transform.build_tables.
+
+    Параметры:
+        am_obj: Экземпляр класса ArrayMeteo
+        native_timestamps: Время восхода и заката в виде меток времени UTC вместо строк ISO 8601
+        spec: Описание итоговых таблиц (OUTPUT_SPEC)
+    Возвращает:
+        Кортеж (table1 - суточные агрегированные метрики, table2 - почасовые конвертированные метрики)
+    '''
+
+    hourly_variables, _ = transform.required_variables(spec)
+    convertible = [unit for unit in hourly_variables if am_obj.json_data['hourly_units'].get(unit) in transform.UNIT_CONVERSIONS]
+    names = dict(zip(convertible, am_obj.convert_units(convertible)))
+
+    aggregates = am_obj.aggregate([names.get(unit, unit) for unit in spec['avg']], [names.get(unit, unit) for unit in spec['total']])
+    am_obj.daylight_hours()
+    am_obj.unix_to_iso(['sunrise', 'sunset'], native=native_timestamps)
+
+    # Датафреймы формируются один раз из столбцов блоков
+    table1 = am_obj.daily.to_frame(am_obj.keys + aggregates + ['daylight_hours', 'sunrise_iso', 'sunset_iso'], rename={'date': 'date_unix'})
+    if native_timestamps:
+        for column in ('sunrise_iso', 'sunset_iso'):
+            table1[column] = table1[column].dt.tz_localize('UTC')
+
+    table2 = am_obj.hourly.to_frame(am_obj.keys[:-1] + ['time'] + [names.get(unit, unit) for unit in spec['hourly']], rename={'time': 'time_unix'})
+
+    return table1, table2
@@ -0,0 +1,232 @@
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from etl import arrays, load, transform
+
+# Почасовые столбцы синтетического ответа и их единицы измерения (как в запросе extract.open_meteo_api)
+HOURLY_UNITS = {
+    'temperature_2m': '°F', 'relative_humidity_2m': '%', 'dew_point_2m': '°F', 'apparent_temperature': '°F',
+    'temperature_80m': '°F', 'temperature_120m': '°F', 'wind_speed_10m': 'kn', 'wind_speed_80m': 'kn',
+    'wind_direction_10m': '°', 'wind_direction_80m': '°', 'visibility': 'ft', 'evapotranspiration': 'inch',
+    'weather_code': 'wmo code', 'soil_temperature_0cm': '°F', 'soil_temperature_6cm': '°F',
+    'rain': 'inch', 'showers': 'inch', 'snowfall': 'inch',
+}
+
+# Файл базовых результатов по умолчанию
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'bench_baseline.json')
+
+
+def synthetic_response(years: float = 1, locations: int = 1, columns: list = None, missing_hours: float = 0.0,
+                       missing_values: float = 0.01, start: str = '2024-01-01', utc_offset: int = 25200, seed: int = 0):
+    '''
+    Формирует синтетический ответ open-meteo API в формате потокового разбора (массивы NumPy).
+
+    Параметры:
+        years: Длина интервала в годах
+        locations: Количество местоположений (при нескольких возвращается список ответов)
+        columns: Почасовые столбцы (по умолчанию - все столбцы HOURLY_UNITS)
+        missing_hours: Доля пропущенных часов (строк почасовых данных)
+        missing_values: Доля пропущенных значений (null) в почасовых столбцах
+        start: Начальная дата интервала
+        utc_offset: Сдвиг временной зоны в секундах
+        seed: Начальное значение генератора случайных чисел
+    Возвращает:
+        Словарь либо список словарей по местоположениям
+    '''
+
+    rng = np.random.default_rng(seed)
+    columns = columns or list(HOURLY_UNITS)
+    days = max(int(round(years*365)), 1)
+    first_day = int(np.datetime64(start, 's').astype(np.int64)) - utc_offset
+
+    responses = []
+    for _ in range(locations):
+        time_values = first_day + 3600*np.arange(days*24, dtype=np.int64)
+        if missing_hours:
+            time_values = time_values[rng.random(len(time_values)) >= missing_hours]
+        size = len(time_values)
+
+        hourly = {'time': time_values}
+        for column in columns:
+            unit = HOURLY_UNITS[column]
+            if unit == '°F':
+                values = np.round(rng.normal(40, 25, size), 1)
+            elif unit == 'kn':
+                values = np.round(rng.gamma(2, 3, size), 1)
+            elif unit == 'ft':
+                values = np.round(rng.uniform(60, 80000, size), 3)
+            elif unit == 'inch':
+                values = np.round(np.maximum(rng.normal(0, 0.02, size), 0), 3)
+            elif unit == 'wmo code':
+                values = rng.integers(0, 4, size).astype(np.float64)
+            else:
+                values = np.round(rng.uniform(0, 100, size))
+            values[rng.random(size) < missing_values] = np.nan
+            hourly[column] = values
+
+        day_values = first_day + 86400*np.arange(days, dtype=np.int64)
+        sunrise = day_values + 18000 + rng.integers(0, 3000, days)
+        sunset = day_values + 75000 + rng.integers(0, 3000, days)
+        responses.append({
+            'utc_offset_seconds': utc_offset, 'timezone_abbreviation': f'GMT+{utc_offset//3600}',
+            'hourly_units': {'time': 'unixtime'} | {column: HOURLY_UNITS[column] for column in columns},
+            'hourly': hourly,
+            'daily_units': {'time': 'unixtime', 'sunrise': 'unixtime', 'sunset': 'unixtime', 'daylight_duration': 's'},
+            'daily': {'time': day_values, 'sunrise': sunrise, 'sunset': sunset, 'daylight_duration': (sunset-sunrise).astype(np.float64)},
+        })
+
+    return responses[0] if locations == 1 else responses
+
+def measure(func, repeat: int = 5):
+    '''
+    Замеряет время выполнения функции.
+
+    Параметры:
+        func: Функция без параметров
+        repeat: Количество запусков
+    Возвращает:
+        Словарь (минимальное и медианное время в секундах)
+    '''
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return {'min': round(min(timings), 6), 'median': round(statistics.median(timings), 6)}
+
+def run_benchmarks(meteo_data, repeat: int = 5, db: bool = False):
+    '''
+    Замеряет горячие участки трансформации и выгрузки на данных meteo_data.
+
+    Параметры:
+        meteo_data: Ответ API (например, synthetic_response)
+        repeat: Количество запусков каждого замера
+        db: Замер выгрузки в локальную БД (load_to_db в схему bench). Без БД замеряется
+            формирование страниц COPY (load.csv_pages)
+    Возвращает:
+        Словарь результатов по имени замера
+    '''
+
+    om_obj = transform.OpenMeteo(meteo_data)
+    hourly_units = om_obj.json_data['hourly_units']
+    avg_units = ['temperature_2m', 'relative_humidity_2m', 'wind_speed_10m', 'visibility']
+    total_units = ['rain', 'showers', 'snowfall']
+
+    benchmarks = {'init': lambda: transform.OpenMeteo(meteo_data)}
+    for source_unit in transform.UNIT_CONVERSIONS:
+        units = [unit for unit, value in hourly_units.items() if value == source_unit]
+        if units:
+            benchmarks[f'convert_{source_unit}'] = lambda units=units, source_unit=source_unit: om_obj.converted(units, source_unit)
+    benchmarks |= {
+        'avg_for_24h': lambda: om_obj.avg_for_24h(avg_units),
+        'avg_for_daylight': lambda: om_obj.avg_for_daylight(avg_units),
+        'total_for_24h': lambda: om_obj.total_for_24h(total_units),
+        'total_for_daylight': lambda: om_obj.total_for_daylight(total_units),
+        'aggregate': lambda: om_obj.aggregate(avg_units, total_units),
+        'unix_to_iso': lambda: om_obj.unix_to_iso(['sunrise', 'sunset']),
+        'build_tables': lambda: transform.build_tables(transform.OpenMeteo(meteo_data)),
+        'build_tables_arrays': lambda: arrays.build_tables(arrays.ArrayMeteo(meteo_data)),
+    }
+
+    _, table2 = transform.build_tables(transform.OpenMeteo(meteo_data))
+    directory = tempfile.TemporaryDirectory()
+
+    def write_file(file_name):
+        with load.FileSink(os.path.join(directory.name, file_name)) as sink:
+            sink.write(table2.set_index('time_unix'))
+
+    benchmarks['csv_write'] = lambda: write_file('hourly.csv')
+    try:
+        load._pyarrow()
+        benchmarks['parquet_write'] = lambda: write_file('hourly.parquet')
+    except ImportError:
+        pass
+
+    if db:
+        with load.db_session() as conn:
+            load.ensure_tables(conn, 'bench')
+        benchmarks['db_load'] = lambda: load.load_to_db(table2, 'hourly', 'time_unix', schema='bench', conflict_resolve='UPDATE')
+    else:
+        benchmarks['db_copy_pages'] = lambda: sum(1 for _ in load.csv_pages(table2))
+
+    results = {}
+    try:
+        for name, func in benchmarks.items():
+            results[name] = measure(func, repeat)
+            results[name]['rows'] = len(om_obj.hourly)
+            print(f'{name:<24} {results[name]["min"]:>10.4f} с')
+    finally:
+        directory.cleanup()
+    return results
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.25):
+    '''
+    Сравнивает результаты замеров с базовыми.
+
+    Параметры:
+        results: Результаты run_benchmarks
+        baseline: Базовые результаты той же конфигурации
+        tolerance: Допустимое относительное замедление минимального времени (наименее зависящего от фоновой нагрузки)
+    Возвращает:
+        Список замеров с замедлением больше допустимого: (имя, базовое время, текущее время)
+    '''
+
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result['min']/baseline[name]['min'] if baseline[name]['min'] else 1
+        print(f'{name:<24} {baseline[name]["min"]:>10.4f} -> {result["min"]:>10.4f} с ({ratio:.2f}x)')
+        if ratio > 1 + tolerance:
+            regressions.append((name, baseline[name]['min'], result['min']))
+    return regressions
+
+def parse_arguments():
+    '''
+    Настраивает и парсит аргументы командной строки.
+
+    Returns:
+    argparse.Namespace: Объект с распаршенными аргументами
+    '''
+    parser = argparse.ArgumentParser(description='Замеры производительности трансформации и выгрузки данных на синтетических данных')
+    parser.add_argument('--years', type=float, default=1, help='Длина интервала в годах (по умолчанию: 1)')
+    parser.add_argument('--locations', type=int, default=1, help='Количество местоположений (по умолчанию: 1)')
+    parser.add_argument('--missing_hours', type=float, default=0.0, help='Доля пропущенных часов (по умолчанию: 0)')
+    parser.add_argument('--repeat', type=int, default=5, help='Количество запусков каждого замера (по умолчанию: 5)')
+    parser.add_argument('--db', action='store_true', help='Замер выгрузки в локальную БД (схема bench)')
+    parser.add_argument('--baseline', type=str, default=BASELINE_PATH, help='Файл базовых результатов')
+    parser.add_argument('--save_baseline', action='store_true', help='Сохранить результаты как базовые')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Допустимое замедление относительно базовых результатов (по умолчанию: 0.25)')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+
+    args = parse_arguments()
+    config = f'years={args.years:g},locations={args.locations},missing_hours={args.missing_hours:g}'
+
+    results = run_benchmarks(synthetic_response(args.years, args.locations, missing_hours=args.missing_hours), args.repeat, args.db)
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baselines = json.load(f)
+
+    if args.save_baseline:
+        baselines[config] = results
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baselines, f, indent=2, ensure_ascii=False)
+        print(f'Базовые результаты {config} сохранены в {args.baseline}')
+    elif config in baselines:
+        regressions = compare(results, baselines[config], args.tolerance)
+        if regressions:
+            print(f'Замедление относительно базовых результатов: {", ".join(name for name, _, _ in regressions)}')
+            raise SystemExit(1)
+    else:
+        print(f'Базовых результатов для {config} нет, сохраните их с --save_baseline')
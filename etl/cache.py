@@ -0,0 +1,163 @@
+import gzip
+import hashlib
+import json
+import os
+import time
+from datetime import date, timedelta
+
+
+class ResponseCache:
+    '''
+    Локальный кэш ответов open-meteo API на диске
+    Ответы хранятся в сжатом виде (gzip) под ключом - хэшем полного адреса запроса.
+    Ответы за прошедшие дни хранятся бессрочно, ответы, затрагивающие текущие и прогнозные дни - в течение ttl секунд.
+    При превышении max_bytes удаляются давно не использованные записи (LRU по времени последнего обращения)
+
+    Атрибуты:
+        directory (str): Каталог кэша
+        max_bytes (int): Максимальный суммарный размер записей кэша в байтах
+        ttl (int): Время жизни записей, затрагивающих текущие и прогнозные дни, в секундах
+    '''
+
+    def __init__(self, directory: str = '.cache/open_meteo', max_bytes: int = 512*1024**2, ttl: int = 3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, url: str):
+        '''
+        Возвращает путь файла записи кэша для адреса запроса.
+
+        Параметры:
+            url (str): Полный адрес запроса
+        Возвращает:
+            Строку
+        '''
+
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key[:2], key+'.json.gz')
+
+    def get(self, url: str):
+        '''
+        Возвращает тело сохраненного ответа, если запись существует и не устарела.
+
+        Параметры:
+            url (str): Полный адрес запроса
+        Возвращает:
+            bytes либо None
+        '''
+
+        chunks = self.get_stream(url)
+        try:
+            return None if chunks is None else b''.join(chunks)
+        except FileNotFoundError:
+            return None
+
+    def get_stream(self, url: str, chunk_size: int = 1<<16):
+        '''
+        Возвращает генератор частей тела сохраненного ответа, если запись существует и не устарела.
+
+        Параметры:
+            url (str): Полный адрес запроса
+            chunk_size (int): Размер части в байтах
+        Возвращает:
+            Генератор bytes либо None. Если запись удалена до чтения первой части, генератор вызывает FileNotFoundError
+        '''
+
+        path = self.path(url)
+        try:
+            with gzip.open(path, 'rb') as f:
+                meta = json.loads(f.readline())
+            if meta['expires'] is not None and meta['expires'] < time.time():
+                self.remove(path)
+                return None
+            # Обновление времени последнего обращения для вытеснения по LRU
+            os.utime(path)
+        except (OSError, EOFError, ValueError):
+            # Запись удалена (например, вытеснена параллельным запуском) либо повреждена - промах кэша
+            return None
+
+        # Файл открывается при чтении первой части, поэтому неиспользованный генератор не удерживает его открытым
+        def chunks():
+            with gzip.open(path, 'rb') as f:
+                f.readline()
+                while chunk := f.read(chunk_size):
+                    yield chunk
+        return chunks()
+
+    def put(self, url: str, content: bytes, end_date: str = None):
+        '''
+        Сохраняет тело ответа в кэш и вытесняет давно не использованные записи при превышении размера.
+
+        Параметры:
+            url (str): Полный адрес запроса
+            content (bytes): Тело ответа
+            end_date (str): Крайняя дата интервала запроса. Если она раньше вчерашнего дня, запись хранится бессрочно
+        '''
+
+        for _ in self.put_stream(url, [content], end_date):
+            pass
+
+    def put_stream(self, url: str, chunks, end_date: str = None):
+        '''
+        Сохраняет тело ответа в кэш по мере чтения его частей.
+        Запись появляется в кэше только после чтения всех частей.
+
+        Параметры:
+            url (str): Полный адрес запроса
+            chunks: Итерируемый объект с частями тела ответа (bytes)
+            end_date (str): Крайняя дата интервала запроса. Если она раньше вчерашнего дня, запись хранится бессрочно
+        Возвращает:
+            Генератор тех же частей тела ответа
+        '''
+
+        permanent = end_date is not None and date.fromisoformat(end_date) < date.today()-timedelta(days=1)
+        meta = {'url': url, 'expires': None if permanent else time.time()+self.ttl}
+
+        path = self.path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{time.monotonic_ns()}.tmp'
+        try:
+            with gzip.open(tmp_path, 'wb') as f:
+                f.write(json.dumps(meta).encode('utf-8')+b'\n')
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            os.replace(tmp_path, path)
+        finally:
+            self.remove(tmp_path)
+
+        self.evict()
+
+    def evict(self):
+        '''
+        Удаляет записи кэша в порядке давности последнего обращения, пока суммарный размер превышает max_bytes.
+        '''
+
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.json.gz'):
+                    try:
+                        stat = os.stat(os.path.join(root, name))
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self.remove(path)
+            total -= size
+
+    def remove(self, path: str):
+        '''
+        Удаляет файл записи кэша (если он еще существует).
+        '''
+
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -1,19 +1,166 @@
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
 from typing import List
-import requests
 
+from etl.lazy import lazy_import
+from etl.metrics import METRICS
+
+# HTTP клиент и NumPy импортируются при первом запросе к API
+np = lazy_import('numpy')
+requests = lazy_import('requests')
+
+OPEN_METEO_URL = 'https://api.open-meteo.com/v1/forecast'
+
+# Коды ответа, при которых запрос повторяется
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Ограничение бесплатного тарифа open-meteo: запросов в минуту
+OPEN_METEO_RATE_LIMIT = 600
+
+# Типы массивов при потоковом разборе ответа: временные данные - int64, остальные значения - float64
+STREAM_DTYPES = {'time': 'int64', 'sunrise': 'int64', 'sunset': 'int64'}
+
+
+class RateLimiter:
+    '''
+    Ограничитель частоты запросов (token bucket), общий для всех потоков
+    Запрос ожидает, пока в корзине не появится свободный токен, токены пополняются со скоростью rate в секунду
+
+    Атрибуты:
+        rate (float): Количество запросов в секунду
+        burst (int): Максимальное количество запросов подряд без ожидания
+    '''
+
+    def __init__(self, rate: float = OPEN_METEO_RATE_LIMIT/60, burst: int = 10):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        '''
+        Ожидает свободный токен и занимает его
+        '''
+
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated)*self.rate)
+            self.updated = now
+            self.tokens -= 1
+            delay = -self.tokens/self.rate if self.tokens < 0 else 0
+        if delay:
+            time.sleep(delay)
+
+# Ограничитель частоты запросов к open-meteo по умолчанию, общий для всех клиентов
+RATE_LIMITER = RateLimiter()
+
+
+class OpenMeteoClient:
+    '''
+    HTTP клиент open-meteo API с постоянными соединениями
+    Запросы выполняются через одну сессию requests с пулом keep-alive соединений, поэтому
+    установка TCP/TLS соединения не повторяется для каждого запроса. Ответы запрашиваются сжатыми (gzip, br при наличии brotli),
+    частота запросов ограничивается общим RateLimiter, задержка каждого запроса сохраняется в latencies
+
+    Атрибуты:
+        session (requests.Session): Сессия с пулом соединений
+        timeout (tuple): Таймауты установки соединения и чтения ответа в секундах
+        rate_limiter (RateLimiter): Ограничитель частоты запросов (None - без ограничения)
+        latencies (list): Пары (статус ответа, задержка до получения заголовков ответа в секундах)
+    '''
+
+    def __init__(self, pool_size: int = 8, timeout: tuple = (10, 60), rate_limiter: RateLimiter = RATE_LIMITER):
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.request import ACCEPT_ENCODING
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'Accept-Encoding': ACCEPT_ENCODING, 'Connection': 'keep-alive'})
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.latencies = []
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+    def get(self, url: str, stream: bool = False):
+        '''
+        Выполняет GET запрос через сессию клиента с учетом ограничения частоты запросов.
+
+        Параметры:
+            url: Адрес запроса
+            stream: Не загружать тело ответа сразу (для потокового чтения через iter_content)
+        Возвращает:
+            requests.Response
+        '''
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        start = time.perf_counter()
+        r = self.session.get(url, timeout=self.timeout, stream=stream)
+        with self.lock:
+            self.latencies.append((r.status_code, time.perf_counter()-start))
+        return r
+
+    def open_meteo_api(self, **kwargs):
+        '''
+        Выполняет запрос данных по API open-meteo через клиент (параметры совпадают с extract.open_meteo_api)
+        '''
+
+        return open_meteo_api(**kwargs, client=self)
+
+    def latency_report(self):
+        '''
+        Формирует сводку задержек выполненных запросов.
+
+        Возвращает:
+            Словарь (количество запросов, средняя, медианная, 95 перцентиль и максимальная задержка в секундах)
+        '''
+
+        with self.lock:
+            latencies = np.array([latency for _, latency in self.latencies])
+        if not len(latencies):
+            return {'requests': 0}
+        return {
+            'requests': len(latencies),
+            'mean': round(float(latencies.mean()), 3),
+            'p50': round(float(np.percentile(latencies, 50)), 3),
+            'p95': round(float(np.percentile(latencies, 95)), 3),
+            'max': round(float(latencies.max()), 3),
+        }
+
+    def close(self):
+        '''
+        Закрывает соединения сессии
+        '''
+
+        self.session.close()
 
 def open_meteo_api(latitude: str = '55.0344', longitude: str = '82.9434', daily: List[str] = ["sunrise","sunset","daylight_duration"]
                    ,hourly: List[str] = ['temperature_2m','relative_humidity_2m','dew_point_2m','apparent_temperature','temperature_80m','temperature_120m','wind_speed_10m'
                                          ,'wind_speed_80m','wind_direction_10m','wind_direction_80m','visibility','evapotranspiration','weather_code','soil_temperature_0cm'
                                          ,'soil_temperature_6cm','rain','showers','snowfall']
                     ,timezone: str = 'auto', timeformat: str = 'unixtime', wind_speed_unit: str = 'kn', temperature_unit : str = 'fahrenheit'
-                    ,precipitation_unit: str = 'inch', start_date: str = '2025-05-16', end_date: str = '2025-05-30'):
+                    ,precipitation_unit: str = 'inch', start_date: str = '2025-05-16', end_date: str = '2025-05-30'
+                    ,chunk_days: int = None, max_workers: int = 4, retries: int = 3, backoff: float = 0.5, base_url: str = OPEN_METEO_URL
+                    ,cache = None, stream: bool = False, dtypes: dict = None, client = None):
     '''
     Выполняет запрос данных по API open-meteo и извлекает данные в формате JSON
 
     Параметры:
-        latitude: Широта запрашевоемого местоположения
-        longitude: Долгота запрашеваемого местоположения
+        latitude: Широта запрашевоемого местоположения (список - для запроса по нескольким местоположениям)
+        longitude: Долгота запрашеваемого местоположения (список - для запроса по нескольким местоположениям)
         daily: Список ежедневных данных
         hourly: Список почасовых данных
         timezone: Часовой пояс запрашеваемого местоположения
@@ -23,19 +170,327 @@ def open_meteo_api(latitude: str = '55.0344', longitude: str = '82.9434', daily:
         precipitation_unit: Единица измерения атмосферных осадков
         start_date: Начальная дата интервала запроса 
         end_date: Крайняя дата интервала запроса
+        chunk_days: Длина (в сутках) части интервала, запрашиваемой отдельным запросом. Если не указана, интервал запрашивается целиком
+        max_workers: Максимальное количество одновременных запросов
+        retries: Количество повторов запроса при ответах 429/5xx и сетевых ошибках
+        backoff: Начальная пауза между повторами в секундах (удваивается с каждым повтором)
+        base_url: Адрес API (например, архивный https://archive-api.open-meteo.com/v1/archive для многолетних выгрузок)
+        cache: Локальный кэш ответов (etl.cache.ResponseCache). Ответы частей интервала, найденные в кэше, не запрашиваются повторно
+        stream: Потоковый разбор тела ответа: массивы разделов hourly и daily декодируются сразу в массивы NumPy,
+                минуя списки python объектов
+        dtypes: Типы массивов NumPy по именам столбцов при потоковом разборе (дополняют STREAM_DTYPES)
+        client: HTTP клиент с постоянными соединениями (OpenMeteoClient). По умолчанию каждый запрос выполняется через requests.get
     Возвращает:
-        Словарь (результат запроса)
+        Словарь (результат запроса), либо список словарей по каждому местоположению при запросе по нескольким координатам
     '''
 
-    url = (f"https://api.open-meteo.com/v1/forecast?latitude={latitude}&longitude={longitude}&daily={','.join(daily)}&"
-        f"hourly={','.join(hourly)}&timezone={timezone}&timeformat={timeformat}&wind_speed_unit={wind_speed_unit}&temperature_unit={temperature_unit}&"
-        f"precipitation_unit={precipitation_unit}&start_date={start_date}&end_date={end_date}")
+    if isinstance(latitude, (list, tuple)):
+        latitude = ','.join(map(str, latitude))
+    if isinstance(longitude, (list, tuple)):
+        longitude = ','.join(map(str, longitude))
 
-    try:
-        r = requests.get(url)
-        r.raise_for_status()
+    def url(start_date, end_date):
+        return (f"{base_url}?latitude={latitude}&longitude={longitude}&daily={','.join(daily)}&"
+            f"hourly={','.join(hourly)}&timezone={timezone}&timeformat={timeformat}&wind_speed_unit={wind_speed_unit}&temperature_unit={temperature_unit}&"
+            f"precipitation_unit={precipitation_unit}&start_date={start_date}&end_date={end_date}")
+
+    def fetch(date_range):
+        request_url = url(*date_range)
+        if cache is not None:
+            if stream:
+                chunks = cache.get_stream(request_url)
+                if chunks is not None:
+                    try:
+                        result = decode_stream(chunks, dtypes)
+                        METRICS.count('cache_hits', stage='extract')
+                        return result
+                    except FileNotFoundError:
+                        # Запись вытеснена между проверкой и чтением - ответ запрашивается по API
+                        pass
+            else:
+                content = cache.get(request_url)
+                if content is not None:
+                    METRICS.count('cache_hits', stage='extract')
+                    return json.loads(content)
+
+        r = get_with_retry(request_url, retries=retries, backoff=backoff, stream=stream, client=client)
+        if stream:
+            with r:
+                chunks = counted_bytes(r.iter_content(chunk_size=1<<16))
+                if cache is not None:
+                    chunks = cache.put_stream(request_url, chunks, end_date=date_range[1])
+                return decode_stream(chunks, dtypes)
 
+        METRICS.count('bytes', len(r.content), stage='extract')
+        if cache is not None:
+            cache.put(request_url, r.content, end_date=date_range[1])
         return r.json()
+
+    try:
+        date_ranges = plan_date_ranges(start_date, end_date, chunk_days) if chunk_days else [(start_date, end_date)]
+        if len(date_ranges) == 1:
+            return fetch(date_ranges[0])
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return merge_responses(list(executor.map(fetch, date_ranges)))
     except requests.RequestException as e:
         print(f"Ошибка при извлечении данных: {e}")
-        return None
\ No newline at end of file
+        return None
+
+def counted_bytes(chunks):
+    '''
+    Передает части тела ответа без изменений, учитывая их размер в метрике bytes стадии extract
+    '''
+
+    for chunk in chunks:
+        METRICS.count('bytes', len(chunk), stage='extract')
+        yield chunk
+
+def plan_date_ranges(start_date: str, end_date: str, chunk_days: int):
+    '''
+    Разбивает интервал дат на последовательные части длиной не более chunk_days суток
+
+    Параметры:
+        start_date: Начальная дата интервала (например, '2025-05-16')
+        end_date: Крайняя дата интервала (включительно)
+        chunk_days: Максимальная длина части в сутках
+    Возвращает:
+        Список пар (начальная дата, крайняя дата) в формате ISO
+    '''
+
+    if chunk_days < 1:
+        raise ValueError('Длина части интервала должна быть не меньше одних суток')
+
+    start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+    date_ranges = []
+    while start <= end:
+        chunk_end = min(start + timedelta(days=chunk_days-1), end)
+        date_ranges.append((start.isoformat(), chunk_end.isoformat()))
+        start = chunk_end + timedelta(days=1)
+    return date_ranges
+
+def get_with_retry(url: str, retries: int = 3, backoff: float = 0.5, timeout: float = 60, stream: bool = False, client = None):
+    '''
+    Выполняет GET запрос с повторами при ответах 429/5xx и сетевых ошибках.
+    Пауза между повторами растет экспоненциально либо берется из заголовка Retry-After
+
+    Параметры:
+        url: Адрес запроса
+        retries: Количество повторов
+        backoff: Начальная пауза между повторами в секундах
+        timeout: Таймаут запроса в секундах
+        stream: Не загружать тело ответа сразу (для потокового чтения через iter_content)
+        client: HTTP клиент (OpenMeteoClient), через сессию которого выполняется запрос (таймауты задаются клиентом)
+    Возвращает:
+        requests.Response
+    '''
+
+    for attempt in range(retries+1):
+        delay = backoff * 2**attempt
+        try:
+            if client is not None:
+                r = client.get(url, stream=stream)
+            else:
+                r = requests.get(url, timeout=timeout, stream=stream)
+            METRICS.count('requests', stage='extract', status=r.status_code)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == retries:
+                raise
+        else:
+            if r.status_code not in RETRY_STATUSES or attempt == retries:
+                r.raise_for_status()
+                return r
+            retry_after = r.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                delay = int(retry_after)
+            r.close()
+        time.sleep(delay)
+
+def merge_responses(parts: List[dict]):
+    '''
+    Объединяет ответы API по последовательным частям интервала в один ответ.
+    Массивы разделов hourly и daily склеиваются в порядке частей
+
+    Параметры:
+        parts: Список ответов API в хронологическом порядке
+    Возвращает:
+        Словарь (объединенный ответ), либо список словарей для ответов по нескольким местоположениям
+    '''
+
+    if isinstance(parts[0], list):
+        return [merge_responses([part[i] for part in parts]) for i in range(len(parts[0]))]
+
+    merged = dict(parts[0])
+    for section in ('hourly', 'daily'):
+        if section in merged:
+            merged[section] = {
+                key: np.concatenate([part[section][key] for part in parts]) if isinstance(parts[0][section][key], np.ndarray)
+                     else [value for part in parts for value in part[section][key]]
+                for key in parts[0][section]
+            }
+    return merged
+
+def decode_stream(chunks, dtypes: dict = None):
+    '''
+    Потоково разбирает тело JSON ответа API по частям.
+    Массивы чисел (значения разделов hourly и daily) декодируются по мере чтения сразу в массивы NumPy,
+    остальная (небольшая) часть ответа собирается в отдельный документ и разбирается json.loads.
+
+    Параметры:
+        chunks: Итерируемый объект с частями тела ответа (bytes)
+        dtypes: Типы массивов по именам столбцов (дополняют STREAM_DTYPES, по умолчанию - float64)
+    Возвращает:
+        Словарь (результат запроса), либо список словарей по каждому местоположению
+    '''
+
+    decoder = StreamDecoder({**STREAM_DTYPES, **(dtypes or {})})
+    for chunk in chunks:
+        decoder.feed(chunk)
+    return decoder.result()
+
+class StreamDecoder:
+    '''
+    Потоковый декодер JSON ответа open-meteo API
+    Массив, первый элемент которого - число или null, заменяется в документе заглушкой {"$array": номер},
+    а его элементы разбираются по частям в массивы NumPy. Тип массива определяется по имени ключа.
+
+    Атрибуты:
+        dtypes (dict): Типы массивов по именам ключей
+        skeleton (List[bytes]): Части документа без числовых массивов
+        tail (bytes): Последние байты документа без числовых массивов (для определения имени массива)
+        arrays (List[tuple]): Разобранные части и тип каждого числового массива
+    '''
+
+    NUMBER_START = b'-0123456789n'
+    STRUCTURE_TOKEN = re.compile(rb'["\\\[]')
+    STRING_TOKEN = re.compile(rb'["\\]')
+    KEY = re.compile(rb'"([^"\\]*)"\s*:\s*$')
+
+    def __init__(self, dtypes: dict):
+        self.dtypes = dtypes
+        self.skeleton = []
+        self.tail = b''
+        self.arrays = []
+        self.mode = 'structure'
+        self.in_string = False
+        self.escape = False
+        self.carry = b''
+
+    def feed(self, chunk: bytes):
+        '''
+        Разбирает очередную часть тела ответа.
+
+        Параметры:
+            chunk (bytes): Часть тела ответа
+        '''
+
+        position = 0
+        while position < len(chunk):
+            if self.mode == 'numbers':
+                end = chunk.find(b']', position)
+                self.numbers(chunk[position:] if end == -1 else chunk[position:end], final=end != -1)
+                if end == -1:
+                    return
+                self.mode = 'structure'
+                position = end+1
+
+            elif self.mode == 'array_start':
+                while position < len(chunk) and chunk[position] in b' \t\r\n':
+                    position += 1
+                if position == len(chunk):
+                    return
+                if chunk[position] in self.NUMBER_START:
+                    # Имя массива - последний ключ документа перед открывающей скобкой
+                    key = self.KEY.search(self.tail)
+                    name = key.group(1).decode() if key else None
+                    self.emit(b'{"$array": %d}' % len(self.arrays))
+                    self.arrays.append(([], self.dtypes.get(name, np.float64)))
+                    self.mode = 'numbers'
+                else:
+                    self.emit(b'[')
+                    self.mode = 'structure'
+
+            else:
+                start, bracket = position, False
+                while position < len(chunk):
+                    if self.escape:
+                        self.escape = False
+                        position += 1
+                        continue
+                    token = (self.STRING_TOKEN if self.in_string else self.STRUCTURE_TOKEN).search(chunk, position)
+                    if token is None:
+                        position = len(chunk)
+                        break
+                    position = token.end()
+                    if token.group() == b'\\':
+                        self.escape = True
+                    elif token.group() == b'"':
+                        self.in_string = not self.in_string
+                    else:
+                        bracket = True
+                        break
+                if bracket:
+                    self.emit(chunk[start:position-1])
+                    self.mode = 'array_start'
+                else:
+                    self.emit(chunk[start:position])
+
+    def emit(self, text: bytes):
+        '''
+        Добавляет часть документа без числовых массивов.
+
+        Параметры:
+            text (bytes): Часть документа
+        '''
+
+        self.skeleton.append(text)
+        self.tail = (self.tail+text)[-256:]
+
+    def numbers(self, text: bytes, final: bool):
+        '''
+        Декодирует часть содержимого текущего числового массива. Неполное число в конце части переносится в следующую.
+
+        Параметры:
+            text (bytes): Часть содержимого массива
+            final (bool): Признак последней части массива
+        '''
+
+        text = self.carry+text
+        if final:
+            self.carry = b''
+        else:
+            cut = text.rfind(b',')
+            text, self.carry = (b'', text) if cut == -1 else (text[:cut], text[cut+1:])
+
+        if not text.strip():
+            return
+
+        parts, dtype = self.arrays[-1]
+        if b'null' in text:
+            text = text.replace(b'null', b'nan')
+            if not np.issubdtype(dtype, np.floating):
+                dtype = np.float64
+        values = np.fromstring(text, dtype=dtype, sep=',')
+        if len(values) != text.count(b',')+1:
+            raise ValueError('Некорректный числовой массив в ответе API')
+        parts.append(values)
+
+    def result(self):
+        '''
+        Собирает разобранный документ, подставляя массивы NumPy вместо заглушек.
+
+        Возвращает:
+            Словарь либо список словарей
+        '''
+
+        def restore(node):
+            if isinstance(node, dict):
+                if node.keys() == {'$array'}:
+                    parts, dtype = self.arrays[node['$array']]
+                    return np.concatenate(parts) if parts else np.array([], dtype=dtype)
+                return {key: restore(value) for key, value in node.items()}
+            if isinstance(node, list):
+                return [restore(value) for value in node]
+            return node
+
+        return restore(json.loads(b''.join(self.skeleton)))
\ No newline at end of file
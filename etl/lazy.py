@@ -0,0 +1,33 @@
+import importlib
+import sys
+import types
+
+
+class LazyModule(types.ModuleType):
+    '''
+    Модуль, импортируемый при первом обращении к его атрибуту
+    Используется для тяжелых зависимостей (pandas, numpy, psycopg2, requests), чтобы запуск программы (например, --help
+    или инкрементальный запуск без новых данных) не тратил время на импорт модулей стадий, которые не выполняются
+
+    Атрибуты:
+        __name__ (str): Полное имя модуля (например, 'psycopg2.extras')
+    '''
+
+    def __getattr__(self, name):
+        return getattr(importlib.import_module(self.__name__), name)
+
+    def __repr__(self):
+        return f'<lazy module {self.__name__!r}>'
+
+def lazy_import(name: str):
+    '''
+    Возвращает модуль name: уже импортированный либо отложенный до первого обращения к атрибуту.
+
+    Параметры:
+        name: Полное имя модуля
+    Возвращает:
+        Модуль либо LazyModule
+    '''
+
+    module = sys.modules.get(name)
+    return module if module is not None else LazyModule(name)
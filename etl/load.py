@@ -1,7 +1,55 @@
+from __future__ import annotations
+
+import hashlib
+import io
 import os
-import pandas as pd
-import psycopg2
-from psycopg2 import sql
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+
+from etl.lazy import lazy_import
+from etl.metrics import METRICS
+
+# Тяжелые зависимости импортируются при первом использовании (выгрузка в файлы не требует psycopg2, запрос водяного знака - pandas)
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+psycopg2 = lazy_import('psycopg2')
+sql = lazy_import('psycopg2.sql')
+extras = lazy_import('psycopg2.extras')
+pg_pool = lazy_import('psycopg2.pool')
+
+# Схема, таблицы которой создаются init.sql/init_typed.sql и служат образцом для схем других местоположений
+TEMPLATE_SCHEMA = 'nsk_plus_7gt'
+
+# Пулы соединений, переиспользуемые между вызовами load_to_db (ключ - строка подключения)
+_pools = {}
+_pools_lock = threading.Lock()
+
+@lru_cache(maxsize=None)
+def pooled_connection_class():
+    '''
+    Возвращает класс соединения пула, хранящего имена подготовленных на сервере запросов
+    (класс наследует соединение psycopg2 и создается при первом обращении к БД)
+
+    Атрибуты соединения:
+        prepared (dict): Имена подготовленных запросов по ключу (схема, таблица, столбцы, способ решения конфликтов)
+    '''
+
+    class PooledConnection(psycopg2.extensions.connection):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.prepared = {}
+
+    return PooledConnection
+
+def execute_values(cursor, query, argslist, **kwargs):
+    '''
+    Пакетная вставка строк psycopg2.extras.execute_values
+    '''
+
+    return extras.execute_values(cursor, query, argslist, **kwargs)
 
 def load_to_csv(df:pd.DataFrame, file_path: str, separator=',',encoding='utf-8'):
     '''
@@ -22,62 +70,685 @@ def load_to_csv(df:pd.DataFrame, file_path: str, separator=',',encoding='utf-8')
     except Exception as e:
         print(f"Ошибка при сохранении файла: {e}")
         return False 
+
+# Форматы файловой выгрузки: расширение файла по формату
+FILE_FORMATS = {'csv': '.csv', 'parquet': '.parquet', 'feather': '.feather'}
+
+# Форматы партиций файловой выгрузки по времени из индекса датафрейма (unix-время)
+PARTITIONS = {'month': '%Y-%m', 'date': '%Y-%m-%d'}
+
+class FileSink:
+    '''
+    Файловая выгрузка датафреймов в формате CSV, Parquet или Arrow IPC (Feather).
+    Каждый вызов write дописывает в открытый файл новую группу строк (row group/record batch), поэтому
+    датафрейм можно выгружать частями. Файлы Parquet и Feather сохраняют типы столбцов и индекса
+
+    Атрибуты:
+        file_path (str): Путь файла. Расширение заменяется на расширение формата
+        file_format (str): Формат файла ('csv', 'parquet', 'feather'), по умолчанию - по расширению пути
+        compression (str): Кодек сжатия (например, 'zstd', 'snappy', 'lz4' для Parquet, 'zstd', 'lz4' для Feather,
+                           'gzip' для CSV), по умолчанию - кодек формата по умолчанию
+        partition_by (str): Разбиение файлов по времени индекса ('month', 'date'), файлы партиций сохраняются
+                            в каталоге пути в подкаталогах вида month=2025-05
+        writers (dict): Открытые файлы по пути партиции
+    '''
+
+    def __init__(self, file_path, file_format = None, compression = None, partition_by = None, separator = ',', encoding = 'utf-8'):
+        base, extension = os.path.splitext(file_path)
+        if file_format is None:
+            file_format = next((name for name, ext in FILE_FORMATS.items() if ext == extension), 'csv')
+        if file_format not in FILE_FORMATS:
+            raise ValueError(f'Неизвестный формат файла {file_format}, доступны: {", ".join(FILE_FORMATS)}')
+        if partition_by is not None and partition_by not in PARTITIONS:
+            raise ValueError(f'Неизвестное разбиение файлов {partition_by}, доступны: {", ".join(PARTITIONS)}')
+
+        self.file_path = base + FILE_FORMATS[file_format]
+        self.file_format = file_format
+        self.compression = compression
+        self.partition_by = partition_by
+        self.separator = separator
+        self.encoding = encoding
+        self.writers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+    def write(self, df: pd.DataFrame):
+        '''
+        Дописывает датафрейм в файл (в файлы партиций при разбиении)
+        '''
+
+        if self.partition_by is None:
+            self.write_part(self.file_path, df)
+            return
+
+        base, extension = os.path.splitext(self.file_path)
+        keys = pd.to_datetime(np.asarray(df.index), unit='s').strftime(PARTITIONS[self.partition_by])
+        for key, part in df.groupby(keys, sort=True):
+            self.write_part(os.path.join(base, f'{self.partition_by}={key}', f'part-0{extension}'), part)
+
+    def write_part(self, path, df: pd.DataFrame):
+        '''
+        Дописывает датафрейм в файл по пути, открывая файл при первой записи
+        '''
+
+        writer = self.writers.get(path)
+        if writer is None:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+        if self.file_format == 'csv':
+            df.to_csv(path, sep=self.separator, encoding=self.encoding, mode='w' if writer is None else 'a',
+                      header=writer is None, compression=self.compression)
+            self.writers[path] = True
+            return
+
+        pa = _pyarrow()
+        if writer is None:
+            table = pa.Table.from_pandas(df, preserve_index=True)
+            if self.file_format == 'parquet':
+                writer = pa.parquet.ParquetWriter(path, table.schema, compression=self.compression or 'snappy')
+            else:
+                writer = pa.ipc.new_file(path, table.schema,
+                                         options=pa.ipc.IpcWriteOptions(compression=self.compression))
+            self.writers[path] = writer
+        else:
+            table = pa.Table.from_pandas(df, schema=writer.schema, preserve_index=True)
+        writer.write_table(table)
+
+    def close(self):
+        '''
+        Закрывает открытые файлы
+        '''
+
+        for writer in self.writers.values():
+            if writer is not True:
+                writer.close()
+        self.writers.clear()
+
+def _pyarrow():
+    '''
+    Импортирует pyarrow при первой выгрузке в формате Parquet/Feather (необязательная зависимость)
+    '''
+
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError('Для выгрузки в форматах parquet и feather необходимо установить pyarrow') from e
+    return pyarrow
+
+def load_to_file(df: pd.DataFrame, file_path: str, file_format = None, compression = None, partition_by = None, sink = None):
+    '''
+    Сохраняет передаваемый датафрейм в файл формата CSV, Parquet или Feather по указанному пути
+
+    Параметры:
+        df: Датафрейм для выгрузки
+        file_path: Путь файла
+        file_format: Формат файла ('csv', 'parquet', 'feather'), по умолчанию - по расширению пути
+        compression: Кодек сжатия
+        partition_by: Разбиение файлов по времени индекса ('month', 'date')
+        sink: Открытая файловая выгрузка (FileSink), в которую датафрейм дописывается частью.
+              По умолчанию файл создается и закрывается в рамках вызова
+    Возвращает:
+        True при успешной выгрузке, иначе False
+    '''
+
+    try:
+        with METRICS.timer('load_file'):
+            if sink is not None:
+                sink.write(df)
+                file_path = sink.file_path
+            else:
+                with FileSink(file_path, file_format, compression, partition_by) as sink:
+                    sink.write(df)
+                    file_path = sink.file_path
+        METRICS.count('rows_out', len(df), stage='load_file', path=file_path)
+        print(f"Датафрейм успешно сохранен в {file_path}")
+        return True
+    except Exception as e:
+        print(f"Ошибка при сохранении файла: {e}")
+        return False
     
+def get_pool(db = 'open_meteo_stats', user = 'admin', password = 'admin', host = 'localhost', port = '5433', minconn = 1, maxconn = 8):
+    '''
+    Возвращает пул соединений с БД, создавая его при первом обращении
+
+    Параметры:
+        db, user, password, host, port: Параметры подключения к БД
+        minconn: Минимальное количество открытых соединений
+        maxconn: Максимальное количество открытых соединений
+    Возвращает:
+        ThreadedConnectionPool
+    '''
+
+    dsn = f"dbname={db} user={user} password={password} host={host} port={port}"
+    # Таблицы могут выгружаться параллельно, пул создается один раз для всех потоков
+    with _pools_lock:
+        if dsn not in _pools or _pools[dsn].closed:
+            _pools[dsn] = pg_pool.ThreadedConnectionPool(minconn, maxconn, dsn, connection_factory=pooled_connection_class())
+        return _pools[dsn]
+
+def close_pools():
+    '''
+    Закрывает все соединения созданных пулов
+    '''
+
+    for pool in _pools.values():
+        if not pool.closed:
+            pool.closeall()
+    _pools.clear()
+
+@contextmanager
+def db_session(db = 'open_meteo_stats', user = 'admin', password = 'admin', host = 'localhost', port = '5433', pool = None):
+    '''
+    Выдает соединение из пула на время одной транзакции.
+    При успешном завершении блока транзакция фиксируется, при ошибке - откатывается
+
+    Параметры:
+        db, user, password, host, port: Параметры подключения к БД
+        pool: Пул соединений (по умолчанию - пул по параметрам подключения)
+    Возвращает:
+        Соединение с БД
+    '''
+
+    pool = pool or get_pool(db, user, password, host, port)
+    conn = pool.getconn()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn, close=bool(conn.closed))
+
+class TransactionGroup:
+    '''
+    Группа соединений пула с общей фиксацией транзакций: таблицы выгружаются параллельно, каждая по своему соединению,
+    а транзакции всех соединений фиксируются только после успешного завершения блока, при ошибке - откатываются.
+    Фиксация соединений выполняется последовательно (без двухфазной фиксации), поэтому сбой соединения
+    между фиксациями может сохранить часть таблиц
+
+    Атрибуты:
+        pool (ThreadedConnectionPool): Пул соединений
+        connections (dict): Соединения группы по ключу (например, наименованию таблицы)
+    '''
+
+    def __init__(self, db = 'open_meteo_stats', user = 'admin', password = 'admin', host = 'localhost', port = '5433', pool = None):
+        self.pool = pool or get_pool(db, user, password, host, port)
+        self.connections = {}
+        self.lock = threading.Lock()
+
+    def connection(self, key):
+        '''
+        Возвращает соединение группы по ключу, при первом обращении берет его из пула.
+        Соединение одного ключа не должно использоваться несколькими потоками одновременно
+
+        Параметры:
+            key: Ключ соединения
+        Возвращает:
+            Соединение с БД
+        '''
+
+        with self.lock:
+            if key not in self.connections:
+                self.connections[key] = self.pool.getconn()
+            return self.connections[key]
+
+    def commit(self):
+        '''
+        Фиксирует транзакции всех соединений группы
+        '''
+
+        for conn in self.connections.values():
+            conn.commit()
+
+    def rollback(self):
+        '''
+        Откатывает транзакции всех соединений группы
+        '''
+
+        for conn in self.connections.values():
+            if not conn.closed:
+                conn.rollback()
+
+    def close(self):
+        '''
+        Возвращает соединения группы в пул
+        '''
+
+        for conn in self.connections.values():
+            self.pool.putconn(conn, close=bool(conn.closed))
+        self.connections = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                try:
+                    self.commit()
+                except Exception:
+                    self.rollback()
+                    raise
+            else:
+                self.rollback()
+        finally:
+            self.close()
+
+def run_parallel(tasks, max_workers = None):
+    '''
+    Выполняет функции без параметров одновременно в пуле потоков (например, выгрузку таблиц hourly и daily)
+
+    Параметры:
+        tasks: Список функций
+        max_workers: Количество потоков (по умолчанию - по количеству функций, 1 - последовательное выполнение)
+    Возвращает:
+        Список результатов в порядке функций. Ошибка функции передается вызывающему коду после завершения остальных
+    '''
+
+    if max_workers == 1 or len(tasks) <= 1:
+        return [task() for task in tasks]
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(tasks)) as executor:
+        futures = [executor.submit(task) for task in tasks]
+    return [future.result() for future in futures]
+
+def ensure_tables(conn, schema, tables = ('hourly', 'daily'), template_schema = TEMPLATE_SCHEMA):
+    '''
+    Создает схему местоположения и таблицы по образцу таблиц схемы-шаблона, если они еще не существуют.
+    Изменения выполняются в транзакции переданного соединения
+
+    Параметры:
+        conn: Открытое соединение с БД
+        schema: Схема местоположения
+        tables: Наименования таблиц
+        template_schema: Схема, таблицы которой используются как образец (см. init.sql)
+    '''
+
+    if schema == template_schema:
+        return
+
+    with conn.cursor() as cursor:
+        cursor.execute(sql.SQL('CREATE SCHEMA IF NOT EXISTS {}').format(sql.Identifier(schema)))
+        for table_name in tables:
+            # Партиционированные таблицы шаблона (init_typed.sql) создаются с тем же ключом партиционирования
+            partition_key = get_partition_key(cursor, template_schema, table_name)
+            cursor.execute(sql.SQL('CREATE TABLE IF NOT EXISTS {}.{} (LIKE {}.{} INCLUDING ALL){}').format(
+                sql.Identifier(schema), sql.Identifier(table_name), sql.Identifier(template_schema), sql.Identifier(table_name),
+                sql.SQL(' PARTITION BY {}').format(sql.SQL(partition_key)) if partition_key else sql.SQL('')
+            ))
+
+def get_partition_key(cursor, schema, table_name):
+    '''
+    Возвращает описание ключа партиционирования таблицы (например, 'RANGE (time_unix)')
+
+    Параметры:
+        cursor: Курсор открытого соединения с БД
+        schema: Схема таблицы
+        table_name: Наименование таблицы
+    Возвращает:
+        Строку, либо None для таблицы без партиций
+    '''
+
+    cursor.execute(
+        "SELECT pg_get_partkeydef(c.oid) FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE n.nspname = %s AND c.relname = %s AND c.relkind = 'p'",
+        (schema, table_name)
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def get_column_types(cursor, schema, table_name):
+    '''
+    Возвращает типы столбцов таблицы
+
+    Параметры:
+        cursor: Курсор открытого соединения с БД
+        schema: Схема таблицы
+        table_name: Наименование таблицы
+    Возвращает:
+        Словарь {столбец: тип данных information_schema (например, 'integer', 'timestamp with time zone')}
+    '''
+
+    cursor.execute(
+        'SELECT column_name, data_type FROM information_schema.columns WHERE table_schema = %s AND table_name = %s',
+        (schema, table_name)
+    )
+    return dict(cursor.fetchall())
+
+def adapt_types(df: pd.DataFrame, column_types: dict):
+    '''
+    Приводит временные столбцы датафрейма к типам столбцов таблицы: unix время выгружается в столбцы timestamptz
+    метками времени, метки времени в целочисленные столбцы - unix временем. Остальные столбцы не меняются
+
+    Параметры:
+        df: Датафрейм для выгрузки
+        column_types: Типы столбцов таблицы (get_column_types)
+    Возвращает:
+        pd.DataFrame
+    '''
+
+    adapted = {}
+    for column in df.columns:
+        data_type, values = column_types.get(column), df[column]
+        if data_type == 'timestamp with time zone' and pd.api.types.is_numeric_dtype(values):
+            adapted[column] = pd.to_datetime(values, unit='s', utc=True)
+        elif data_type in ('integer', 'bigint') and isinstance(values.dtype, pd.DatetimeTZDtype):
+            adapted[column] = (values - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1)
+    return df.assign(**adapted) if adapted else df
+
+def ensure_partitions(cursor, df: pd.DataFrame, schema, table_name, table_key):
+    '''
+    Создает месячные партиции таблицы, партиционированной по времени ключа (init_typed.sql), для строк датафрейма.
+    Партиции именуются по месяцу UTC: hourly_2025_05
+
+    Параметры:
+        cursor: Курсор открытого соединения с БД
+        df: Датафрейм для выгрузки (ключ - метки времени UTC)
+        schema: Схема таблицы
+        table_name: Наименование таблицы
+        table_key: Ключ партиционирования
+    '''
+
+    if not get_partition_key(cursor, schema, table_name) or df.empty:
+        return
+
+    months = df[table_key].dt.tz_convert('UTC').dt.tz_localize(None).dt.to_period('M').unique()
+    for month in months:
+        start = month.start_time.tz_localize('UTC')
+        cursor.execute(sql.SQL('CREATE TABLE IF NOT EXISTS {}.{} PARTITION OF {}.{} FOR VALUES FROM (%s) TO (%s)').format(
+            sql.Identifier(schema), sql.Identifier(f'{table_name}_{month.strftime("%Y_%m")}'),
+            sql.Identifier(schema), sql.Identifier(table_name)
+        ), (start.to_pydatetime(), (start + pd.DateOffset(months=1)).to_pydatetime()))
+
+def get_watermark(conn, table_name, table_key, schema = 'nsk_plus_7gt'):
+    '''
+    Возвращает водяной знак таблицы - максимальное значение ключа среди загруженных строк
+
+    Параметры:
+        conn: Открытое соединение с БД
+        table_name: Наименование таблицы
+        table_key: Ключ таблицы (например, 'time_unix')
+        schema: Схема таблицы
+    Возвращает:
+        Максимальное значение ключа (unix время), либо None для пустой таблицы
+    '''
+
+    with conn.cursor() as cursor:
+        cursor.execute(sql.SQL('SELECT max({}) FROM {}.{}').format(
+            sql.Identifier(table_key), sql.Identifier(schema), sql.Identifier(table_name)
+        ))
+        watermark = cursor.fetchone()[0]
+
+    # Ключи типизированной схемы (timestamptz) приводятся к unix времени
+    if isinstance(watermark, datetime):
+        watermark = int(watermark.timestamp())
+    return watermark
+
+@lru_cache(maxsize=None)
+def upsert_query(schema, table_name, table_key, columns, conflict_resolve = 'NOTHING', source = None):
+    '''
+    Формирует запрос вставки строк в таблицу с обработкой конфликтов по ключу
+
+    Параметры:
+        schema: Схема таблицы
+        table_name: Наименование таблицы
+        table_key: Ключ таблицы, по которому определяются дубликаты
+        columns: Кортеж столбцов вставки
+        conflict_resolve: Вариант решения проблемы дубликатов ('NOTHING' - игнорирование, 'UPDATE' - обновление)
+        source: Наименование промежуточной таблицы-источника строк. Если не указана, запрос формируется
+                в виде 'VALUES %s' для execute_values
+    Возвращает:
+        sql.Composed
+    '''
+
+    target = sql.SQL('{schm}.{tbl}').format(schm=sql.Identifier(schema), tbl=sql.Identifier(table_name))
+    column_list = sql.SQL(', ').join(map(sql.Identifier, columns))
+
+    if source is None:
+        insert_query = sql.SQL('INSERT INTO {} ({}) VALUES %s').format(target, column_list)
+    else:
+        insert_query = sql.SQL('INSERT INTO {} ({}) SELECT {} FROM {}').format(
+            target, column_list, column_list, sql.Identifier(source)
+        )
+
+    if conflict_resolve != 'NOTHING':
+        update_columns = [col for col in columns if col != table_key]
+        update_clause = sql.SQL(', ').join(
+            sql.SQL('{} = EXCLUDED.{}').format(sql.Identifier(col), sql.Identifier(col))
+            for col in update_columns
+        )
+        conflict_query = sql.SQL(' ON CONFLICT ({}) DO UPDATE SET {}').format(
+            sql.Identifier(table_key), update_clause
+        )
+    else:
+        conflict_query = sql.SQL(' ON CONFLICT ({}) DO NOTHING').format(
+            sql.Identifier(table_key)
+        )
+
+    return insert_query + conflict_query
+
+def execute_prepared(cursor, query, key):
+    '''
+    Выполняет запрос, подготовленный на сервере один раз для соединения пула.
+    Для соединений без кэша подготовленных запросов запрос выполняется напрямую
+
+    Параметры:
+        cursor: Курсор открытого соединения с БД
+        query: Запрос без параметров
+        key: Ключ кэша подготовленных запросов
+    '''
+
+    prepared = getattr(cursor.connection, 'prepared', None)
+    if prepared is None:
+        cursor.execute(query)
+        return
+
+    name = prepared.get(key)
+    if name is None:
+        name = f'upsert_{len(prepared)}'
+        cursor.execute(sql.SQL('PREPARE {} AS ').format(sql.Identifier(name)) + query)
+        prepared[key] = name
+    cursor.execute(sql.SQL('EXECUTE {}').format(sql.Identifier(name)))
+
+def copy_to_staging(cursor, df: pd.DataFrame, schema, table_name, page_size = 50000):
+    '''
+    Потоково копирует датафрейм во временную промежуточную таблицу через COPY FROM STDIN.
+    Промежуточная таблица создается по структуре целевой и очищается при завершении транзакции
+
+    Параметры:
+        cursor: Курсор открытого соединения с БД
+        df: Датафрейм для копирования
+        schema: Схема целевой таблицы
+        table_name: Наименование целевой таблицы
+        page_size: Количество строк, передаваемых одной командой COPY
+    Возвращает:
+        Наименование промежуточной таблицы
+    '''
+
+    staging = staging_name(schema, table_name)
+    cursor.execute(sql.SQL('CREATE TEMP TABLE IF NOT EXISTS {} (LIKE {}.{} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS').format(
+        sql.Identifier(staging), sql.Identifier(schema), sql.Identifier(table_name)
+    ))
+    cursor.execute(sql.SQL('TRUNCATE {}').format(sql.Identifier(staging)))
+
+    copy_query = sql.SQL('COPY {} ({}) FROM STDIN WITH (FORMAT csv)').format(
+        sql.Identifier(staging), sql.SQL(', ').join(map(sql.Identifier, df.columns.tolist()))
+    ).as_string(cursor)
+
+    for buffer in csv_pages(df, page_size):
+        cursor.copy_expert(copy_query, buffer)
+
+    return staging
+
+def staging_name(schema, table_name):
+    '''
+    Формирует наименование временной промежуточной таблицы для целевой таблицы.
+    Временные таблицы принадлежат сессии, но одно соединение пула выгружает таблицы разных схем (с разной структурой),
+    поэтому наименование различается по схеме и таблице. Хэш вместо полного наименования укладывается
+    в ограничение PostgreSQL на длину идентификатора (63 байта), при котором длинные наименования усекаются и совпадают
+
+    Параметры:
+        schema: Схема целевой таблицы
+        table_name: Наименование целевой таблицы
+    Возвращает:
+        Строку
+    '''
+
+    return 'staging_' + hashlib.sha256(f'{schema}.{table_name}'.encode('utf-8')).hexdigest()[:24]
+
+def csv_pages(df: pd.DataFrame, page_size = 50000):
+    '''
+    Формирует страницы датафрейма в формате CSV (без заголовка и индекса) для команды COPY.
+
+    Параметры:
+        df: Датафрейм
+        page_size: Количество строк на странице
+    Возвращает:
+        Генератор буферов io.StringIO
+    '''
+
+    for start in range(0, len(df), page_size):
+        buffer = io.StringIO()
+        df.iloc[start:start+page_size].to_csv(buffer, index=False, header=False)
+        buffer.seek(0)
+        yield buffer
+
+def insert_bisect(cursor, query, rows, page_size = 10000):
+    '''
+    Вставляет строки пакетами через execute_values. Пакет, вставка которого завершилась ошибкой,
+    откатывается до точки сохранения и делится пополам до тех пор, пока не будут найдены ошибочные строки
+
+    Параметры:
+        cursor: Курсор открытого соединения с БД
+        query: Запрос вставки вида 'INSERT ... VALUES %s'
+        rows: Список кортежей значений строк
+        page_size: Размер начального пакета
+    Возвращает:
+        Список пар (строка, ошибка) для строк, которые не удалось вставить
+    '''
+
+    failed = []
+    stack = [rows[start:start+page_size] for start in range(0, len(rows), page_size)][::-1]
+
+    while stack:
+        batch = stack.pop()
+        cursor.execute('SAVEPOINT load_batch')
+        try:
+            execute_values(cursor, query, batch, page_size=len(batch))
+            cursor.execute('RELEASE SAVEPOINT load_batch')
+        except psycopg2.Error as e:
+            cursor.execute('ROLLBACK TO SAVEPOINT load_batch')
+            if len(batch) == 1:
+                failed.append((batch[0], e))
+            else:
+                middle = len(batch)//2
+                stack.extend([batch[middle:], batch[:middle]])
+
+    return failed
+
+@METRICS.timed('load_db')
 def load_to_db(df: pd.DataFrame, table_name, table_key, db = 'open_meteo_stats', user = 'admin', password = 'admin'
-               , host = 'localhost', port = '5433', schema = 'nsk_plus_7gt', conflict_resolve = 'NOTHING'):
+               , host = 'localhost', port = '5433', schema = 'nsk_plus_7gt', conflict_resolve = 'NOTHING', method = 'copy', page_size = 10000
+               , conn = None, pool = None):
     '''
-    
+    Выгружает датафрейм в таблицу БД с обработкой дубликатов по ключу
+
+    Параметры:
+        df: Датафрейм для выгрузки (наименования столбцов совпадают со столбцами таблицы). Unix время
+            выгружается в столбцы timestamptz метками времени, для партиционированных таблиц создаются месячные партиции
+        table_name: Наименование таблицы
+        table_key: Ключ таблицы, по которому определяются дубликаты
+        db, user, password, host, port: Параметры подключения к БД
+        schema: Схема таблицы
+        conflict_resolve: Вариант решения проблемы выгрузки дубликатов в БД ('NOTHING' - игнорирование дублирующих записей
+                                                                             'UPDATE' - обновление дублирующих записей)
+        method: Способ выгрузки ('copy' - COPY во временную таблицу и слияние одним запросом,
+                                 'values' - пакетная вставка через execute_values)
+                При ошибке пакета строки вставляются повторно с делением пакета пополам
+        page_size: Размер пакета строк
+        conn: Открытое соединение (например, из db_session). Выгрузка выполняется в транзакции вызывающего кода
+              и при ошибке откатывается только до точки сохранения
+        pool: Пул, из которого берется соединение, если conn не передан (по умолчанию - пул по параметрам подключения)
+    Возвращает:
+        True при успешной выгрузке всех строк, иначе False (строки без ошибок при этом сохраняются)
     '''
-    conn = None
+    own_conn = conn is None
     cursor = None
     try:
-        conn = psycopg2.connect(f"dbname={db} user={user} password={password} host={host} port={port}")
+        if own_conn:
+            pool = pool or get_pool(db, user, password, host, port)
+            conn = pool.getconn()
+            print('Подключение к БД прошло успешно')
         cursor = conn.cursor()
-        print('Подключение к БД прошло успешно')
+        if not own_conn:
+            cursor.execute('SAVEPOINT load_to_db')
 
-        insert_query = sql.SQL('INSERT INTO {} ({}) VALUES ({})').format(
-            sql.SQL('{schm}.{tbl}').format(schm=sql.Identifier(schema), tbl=sql.Identifier(table_name))
-            ,sql.SQL(', ').join(map(sql.Identifier, df.columns.tolist()))
-            ,sql.SQL(', ').join(sql.Placeholder()*len(df.columns.tolist()))
-        )
-        
-        if conflict_resolve != 'NOTHING':
-            update_columns = [col for col in df.columns.tolist() if col != table_key]
-            update_clause = sql.SQL(', ').join(
-                sql.SQL('{} = EXCLUDED.{}').format(sql.Identifier(col), sql.Identifier(col))
-                for col in update_columns
-            )
-            conflict_query = sql.SQL(' ON CONFLICT ({}) DO UPDATE SET {}').format(
-                sql.Identifier(table_key), update_clause
-            )
-        else:
-            conflict_query = sql.SQL(' ON CONFLICT ({}) DO NOTHING').format(
-                sql.Identifier(table_key)
-            )
+        # Временные столбцы приводятся к типам таблицы (integer либо timestamptz типизированной схемы)
+        df = adapt_types(df, get_column_types(cursor, schema, table_name))
+        ensure_partitions(cursor, df, schema, table_name, table_key)
 
-        query = insert_query + conflict_query
+        columns = tuple(df.columns.tolist())
+        rows_total = len(df)
+        failed = []
 
-        for row in df.itertuples():
+        if method == 'copy':
+            cursor.execute('SAVEPOINT bulk_load')
             try:
-                cursor.execute(query, row[1:len(df.columns.tolist())+1])
-                print(f'{row[0]} Строка успешно загружена в БД')
-            except Exception as e:
-                print(f'Ошибка: Вставка строки {row.get(table_key, 'unknown')} прошла некорректно, {e}')
-                conn.rollback()
-                continue
+                staging = copy_to_staging(cursor, df, schema, table_name, page_size=max(page_size, 50000))
+                execute_prepared(
+                    cursor,
+                    upsert_query(schema, table_name, table_key, columns, conflict_resolve, source=staging),
+                    (schema, table_name, columns, conflict_resolve)
+                )
+                cursor.execute('RELEASE SAVEPOINT bulk_load')
+            except psycopg2.Error as e:
+                print(f'Ошибка: Пакетная выгрузка через COPY прошла некорректно, переход к поиску ошибочных строк, {e}')
+                cursor.execute('ROLLBACK TO SAVEPOINT bulk_load')
+                method = 'values'
 
-        conn.commit()
-        print(f'Выгрузка таблицы в БД завершена!')
-        return True
+        if method == 'values':
+            rows = list(df.astype(object).where(df.notna(), None).itertuples(index=False, name=None))
+            query = upsert_query(schema, table_name, table_key, columns, conflict_resolve)
+            failed = insert_bisect(cursor, query, rows, page_size=page_size)
+
+            if failed:
+                key_position = columns.index(table_key) if table_key in columns else None
+                keys = [row[key_position] if key_position is not None else 'unknown' for row, _ in failed]
+                print(f'Ошибка: Вставка {len(failed)} строк прошла некорректно (ключи {keys[:10]}{"..." if len(keys) > 10 else ""}), {failed[0][1]}')
+
+        if own_conn:
+            conn.commit()
+        else:
+            cursor.execute('RELEASE SAVEPOINT load_to_db')
+        print(f'Выгрузка таблицы {schema}.{table_name} в БД завершена: {rows_total-len(failed)} из {rows_total} строк')
+        METRICS.count('rows_out', rows_total-len(failed), stage='load_db', table=f'{schema}.{table_name}')
+        METRICS.count('rows_failed', len(failed), stage='load_db', table=f'{schema}.{table_name}')
+        return not failed
         
     except Exception as e:
         print(f'Ошибка: Действия с БД были прерваны по причине: \n {e}')
-        if conn:
-            conn.rollback()
+        if conn and not conn.closed:
+            if own_conn:
+                conn.rollback()
+            elif cursor:
+                try:
+                    cursor.execute('ROLLBACK TO SAVEPOINT load_to_db')
+                except psycopg2.Error:
+                    conn.rollback()
         return False
     finally:
         if cursor:
             cursor.close()
-        if conn:
-            conn.close()
-        print('Соединение с БД разорвано')
\ No newline at end of file
+        if own_conn and conn:
+            pool.putconn(conn, close=bool(conn.closed))
+            print('Соединение с БД возвращено в пул')
\ No newline at end of file
@@ -0,0 +1,183 @@
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Модуль resource недоступен в Windows, пиковая память процесса в этом случае не собирается
+    resource = None
+
+# Префикс имен метрик в формате Prometheus
+PROMETHEUS_PREFIX = 'open_meteo_etl'
+
+
+class Metrics:
+    '''
+    Сбор метрик ETL процесса: время и количество вызовов стадий, счетчики (строки, байты) и пиковая память процесса.
+    Метрики накапливаются потокобезопасно и выгружаются в формате JSON (одна строка на запуск) либо
+    в текстовом формате Prometheus
+
+    Атрибуты:
+        timers (dict): Суммарное время стадий в секундах по имени стадии
+        calls (dict): Количество вызовов стадий по имени стадии
+        counters (dict): Значения счетчиков по ключу (имя счетчика, метки)
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        '''
+        Обнуляет накопленные метрики
+        '''
+
+        with self.lock:
+            self.timers = {}
+            self.calls = {}
+            self.counters = {}
+            self.started = time.time()
+
+    @contextmanager
+    def timer(self, stage: str):
+        '''
+        Замеряет время выполнения блока и добавляет его к времени стадии.
+
+        Параметры:
+            stage (str): Имя стадии
+        '''
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.timers[stage] = self.timers.get(stage, 0.0) + elapsed
+                self.calls[stage] = self.calls.get(stage, 0) + 1
+
+    def timed(self, stage: str = None):
+        '''
+        Декоратор, замеряющий время вызовов функции или метода.
+        Для методов с атрибутом hourly учитываются почасовые строки на входе, для результатов-датафреймов - строки на выходе
+
+        Параметры:
+            stage (str): Имя стадии (по умолчанию - полное имя функции)
+        '''
+
+        def decorator(func):
+            name = stage or func.__qualname__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                hourly = getattr(args[0], 'hourly', None) if args else None
+                with self.timer(name):
+                    result = func(*args, **kwargs)
+                # Датафреймы возможны только после импорта pandas стадией, сбор метрик сам pandas не импортирует
+                pd = sys.modules.get('pandas')
+                if pd is not None and isinstance(hourly, pd.DataFrame):
+                    self.count('rows_in', len(hourly), stage=name)
+                if pd is not None and isinstance(result, pd.DataFrame):
+                    self.count('rows_out', len(result), stage=name)
+                return result
+            return wrapper
+        return decorator
+
+    def count(self, name: str, value: float = 1, **labels):
+        '''
+        Увеличивает счетчик.
+
+        Параметры:
+            name (str): Имя счетчика (например, 'rows_out', 'bytes')
+            value (float): Приращение
+            labels: Метки счетчика (например, stage='load_db', table='hourly')
+        '''
+
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def snapshot(self):
+        '''
+        Формирует сводку накопленных метрик.
+        Для стадий со счетчиком rows_out вычисляется пропускная способность в строках в секунду
+
+        Возвращает:
+            Словарь
+        '''
+
+        with self.lock:
+            stages = {stage: {'seconds': round(seconds, 6), 'calls': self.calls[stage]} for stage, seconds in self.timers.items()}
+            counters = [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in self.counters.items()]
+
+        for counter in counters:
+            stage = stages.get(counter['labels'].get('stage'))
+            if counter['name'] == 'rows_out' and stage and stage['seconds'] > 0:
+                stage['rows_per_second'] = stage.get('rows_per_second', 0) + round(counter['value']/stage['seconds'], 1)
+
+        return {'started': self.started, 'stages': stages, 'counters': counters, 'peak_rss_bytes': peak_rss()}
+
+    def to_prometheus(self):
+        '''
+        Формирует метрики в текстовом формате Prometheus.
+
+        Возвращает:
+            Строку
+        '''
+
+        snapshot = self.snapshot()
+        lines = [f'# TYPE {PROMETHEUS_PREFIX}_stage_seconds_total counter']
+        lines += [f'{PROMETHEUS_PREFIX}_stage_seconds_total{{stage="{stage}"}} {values["seconds"]}' for stage, values in snapshot['stages'].items()]
+        lines.append(f'# TYPE {PROMETHEUS_PREFIX}_stage_calls_total counter')
+        lines += [f'{PROMETHEUS_PREFIX}_stage_calls_total{{stage="{stage}"}} {values["calls"]}' for stage, values in snapshot['stages'].items()]
+
+        for name in dict.fromkeys(counter['name'] for counter in snapshot['counters']):
+            lines.append(f'# TYPE {PROMETHEUS_PREFIX}_{name}_total counter')
+            for counter in snapshot['counters']:
+                if counter['name'] == name:
+                    labels = ','.join(f'{key}="{value}"' for key, value in counter['labels'].items())
+                    lines.append(f'{PROMETHEUS_PREFIX}_{name}_total{{{labels}}} {counter["value"]}')
+
+        if snapshot['peak_rss_bytes'] is not None:
+            lines.append(f'# TYPE {PROMETHEUS_PREFIX}_peak_rss_bytes gauge')
+            lines.append(f'{PROMETHEUS_PREFIX}_peak_rss_bytes {snapshot["peak_rss_bytes"]}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str):
+        '''
+        Выгружает метрики в файл: в формате Prometheus для файлов .prom (файл перезаписывается),
+        иначе добавляет строку JSON (журнал запусков)
+
+        Параметры:
+            path (str): Путь файла
+        '''
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        if path.endswith('.prom'):
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(self.to_prometheus())
+        else:
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(self.snapshot(), ensure_ascii=False) + '\n')
+
+def peak_rss():
+    '''
+    Возвращает пиковый объем резидентной памяти процесса в байтах (None, если недоступен)
+    '''
+
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # В Linux значение в килобайтах, в macOS - в байтах
+    return rss if sys.platform == 'darwin' else rss*1024
+
+# Метрики текущего процесса, общие для модулей etl
+METRICS = Metrics()
@@ -0,0 +1,112 @@
+import queue
+import threading
+from typing import Callable, Iterable, List
+
+# Признак завершения потока данных между стадиями
+_DONE = object()
+
+
+class Pipeline:
+    '''
+    Конвейер стадий обработки, соединенных ограниченными очередями
+    Каждая стадия выполняется в отдельном потоке и получает результаты предыдущей стадии по одному,
+    поэтому, например, извлечение части N+1 выполняется одновременно с трансформацией части N и выгрузкой части N-1.
+    Заполненная очередь приостанавливает предыдущую стадию (не более maxsize необработанных частей между стадиями).
+    При ошибке в любой стадии остальные стадии прекращают обработку, а ошибка передается вызывающему коду
+
+    Атрибуты:
+        stages (List[Callable]): Функции стадий, результат стадии передается следующей
+        maxsize (int): Размер очередей между стадиями
+        threaded (bool): Признак параллельного выполнения стадий (иначе части обрабатываются последовательно)
+    '''
+
+    def __init__(self, stages: List[Callable], maxsize: int = 1, threaded: bool = True):
+        self.stages = stages
+        self.maxsize = maxsize
+        self.threaded = threaded
+        self.errors = []
+        self.stopped = threading.Event()
+
+    def run(self, items: Iterable):
+        '''
+        Пропускает элементы через стадии конвейера.
+
+        Параметры:
+            items (Iterable): Входные элементы первой стадии
+        Возвращает:
+            Список результатов последней стадии в порядке входных элементов
+        '''
+
+        if not self.threaded:
+            results = []
+            for item in items:
+                for stage in self.stages:
+                    item = stage(item)
+                results.append(item)
+            return results
+
+        self.errors, results = [], []
+        self.stopped.clear()
+        queues = [queue.Queue(maxsize=self.maxsize) for _ in self.stages]
+        threads = [threading.Thread(target=self.feed, args=(items, queues[0]), name='pipeline-feed', daemon=True)]
+        for i, stage in enumerate(self.stages):
+            output = queues[i+1] if i+1 < len(queues) else None
+            threads.append(threading.Thread(target=self.work, args=(stage, queues[i], output, results),
+                                            name=f'pipeline-{getattr(stage, "__name__", i)}', daemon=True))
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self.errors:
+            raise self.errors[0]
+        return results
+
+    def feed(self, items: Iterable, output: queue.Queue):
+        '''
+        Передает входные элементы первой стадии
+        '''
+
+        try:
+            for item in items:
+                if self.stopped.is_set():
+                    break
+                output.put(item)
+        except Exception as e:
+            self.fail(e)
+        finally:
+            output.put(_DONE)
+
+    def work(self, stage: Callable, source: queue.Queue, output: queue.Queue, results: list):
+        '''
+        Выполняет стадию для элементов входной очереди до признака завершения.
+        После ошибки элементы входной очереди пропускаются, чтобы не блокировать предыдущие стадии
+        '''
+
+        while True:
+            item = source.get()
+            if item is _DONE:
+                break
+            if self.stopped.is_set():
+                continue
+            try:
+                item = stage(item)
+            except Exception as e:
+                self.fail(e)
+                continue
+            if output is None:
+                results.append(item)
+            else:
+                output.put(item)
+
+        if output is not None:
+            output.put(_DONE)
+
+    def fail(self, error: Exception):
+        '''
+        Сохраняет ошибку стадии и останавливает обработку
+        '''
+
+        self.errors.append(error)
+        self.stopped.set()
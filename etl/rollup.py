@@ -0,0 +1,204 @@
+import pandas as pd
+from psycopg2 import sql
+
+from etl import load, transform
+from etl.metrics import METRICS
+
+# Таблицы-источники свертки в схеме местоположения: почасовые переменные суточных агрегатов
+# и время восхода/заката (unix время со сдвигом временной зоны, как в OpenMeteo)
+SOURCE_TABLE = 'hourly_source'
+SUN_TABLE = 'daily_sun'
+
+
+def rollup_inputs(om_obj: transform.OpenMeteo, spec: dict = transform.OUTPUT_SPEC):
+    '''
+    Формирует данные для вычисления суточных агрегатов в БД вместо OpenMeteo.aggregate.
+
+    Параметры:
+        om_obj: Экземпляр класса OpenMeteo
+        spec: Описание итоговых таблиц (OUTPUT_SPEC)
+    Возвращает:
+        Кортеж (table2 - почасовые конвертированные метрики, почасовые переменные агрегатов (таблица SOURCE_TABLE),
+                время восхода и заката по суткам (таблица SUN_TABLE))
+    '''
+
+    names = transform.convert_output_units(om_obj, spec)
+    table2 = transform.hourly_output(om_obj, [names.get(unit, unit) for unit in spec['hourly']])
+    source = transform.hourly_output(om_obj, list(dict.fromkeys(names.get(unit, unit) for unit in spec['avg']+spec['total'])))
+    sun = om_obj.daily[om_obj.keys+['sunrise', 'sunset']].rename(columns={'date': 'date_unix'})
+    return table2, source, sun
+
+def aggregate_units(columns, spec: dict = transform.OUTPUT_SPEC):
+    '''
+    Сопоставляет переменные средних и сумм описания spec столбцам таблицы-источника (с окончанием единицы измерения).
+
+    Параметры:
+        columns: Столбцы таблицы-источника
+        spec: Описание итоговых таблиц (OUTPUT_SPEC)
+    Возвращает:
+        Кортеж (столбцы средних значений, столбцы общих значений)
+    '''
+
+    suffixes = [''] + [conversion['suffix'] for conversion in transform.UNIT_CONVERSIONS.values()]
+
+    def column(unit):
+        matches = [unit+suffix for suffix in suffixes if unit+suffix in columns]
+        if not matches:
+            raise ValueError(f'Столбца переменной {unit} нет в таблице {SOURCE_TABLE}')
+        return matches[0]
+
+    return [column(unit) for unit in spec['avg']], [column(unit) for unit in spec['total']]
+
+def ensure_rollup_tables(conn, schema, columns):
+    '''
+    Создает таблицы-источники свертки, если они еще не существуют, добавляет недостающие столбцы переменных
+    и создает агрегат суммы с компенсацией kahan_sum.
+    Изменения выполняются в транзакции переданного соединения
+
+    Параметры:
+        conn: Открытое соединение с БД
+        schema: Схема местоположения
+        columns: Столбцы почасовых переменных агрегатов
+    '''
+
+    with conn.cursor() as cursor:
+        cursor.execute(sql.SQL('CREATE SCHEMA IF NOT EXISTS {}').format(sql.Identifier(schema)))
+        cursor.execute(sql.SQL('CREATE TABLE IF NOT EXISTS {}.{} (time_unix integer NOT NULL PRIMARY KEY)').format(
+            sql.Identifier(schema), sql.Identifier(SOURCE_TABLE)
+        ))
+        for column in columns:
+            cursor.execute(sql.SQL('ALTER TABLE {}.{} ADD COLUMN IF NOT EXISTS {} double precision').format(
+                sql.Identifier(schema), sql.Identifier(SOURCE_TABLE), sql.Identifier(column)
+            ))
+        cursor.execute(sql.SQL('CREATE TABLE IF NOT EXISTS {}.{} (date_unix integer NOT NULL PRIMARY KEY, sunrise integer, sunset integer)').format(
+            sql.Identifier(schema), sql.Identifier(SUN_TABLE)
+        ))
+
+        # Сумма с компенсацией ошибки округления (алгоритм Кахана, как в группировке pandas), состояние - (сумма, компенсация).
+        # Шаг на plpgsql: функции на языке sql в агрегатах не встраиваются и выполняются в несколько раз медленнее
+        cursor.execute(sql.SQL(
+            'CREATE OR REPLACE FUNCTION {0}.kahan_step(state float8[], value float8) RETURNS float8[] LANGUAGE plpgsql IMMUTABLE STRICT AS '
+            '$$ DECLARE y float8 := value - state[2]; t float8 := state[1] + y; BEGIN RETURN ARRAY[t, (t - state[1]) - y]; END $$'
+        ).format(sql.Identifier(schema)))
+        cursor.execute(sql.SQL(
+            'CREATE OR REPLACE FUNCTION {0}.kahan_result(state float8[]) RETURNS float8 LANGUAGE sql IMMUTABLE STRICT AS $$ SELECT state[1] $$'
+        ).format(sql.Identifier(schema)))
+        cursor.execute(sql.SQL(
+            "CREATE OR REPLACE AGGREGATE {0}.kahan_sum(float8) (SFUNC = {0}.kahan_step, STYPE = float8[], FINALFUNC = {0}.kahan_result, INITCOND = '{{0,0}}')"
+        ).format(sql.Identifier(schema)))
+
+def rollup_query(schema, avg_units, total_units, column_types, all_dates = False):
+    '''
+    Формирует запрос вычисления суточных агрегатов по таблицам-источникам со вставкой (обновлением) строк таблицы daily.
+    Агрегаты совпадают с OpenMeteo.aggregate: суммы считаются с компенсацией ошибки округления (агрегат kahan_sum)
+    в порядке часов, средние и суммы округляются до 3 знаков тем же способом, что и np.round; агрегаты за 24 часа - только для суток из 24 часов,
+    за световой день - для часов между восходом и закатом
+
+    Параметры:
+        schema: Схема местоположения
+        avg_units: Столбцы средних значений
+        total_units: Столбцы общих значений
+        column_types: Типы столбцов таблицы daily (load.get_column_types). Для столбцов timestamptz
+                      время приводится к меткам времени
+        all_dates: Пересчет всех суток таблицы SUN_TABLE (иначе - суток из параметра запроса dates)
+    Возвращает:
+        sql.Composed с параметром dates. Запрос возвращает вычисленные строки daily в формате build_tables
+    '''
+
+    daylight = sql.SQL('h.time_unix BETWEEN d.sunrise AND d.sunset')
+
+    def aggregate(unit, agg, period):
+        value = sql.SQL('h.{}').format(sql.Identifier(unit))
+        condition = sql.SQL(' FILTER (WHERE {})').format(daylight) if period == '_daylight' else sql.SQL('')
+        total = sql.SQL('{}.kahan_sum({} ORDER BY h.time_unix){}').format(sql.Identifier(schema), value, condition)
+        if agg == 'avg_':
+            expression = sql.SQL('round({} / nullif(count({}){}, 0) * 1000) / 1000').format(total, value, condition)
+        else:
+            expression = sql.SQL('round(coalesce({}, 0) * 1000) / 1000').format(total)
+        hours = sql.SQL('count(h.time_unix) = 24') if period == '_24h' else sql.SQL('count(h.time_unix) FILTER (WHERE {}) > 0').format(daylight)
+        return sql.SQL('CASE WHEN {} THEN {} END AS {}').format(
+            hours, expression,
+            sql.Identifier(transform.transform_unit(unit, ['_celsius','_m_per_s','_m'] if agg == 'avg_' else ['_mm'], agg, period))
+        )
+
+    iso = "to_char(to_timestamp(d.{0}) AT TIME ZONE 'UTC', 'YYYY-MM-DD\"T\"HH24:MI:SS\"Z\"') AS {1}"
+    select_list = (
+        [aggregate(unit, 'avg_', '_24h') for unit in avg_units] + [aggregate(unit, 'total_', '_24h') for unit in total_units]
+        + [aggregate(unit, 'avg_', '_daylight') for unit in avg_units] + [aggregate(unit, 'total_', '_daylight') for unit in total_units]
+        + [sql.SQL('round((d.sunset - d.sunrise)::float8 / 3600 * 10) / 10 AS daylight_hours')]
+        + [sql.SQL(iso).format(sql.Identifier(unit), sql.Identifier(unit+'_iso')) for unit in ('sunrise', 'sunset')]
+    )
+    rolled = sql.SQL(
+        'SELECT d.date_unix, {} FROM {}.{} d LEFT JOIN {}.{} h ON h.time_unix >= d.date_unix AND h.time_unix < d.date_unix + 86400 '
+        '{} GROUP BY d.date_unix, d.sunrise, d.sunset'
+    ).format(
+        sql.SQL(', ').join(select_list), sql.Identifier(schema), sql.Identifier(SUN_TABLE), sql.Identifier(schema), sql.Identifier(SOURCE_TABLE),
+        sql.SQL('') if all_dates else sql.SQL('WHERE d.date_unix = ANY(%(dates)s)')
+    )
+
+    columns = ['date_unix'] + [
+        transform.transform_unit(unit, suffixes, agg, period)
+        for period in ('_24h', '_daylight')
+        for units, agg, suffixes in ((avg_units, 'avg_', ['_celsius','_m_per_s','_m']), (total_units, 'total_', ['_mm']))
+        for unit in units
+    ] + ['daylight_hours', 'sunrise_iso', 'sunset_iso']
+
+    # Ключ и время восхода/заката приводятся к меткам времени для таблиц daily типизированной схемы
+    def typed_column(column):
+        if column_types.get(column) != 'timestamp with time zone':
+            return sql.Identifier(column)
+        cast = 'to_timestamp({0}) AS {0}' if column == 'date_unix' else '{0}::timestamptz AS {0}'
+        return sql.SQL(cast).format(sql.Identifier(column))
+
+    typed = sql.SQL('SELECT {} FROM rolled').format(sql.SQL(', ').join(typed_column(column) for column in columns))
+    upsert = load.upsert_query(schema, 'daily', 'date_unix', tuple(columns), 'UPDATE', source='typed')
+    return sql.SQL('WITH rolled AS ({}), typed AS ({}), upserted AS ({}) SELECT * FROM rolled ORDER BY date_unix').format(rolled, typed, upsert)
+
+@METRICS.timed('rollup')
+def rollup_daily(conn, schema, dates, avg_units, total_units):
+    '''
+    Вычисляет суточные агрегаты суток dates в БД и выгружает их в таблицу daily (дубликаты обновляются).
+    Изменения выполняются в транзакции переданного соединения
+
+    Параметры:
+        conn: Открытое соединение с БД
+        schema: Схема местоположения
+        dates: Сутки (date_unix) для пересчета, None - все сутки таблицы SUN_TABLE
+        avg_units: Столбцы средних значений
+        total_units: Столбцы общих значений
+    Возвращает:
+        pd.DataFrame вычисленных строк daily в формате build_tables
+    '''
+
+    with conn.cursor() as cursor:
+        query = rollup_query(schema, avg_units, total_units, load.get_column_types(cursor, schema, 'daily'), all_dates=dates is None)
+        cursor.execute(query, {'dates': None if dates is None else [int(date) for date in dates]})
+        daily = pd.DataFrame.from_records(cursor.fetchall(), columns=[column.name for column in cursor.description], coerce_float=True)
+
+    print(f'Свертка суточных агрегатов {schema}.daily в БД завершена: {len(daily)} суток')
+    METRICS.count('rows_out', len(daily), stage='rollup', table=f'{schema}.daily')
+    return daily
+
+def load_rollup(conn, schema, source: pd.DataFrame, sun: pd.DataFrame, dates = None, spec: dict = transform.OUTPUT_SPEC):
+    '''
+    Выгружает данные свертки (rollup_inputs) в таблицы-источники и пересчитывает суточные агрегаты затронутых суток в БД.
+    Изменения выполняются в транзакции переданного соединения
+
+    Параметры:
+        conn: Открытое соединение с БД
+        schema: Схема местоположения
+        source: Почасовые переменные агрегатов
+        sun: Время восхода и заката по суткам
+        dates: Сутки (date_unix) для пересчета, по умолчанию - сутки sun
+        spec: Описание итоговых таблиц (OUTPUT_SPEC)
+    Возвращает:
+        pd.DataFrame вычисленных строк daily
+    '''
+
+    ensure_rollup_tables(conn, schema, source.columns.drop('time_unix'))
+    for df, table_name, table_key in ((source, SOURCE_TABLE, 'time_unix'), (sun, SUN_TABLE, 'date_unix')):
+        if not load.load_to_db(df, table_name, table_key, schema = schema, conflict_resolve = 'UPDATE', conn = conn):
+            raise RuntimeError(f'Выгрузка таблицы {schema}.{table_name} в БД прервана')
+
+    avg_units, total_units = aggregate_units(source.columns, spec)
+    return rollup_daily(conn, schema, sun['date_unix'] if dates is None else dates, avg_units, total_units)
@@ -0,0 +1,181 @@
+import json
+import threading
+import time
+from typing import Callable, List
+
+
+class Job:
+    '''
+    Периодическое задание планировщика - инкрементальное обновление данных одного местоположения
+
+    Атрибуты:
+        location (tuple): Местоположение (широта, долгота, схема БД)
+        interval (float): Интервал запуска в секундах
+        next_run (float): Время следующего запуска (time.monotonic)
+        runs (int): Количество выполненных запусков
+        coalesced (int): Количество пропущенных запусков, объединенных со следующим (задание выполнялось дольше интервала)
+        status (str): Состояние последнего запуска ('pending', 'running', 'ok', 'error')
+        last_started (float): Время начала последнего запуска (unix время)
+        last_latency (float): Длительность последнего запуска в секундах
+        last_error (str): Ошибка последнего запуска
+    '''
+
+    def __init__(self, location: tuple, interval: float):
+        self.location = location
+        self.interval = interval
+        self.next_run = 0.0
+        self.runs = 0
+        self.coalesced = 0
+        self.status = 'pending'
+        self.last_started = None
+        self.last_latency = None
+        self.last_error = None
+
+    @property
+    def name(self):
+        return self.location[2]
+
+    def snapshot(self):
+        '''
+        Формирует сводку состояния задания.
+
+        Возвращает:
+            Словарь
+        '''
+
+        return {
+            'location': list(self.location), 'interval_seconds': self.interval, 'status': self.status, 'runs': self.runs,
+            'coalesced': self.coalesced, 'last_started': self.last_started, 'last_latency_seconds': self.last_latency,
+            'last_error': self.last_error, 'next_run_in_seconds': round(max(self.next_run - time.monotonic(), 0), 3),
+        }
+
+class Scheduler:
+    '''
+    Планировщик периодических запусков ETL процесса в одном долгоживущем процессе
+    Модули, HTTP сессия и пул соединений с БД создаются один раз и переиспользуются всеми запусками.
+    Задания выполняются последовательно в потоке планировщика (метрики ETL процесса общие для процесса).
+    Запуски, наступившие во время выполнения задания, объединяются в один: задание не накапливает очередь запусков
+
+    Атрибуты:
+        run (Callable): Функция запуска задания, принимает местоположение и возвращает False при ошибке
+        jobs (List[Job]): Задания
+    '''
+
+    def __init__(self, run: Callable, jobs: List[Job]):
+        self.run = run
+        self.jobs = jobs
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def run_pending(self, now: float = None):
+        '''
+        Выполняет задания, время запуска которых наступило, и планирует их следующий запуск.
+
+        Параметры:
+            now: Текущее время (time.monotonic), по умолчанию - время вызова
+        Возвращает:
+            Список выполненных заданий
+        '''
+
+        now = time.monotonic() if now is None else now
+        # Сетка запусков задания отсчитывается от времени первой проверки, а не от завершения предыдущих заданий
+        tick = now
+        due = [job for job in self.jobs if job.next_run <= now]
+        for job in due:
+            if self.stopped.is_set():
+                break
+            # Задания выполняются друг за другом, время завершения задания - начало следующего
+            now += self.run_job(job)
+            # Следующий запуск - ближайший по сетке интервала после завершения, пропущенные запуски объединяются
+            missed = int((now - job.next_run) // job.interval) if job.next_run else 0
+            with self.lock:
+                job.coalesced += missed
+                job.next_run = (job.next_run + (missed+1)*job.interval) if job.next_run else tick + job.interval
+        return due
+
+    def run_job(self, job: Job):
+        '''
+        Выполняет задание и сохраняет состояние и длительность запуска.
+
+        Возвращает:
+            Длительность запуска в секундах
+        '''
+
+        with self.lock:
+            job.status, job.last_started = 'running', time.time()
+        start = time.perf_counter()
+        try:
+            result = self.run(job.location)
+            status, error = ('error', 'ETL процесс завершился с ошибкой') if result is False else ('ok', None)
+        except Exception as e:
+            status, error = 'error', str(e)
+        latency = time.perf_counter() - start
+
+        with self.lock:
+            job.status, job.last_error, job.last_latency = status, error, round(latency, 3)
+            job.runs += 1
+        print(f'Задание {job.name}: {status}, длительность {latency:.3f} сек')
+        return latency
+
+    def run_forever(self):
+        '''
+        Выполняет задания по расписанию до вызова stop
+        '''
+
+        while not self.stopped.is_set():
+            self.run_pending()
+            wait = min(job.next_run for job in self.jobs) - time.monotonic()
+            if wait > 0:
+                self.stopped.wait(wait)
+
+    def stop(self):
+        '''
+        Останавливает планировщик после завершения текущего задания
+        '''
+
+        self.stopped.set()
+
+    def status(self):
+        '''
+        Формирует сводку состояния заданий.
+
+        Возвращает:
+            Словарь по имени задания (схеме местоположения)
+        '''
+
+        with self.lock:
+            return {job.name: job.snapshot() for job in self.jobs}
+
+def serve_status(scheduler: Scheduler, port: int, host: str = '127.0.0.1'):
+    '''
+    Запускает HTTP сервер состояния планировщика в отдельном потоке: GET /status возвращает Scheduler.status в формате JSON.
+
+    Параметры:
+        scheduler: Планировщик
+        port: Порт сервера
+        host: Адрес сервера
+    Возвращает:
+        ThreadingHTTPServer (остановка - shutdown)
+    '''
+
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class StatusHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip('/') != '/status':
+                self.send_error(404)
+                return
+            body = json.dumps(scheduler.status(), ensure_ascii=False).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), StatusHandler)
+    threading.Thread(target=server.serve_forever, name='scheduler-status', daemon=True).start()
+    print(f'Состояние планировщика доступно по адресу http://{host}:{server.server_address[1]}/status')
+    return server
@@ -1,16 +1,34 @@
 import unittest
 from unittest.mock import patch, MagicMock
+import numpy as np
 import pandas as pd
 import psycopg2
 from psycopg2 import sql
 from datetime import datetime
 import json
 import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
 
-from extract import open_meteo_api
-from transform import OpenMeteo,transform_unit
-from load import load_to_csv, load_to_db
-from main import open_meteo_etl
+from cache import ResponseCache
+from extract import open_meteo_api, plan_date_ranges, decode_stream, OpenMeteoClient
+from transform import OpenMeteo,transform_unit,partition_bounds,share_frame,attach_frame,build_tables,required_variables,apply_compact_dtypes
+from pipeline import Pipeline
+from scheduler import Job, Scheduler, serve_status
+from metrics import Metrics
+from rollup import rollup_inputs, load_rollup
+from arrays import ArrayMeteo, build_tables as build_array_tables
+from bench import synthetic_response
+from load import load_to_csv, load_to_db, insert_bisect, adapt_types, ensure_partitions, run_parallel, TransactionGroup, FileSink, get_pool, close_pools, get_watermark, staging_name
+from main import open_meteo_etl, incremental_start_date, incremental_rows
+from etl import extract as etl_extract
 
 # Настройка логирования для тестов
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -308,5 +326,994 @@ class TestETLProcess(unittest.TestCase):
         self.assertEqual(rows[0][0], 1)  # Проверяем id
         logger.info("Тест run_etl пройден")
 
+class TestBulkLoad(unittest.TestCase):
+    @patch('load.execute_values')
+    def test_insert_bisect(self, mock_execute_values):
+        """Тест поиска ошибочных строк делением пакета пополам"""
+        def execute_values(cursor, query, batch, page_size):
+            if any(row[0] in (7, 13) for row in batch):
+                raise psycopg2.DataError('invalid input syntax')
+        mock_execute_values.side_effect = execute_values
+
+        failed = insert_bisect(MagicMock(), 'INSERT ... VALUES %s', [(i, float(i)) for i in range(20)], page_size=8)
+
+        # Проверяем, что отброшены только ошибочные строки
+        self.assertEqual([row[0] for row, e in failed], [7, 13])
+        # Успешные пакеты не вставляются повторно построчно
+        self.assertLess(mock_execute_values.call_count, 20)
+
+        # Выгрузка с отброшенными строками сохраняет остальные строки, но завершается с результатом False
+        df = pd.DataFrame({'time_unix': range(20), 'rain_mm': [float(i) for i in range(20)]})
+        with patch('load.get_column_types', return_value={}), patch('load.ensure_partitions'):
+            self.assertIs(load_to_db(df, 'hourly', 'time_unix', conn=MagicMock(), method='values', page_size=8), False)
+            self.assertIs(load_to_db(df[~df['time_unix'].isin([7, 13])], 'hourly', 'time_unix', conn=MagicMock(), method='values'), True)
+        logger.info("Тест insert_bisect пройден")
+
+    def test_adapt_types(self):
+        """Тест приведения времени к типам столбцов и создания месячных партиций"""
+        df = pd.DataFrame({'time_unix': [1746057600, 1748736000], 'rain_mm': [0.0, 1.5]})
+        typed = adapt_types(df, {'time_unix': 'timestamp with time zone', 'rain_mm': 'real'})
+
+        self.assertEqual(str(typed['time_unix'].dt.tz), 'UTC')
+        self.assertEqual(typed['time_unix'].iloc[1], pd.Timestamp('2025-06-01', tz='UTC'))
+        # Обратное приведение к целочисленному ключу
+        self.assertEqual(adapt_types(typed, {'time_unix': 'integer'})['time_unix'].tolist(), df['time_unix'].tolist())
+
+        cursor = MagicMock()
+        cursor.fetchone.return_value = ('RANGE (time_unix)',)
+        ensure_partitions(cursor, typed, 'nsk_plus_7gt', 'hourly', 'time_unix')
+        bounds = [call.args[1] for call in cursor.execute.call_args_list[1:]]
+        self.assertEqual([lower.month for lower, upper in bounds], [5, 6])
+        logger.info("Тест adapt_types пройден")
+
+    def test_transaction_group(self):
+        """Тест общей фиксации транзакций параллельной выгрузки таблиц"""
+        pool = MagicMock()
+        pool.getconn.side_effect = lambda: MagicMock(closed=0)
+
+        with TransactionGroup(pool=pool) as group:
+            results = run_parallel([lambda: group.connection('hourly'), lambda: group.connection('daily')])
+        self.assertEqual([conn.commit.call_count for conn in results], [1, 1])
+
+        # Ошибка выгрузки одной таблицы откатывает транзакции обоих соединений
+        with self.assertRaises(RuntimeError):
+            with TransactionGroup(pool=pool) as group:
+                def failed():
+                    group.connection('daily')
+                    raise RuntimeError('daily')
+                results = run_parallel([lambda: group.connection('hourly'), failed])
+        conns = [call.args[0] for call in pool.putconn.call_args_list[2:]]
+        self.assertEqual([(conn.commit.call_count, conn.rollback.call_count) for conn in conns], [(0, 1), (0, 1)])
+        logger.info("Тест TransactionGroup пройден")
+
+    @patch('etl.load.load_to_db', return_value=False)
+    @patch('etl.extract.open_meteo_api')
+    def test_failed_load_result(self, mock_api, mock_load_to_db):
+        """Тест результата ETL процесса при ошибке выгрузки таблицы в БД без общей транзакции"""
+        mock_api.return_value = synthetic_response(years=2/365, start='2025-05-16')
+        with tempfile.TemporaryDirectory() as directory:
+            result = open_meteo_etl(start_date='2025-05-16', end_date='2025-05-17',
+                                    file_path=[os.path.join(directory, 'hourly.csv'), os.path.join(directory, 'daily.csv')])
+
+        # Планировщик отмечает запуск с результатом False как ошибочный
+        self.assertIs(result, False)
+        self.assertEqual(mock_load_to_db.call_count, 2)
+        logger.info("Тест результата ETL процесса при ошибке выгрузки пройден")
+
+class TestPooling(unittest.TestCase):
+    """Тесты пула соединений и подготовленных запросов выгрузки (требуется БД test)"""
+    schema = 'pool_test'
+
+    def setUp(self):
+        try:
+            self.conn = psycopg2.connect("dbname=test user=admin password=admin host=localhost port=5433")
+        except psycopg2.OperationalError as e:
+            self.skipTest(f'БД test недоступна: {e}')
+        self.schemas = [self.schema]
+        with self.conn.cursor() as cursor:
+            cursor.execute(sql.SQL('DROP SCHEMA IF EXISTS {0} CASCADE; CREATE SCHEMA {0}; '
+                                   'CREATE TABLE {0}.hourly (time_unix integer PRIMARY KEY, rain_mm numeric)').format(sql.Identifier(self.schema)))
+        self.conn.commit()
+
+    def tearDown(self):
+        close_pools()
+        self.conn.rollback()
+        with self.conn.cursor() as cursor:
+            for schema in self.schemas:
+                cursor.execute(sql.SQL('DROP SCHEMA IF EXISTS {} CASCADE').format(sql.Identifier(schema)))
+        self.conn.commit()
+        self.conn.close()
+
+    def count_rows(self):
+        with psycopg2.connect("dbname=test user=admin password=admin host=localhost port=5433") as conn, conn.cursor() as cursor:
+            cursor.execute(sql.SQL('SELECT count(*) FROM {}.hourly').format(sql.Identifier(self.schema)))
+            count = cursor.fetchone()[0]
+        conn.close()
+        return count
+
+    def rows(self, start, stop):
+        return pd.DataFrame({'time_unix': range(start, stop), 'rain_mm': [0.5]*(stop-start)})
+
+    def test_connection_reuse(self):
+        """Тест переиспользования соединения пула и однократной подготовки запроса выгрузки"""
+        pool = get_pool(db='test')
+        conn = pool.getconn()
+        pool.putconn(conn)
+
+        for start in (0, 10, 20):
+            self.assertTrue(load_to_db(self.rows(start, start+10), 'hourly', 'time_unix', db='test', schema=self.schema))
+        self.assertTrue(load_to_db(self.rows(0, 30), 'hourly', 'time_unix', db='test', schema=self.schema, conflict_resolve='UPDATE'))
+
+        # Все выгрузки выполнены по одному соединению, запрос подготовлен один раз для каждого ключа
+        self.assertIs(pool.getconn(), conn)
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT name FROM pg_prepared_statements ORDER BY name')
+            self.assertEqual([row[0] for row in cursor.fetchall()], ['upsert_0', 'upsert_1'])
+        self.assertEqual(sorted(conn.prepared.values()), ['upsert_0', 'upsert_1'])
+        pool.putconn(conn)
+        self.assertEqual(self.count_rows(), 30)
+
+        # Закрытие пулов закрывает соединения, следующий запрос создает новый пул
+        close_pools()
+        self.assertTrue(pool.closed)
+        self.assertTrue(conn.closed)
+        self.assertIsNot(get_pool(db='test'), pool)
+        logger.info("Тест пула соединений пройден")
+
+    def test_caller_transaction(self):
+        """Тест выгрузки в транзакции переданного соединения: фиксация выполняется вызывающим кодом"""
+        self.assertTrue(load_to_db(self.rows(0, 10), 'hourly', 'time_unix', schema=self.schema, conn=self.conn))
+        # Ошибка выгрузки откатывается до точки сохранения, транзакция соединения продолжается
+        self.assertFalse(load_to_db(pd.DataFrame({'time_unix': [100], 'missing': [1]}), 'hourly', 'time_unix', schema=self.schema, conn=self.conn))
+        self.assertEqual(self.conn.status, psycopg2.extensions.STATUS_IN_TRANSACTION)
+        with self.conn.cursor() as cursor:
+            cursor.execute(sql.SQL('SELECT count(*) FROM {}.hourly').format(sql.Identifier(self.schema)))
+            self.assertEqual(cursor.fetchone()[0], 10)
+        # Строки не видны другим соединениям до фиксации
+        self.assertEqual(self.count_rows(), 0)
+
+        self.conn.rollback()
+        self.assertEqual(self.count_rows(), 0)
+        self.assertTrue(load_to_db(self.rows(0, 10), 'hourly', 'time_unix', schema=self.schema, conn=self.conn))
+        self.conn.commit()
+        self.assertEqual(self.count_rows(), 10)
+        logger.info("Тест выгрузки в транзакции вызывающего кода пройден")
+
+    def test_long_schema_names(self):
+        """Тест выгрузки по одному соединению таблиц hourly и daily схемы с длинным наименованием"""
+        schema = f'{self.schema}_{"x"*52}'
+        self.schemas.append(schema)
+        with self.conn.cursor() as cursor:
+            cursor.execute(sql.SQL('DROP SCHEMA IF EXISTS {0} CASCADE; CREATE SCHEMA {0}; '
+                                   'CREATE TABLE {0}.hourly (time_unix integer PRIMARY KEY, rain_mm numeric); '
+                                   'CREATE TABLE {0}.daily (date_unix integer PRIMARY KEY, total_rain_24h numeric)').format(sql.Identifier(schema)))
+        self.conn.commit()
+
+        # Наименования промежуточных таблиц не усекаются до 63 байт и не совпадают, выгрузка COPY не переходит к поиску ошибочных строк
+        names = [staging_name(schema, table_name) for table_name in ('hourly', 'daily')]
+        self.assertTrue(names[0] != names[1] and all(len(name) <= 63 for name in names))
+        with patch('load.insert_bisect') as mock_insert_bisect:
+            self.assertTrue(load_to_db(self.rows(0, 10), 'hourly', 'time_unix', db='test', schema=schema))
+            self.assertTrue(load_to_db(pd.DataFrame({'date_unix': [0], 'total_rain_24h': [5.0]}), 'daily', 'date_unix', db='test', schema=schema))
+        mock_insert_bisect.assert_not_called()
+        logger.info("Тест промежуточных таблиц схем с длинными наименованиями пройден")
+
+class StubOpenMeteoHandler(BaseHTTPRequestHandler):
+    """Локальная заглушка API: отвечает почасовыми данными за запрошенный интервал, первый запрос каждой части - 503"""
+    protocol_version = 'HTTP/1.1'
+    failed_once = set()
+    connections = set()
+
+    def do_GET(self):
+        self.connections.add(self.client_address)
+        query = parse_qs(urlparse(self.path).query)
+        start, end = query['start_date'][0], query['end_date'][0]
+
+        if start not in self.failed_once:
+            self.failed_once.add(start)
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        days = pd.date_range(start, end, freq='D').astype('int64')//10**9
+        body = json.dumps({
+            "utc_offset_seconds": 0,
+            "hourly": {"time": [int(day)+3600*hour for day in days for hour in range(24)]},
+            "daily": {"time": [int(day) for day in days]}
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class TestChunkedExtract(unittest.TestCase):
+    def setUp(self):
+        """Запуск локального HTTP сервера-заглушки"""
+        StubOpenMeteoHandler.failed_once = set()
+        StubOpenMeteoHandler.connections = set()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubOpenMeteoHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}/v1/forecast'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_plan_date_ranges(self):
+        """Тест разбиения интервала дат на части"""
+        self.assertEqual(plan_date_ranges('2025-01-30', '2025-02-05', 3),
+                         [('2025-01-30', '2025-02-01'), ('2025-02-02', '2025-02-04'), ('2025-02-05', '2025-02-05')])
+        logger.info("Тест plan_date_ranges пройден")
+
+    def test_chunked_extract(self):
+        """Тест параллельной выгрузки интервала по частям с повторами и склейкой ответов"""
+        result = open_meteo_api(start_date='2025-01-01', end_date='2025-03-01', chunk_days=7, max_workers=3,
+                                backoff=0.01, base_url=self.base_url)
+
+        expected = pd.date_range('2025-01-01', '2025-03-01', freq='D').astype('int64')//10**9
+        self.assertEqual(result['daily']['time'], expected.tolist())
+        self.assertEqual(len(result['hourly']['time']), 24*len(expected))
+        self.assertEqual(result['hourly']['time'], sorted(result['hourly']['time']))
+        logger.info("Тест chunked_extract пройден")
+
+    def test_client_keep_alive(self):
+        """Тест переиспользования соединения сессии клиента и учета задержек запросов"""
+        with OpenMeteoClient(rate_limiter=None) as client:
+            result = client.open_meteo_api(start_date='2025-01-01', end_date='2025-01-28', chunk_days=7, max_workers=1,
+                                           backoff=0.01, base_url=self.base_url)
+
+        self.assertEqual(len(result['daily']['time']), 28)
+        self.assertEqual(len(StubOpenMeteoHandler.connections), 1)
+        self.assertEqual(client.latency_report()['requests'], 8)
+        logger.info("Тест keep-alive клиента пройден")
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_ttl(self):
+        """Тест хранения ответов за прошедшие и прогнозные дни"""
+        response_cache = ResponseCache(self.directory.name, ttl=-1)
+        response_cache.put('past', b'{"daily": {}}', end_date='2020-01-01')
+        response_cache.put('forecast', b'{"daily": {}}', end_date='2999-01-01')
+
+        self.assertEqual(response_cache.get('past'), b'{"daily": {}}')
+        self.assertIsNone(response_cache.get('forecast'))
+        logger.info("Тест ttl кэша пройден")
+
+    def test_lru_eviction(self):
+        """Тест вытеснения давно не использованных записей"""
+        response_cache = ResponseCache(self.directory.name)
+        for url in ('first', 'second', 'third'):
+            response_cache.put(url, os.urandom(1000), end_date='2020-01-01')
+        os.utime(response_cache.path('first'), (time.time()-60, time.time()-60))
+        os.utime(response_cache.path('second'), (time.time()-30, time.time()-30))
+
+        # Обращение к записи продлевает ее жизнь в кэше
+        response_cache.get('first')
+        response_cache.max_bytes = 2*os.path.getsize(response_cache.path('third'))+100
+        response_cache.evict()
+
+        self.assertIsNotNone(response_cache.get('first'))
+        self.assertIsNone(response_cache.get('second'))
+        self.assertIsNotNone(response_cache.get('third'))
+        logger.info("Тест lru кэша пройден")
+
+    def test_concurrent_removal(self):
+        """Тест промаха кэша при удалении записи параллельным вытеснением"""
+        response_cache = ResponseCache(self.directory.name)
+        response_cache.put('url', b'{"daily": {}}', end_date='2020-01-01')
+
+        # Запись удалена между открытием и обновлением времени обращения
+        def removed(path):
+            os.remove(path)
+            raise FileNotFoundError(path)
+        with patch('cache.os.utime', side_effect=removed):
+            self.assertIsNone(response_cache.get_stream('url'))
+
+        # Запись удалена после проверки, до чтения частей: файл не удерживается открытым неиспользованным генератором
+        response_cache.put('url', b'{"daily": {}}', end_date='2020-01-01')
+        chunks = response_cache.get_stream('url')
+        os.remove(response_cache.path('url'))
+        with self.assertRaises(FileNotFoundError):
+            list(chunks)
+        self.assertIsNone(response_cache.get('url'))
+        logger.info("Тест удаления записи кэша пройден")
+
+class TestFileSink(unittest.TestCase):
+    def test_parquet_partitions(self):
+        """Тест выгрузки частями в Parquet с разбиением по месяцам"""
+        df = pd.DataFrame({"temperature_2m_celsius": np.linspace(-5, 25, 70, dtype=np.float32),
+                           "relative_humidity_2m": pd.array(np.arange(70) % 100, dtype="Int8")},
+                          index=pd.Index(1746057600 + 86400*np.arange(70), name="date_unix"))
+        with tempfile.TemporaryDirectory() as directory:
+            with FileSink(os.path.join(directory, "daily.csv"), "parquet", compression="zstd", partition_by="month") as sink:
+                sink.write(df.iloc[:20])
+                sink.write(df.iloc[20:])
+            parts = sorted(os.listdir(os.path.join(directory, "daily")))
+            restored = pd.concat([pd.read_parquet(os.path.join(directory, "daily", part, "part-0.parquet")) for part in parts])
+
+        self.assertEqual(parts, ["month=2025-05", "month=2025-06", "month=2025-07"])
+        pd.testing.assert_frame_equal(restored, df)
+        logger.info("Тест выгрузки в parquet пройден")
+
+class TestPipeline(unittest.TestCase):
+    def test_overlap(self):
+        """Тест одновременного выполнения стадий с сохранением порядка частей"""
+        active, peak, lock = [0], [0], threading.Lock()
+
+        def stage(item):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.02)
+            with lock:
+                active[0] -= 1
+            return item
+
+        results = Pipeline([stage, stage, lambda item: item*10]).run(range(8))
+
+        self.assertEqual(results, [item*10 for item in range(8)])
+        self.assertGreater(peak[0], 1)
+        logger.info("Тест конвейера пройден")
+
+    def test_error(self):
+        """Тест остановки конвейера и передачи ошибки стадии"""
+        processed = []
+
+        def load(item):
+            if item == 2:
+                raise RuntimeError('Ошибка выгрузки')
+            processed.append(item)
+
+        with self.assertRaises(RuntimeError):
+            Pipeline([lambda item: item, load]).run(range(100))
+        self.assertEqual(processed, [0, 1])
+
+class TestScheduler(unittest.TestCase):
+    def test_coalesce(self):
+        """Тест объединения пропущенных запусков и состояния заданий планировщика"""
+        runs = []
+
+        def run(location):
+            runs.append(location[2])
+            return False if location[2] == 'broken' else None
+
+        jobs = [Job(('55.0344', '82.9434', 'nsk_plus_7gt'), 10), Job(('0', '0', 'broken'), 20)]
+        etl_scheduler = Scheduler(run, jobs)
+
+        etl_scheduler.run_pending(now=1)
+        self.assertEqual(etl_scheduler.run_pending(now=5), [])
+        # Запуски на 11, 21 и 31 секундах задания nsk_plus_7gt объединяются в один
+        etl_scheduler.run_pending(now=35)
+
+        self.assertEqual(runs, ['nsk_plus_7gt', 'broken', 'nsk_plus_7gt', 'broken'])
+        self.assertEqual((jobs[0].next_run, jobs[0].coalesced), (41, 2))
+        self.assertEqual((jobs[1].next_run, jobs[1].coalesced), (41, 0))
+
+        server = serve_status(etl_scheduler, 0)
+        try:
+            with OpenMeteoClient() as client:
+                status = client.get(f'http://127.0.0.1:{server.server_address[1]}/status').json()
+        finally:
+            server.shutdown()
+        self.assertEqual(status['nsk_plus_7gt']['status'], 'ok')
+        self.assertEqual(status['broken']['status'], 'error')
+        self.assertEqual(status['broken']['runs'], 2)
+        logger.info("Тест планировщика пройден")
+
+class TestMetrics(unittest.TestCase):
+    def test_prometheus(self):
+        """Тест учета времени стадий и счетчиков и выгрузки в формате Prometheus"""
+        metrics = Metrics()
+
+        @metrics.timed('transform')
+        def transform(df):
+            return df.head(2)
+
+        transform(pd.DataFrame({'time': range(5)}))
+        transform(pd.DataFrame({'time': range(5)}))
+        metrics.count('bytes', 1024, stage='extract')
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['stages']['transform']['calls'], 2)
+        text = metrics.to_prometheus()
+        self.assertIn('open_meteo_etl_rows_out_total{stage="transform"} 4', text)
+        self.assertIn('open_meteo_etl_bytes_total{stage="extract"} 1024', text)
+        logger.info("Тест метрик пройден")
+
+def synthetic_meteo_data(days=30, seed=0):
+    """Формирует ответ API со случайными почасовыми данными за days суток (последние сутки неполные)"""
+    rng = np.random.default_rng(seed)
+    time = 1747328400 + 3600*np.arange(days*24-5)
+    day = 1747328400 + 86400*np.arange(days)
+    hourly_units = {"time": "unixtime", "relative_humidity_2m": "%", "visibility": "ft"}
+    hourly = {"time": time.tolist(),
+              "relative_humidity_2m": rng.integers(0, 100, len(time)).tolist(),
+              "visibility": np.round(rng.uniform(60, 80000, len(time)), 3).tolist()}
+    for unit, (name, scale) in {"°F": ('temperature_2m', 15), "kn": ('wind_speed_10m', 3), "inch": ('rain', 0.02)}.items():
+        hourly_units[name] = unit
+        hourly[name] = np.round(np.abs(rng.normal(40, scale, len(time))), 3).tolist()
+        hourly[name][rng.integers(len(time))] = None
+    return {"utc_offset_seconds": 25200, "timezone_abbreviation": "GMT+7",
+            "hourly_units": hourly_units, "hourly": hourly,
+            "daily_units": {"time": "unixtime", "sunrise": "unixtime", "sunset": "unixtime"},
+            "daily": {"time": day.tolist(),
+                      "sunrise": (day+18000+rng.integers(0, 3000, days)).tolist(),
+                      "sunset": (day+75000+rng.integers(0, 3000, days)).tolist()}}
+
+class TestAggregate(unittest.TestCase):
+    def test_aggregate_parity(self):
+        """Тест совпадения однопроходной агрегации с методами avg/total_for_24h/daylight"""
+        openmeteo_obj = OpenMeteo(synthetic_meteo_data())
+        avg_units, total_units = ['temperature_2m', 'relative_humidity_2m', 'wind_speed_10m', 'visibility'], ['rain']
+
+        days = openmeteo_obj.daily[['date']].set_index('date')
+        expected = (
+            days.join(openmeteo_obj.avg_for_24h(avg_units))
+            .join(openmeteo_obj.total_for_24h(total_units))
+            .join(openmeteo_obj.avg_for_daylight(avg_units))
+            .join(openmeteo_obj.total_for_daylight(total_units))
+        )
+        result = days.join(openmeteo_obj.aggregate(avg_units, total_units))
+
+        pd.testing.assert_frame_equal(result, expected, check_exact=True)
+        logger.info("Тест aggregate пройден")
+
+    def test_output_spec(self):
+        """Тест вывода запрашиваемых переменных и итоговых таблиц из описания OUTPUT_SPEC"""
+        spec = {'hourly': ['temperature_2m', 'rain'], 'avg': ['temperature_2m', 'visibility'], 'total': ['rain'], 'daily': ['sunrise', 'sunset']}
+        self.assertEqual(required_variables(spec), (['temperature_2m', 'rain', 'visibility'], ['sunrise', 'sunset']))
+
+        # Неиспользуемые переменные ответа (relative_humidity_2m, wind_speed_10m) не попадают в таблицы
+        table1, table2 = build_tables(OpenMeteo(synthetic_meteo_data()), spec=spec)
+        self.assertEqual(table2.columns.tolist(), ['time_unix', 'temperature_2m_celsius', 'rain_mm'])
+        self.assertEqual(table1.columns.tolist(), ['date_unix', 'avg_temperature_2m_24h', 'avg_visibility_24h', 'total_rain_24h',
+                                                   'avg_temperature_2m_daylight', 'avg_visibility_daylight', 'total_rain_daylight',
+                                                   'daylight_hours', 'sunrise_iso', 'sunset_iso'])
+        logger.info("Тест OUTPUT_SPEC пройден")
+
+    def test_shared_partitions(self):
+        """Тест деления данных по границам суток и передачи почасовых столбцов через общую память"""
+        openmeteo_obj = OpenMeteo(synthetic_meteo_data(), compact=True)
+        bounds = partition_bounds(openmeteo_obj, 4)
+
+        self.assertEqual([daily for daily, _ in bounds], [(0, 7), (7, 15), (15, 22), (22, 30)])
+        for (daily_start, daily_stop), (hourly_start, hourly_stop) in bounds:
+            self.assertTrue(openmeteo_obj.hourly['date'].iloc[hourly_start:hourly_stop]
+                            .isin(openmeteo_obj.daily['date'].iloc[daily_start:daily_stop]).all())
+
+        shm, layout = share_frame(openmeteo_obj.hourly)
+        try:
+            part = attach_frame(shm, layout, 100, 200)
+            pd.testing.assert_frame_equal(part, openmeteo_obj.hourly.iloc[100:200], check_exact=True)
+            # Столбцы части - представления блока общей памяти без копирования
+            block = np.frombuffer(shm.buf, dtype=np.uint8)
+            self.assertTrue(np.shares_memory(part['time'].to_numpy(), block))
+            self.assertTrue(np.shares_memory(part['visibility'].to_numpy(), block))
+            del part, block
+        finally:
+            shm.close()
+            shm.unlink()
+        logger.info("Тест деления данных по суткам пройден")
+
+class TestUnitConversions(unittest.TestCase):
+    # Формулы конвертации до перехода на реестр UNIT_CONVERSIONS
+    BASELINE = {'temperature_2m': ('_celsius', lambda x: ((x-32)*5/9).round(1)),
+                'wind_speed_10m': ('_m_per_s', lambda x: (x*0.514).round(1)),
+                'rain': ('_mm', lambda x: (x*25.4).round(1)),
+                'visibility': ('_m', lambda x: (x*0.3048).round(1))}
+
+    def baseline(self, openmeteo_obj, units):
+        hourly = openmeteo_obj.hourly.set_index(openmeteo_obj.hourly_keys)
+        return pd.DataFrame({unit+self.BASELINE[unit][0]: self.BASELINE[unit][1](hourly[unit].astype(float)) for unit in units})
+
+    def test_conversion_parity(self):
+        """Тест совпадения конвертации по реестру UNIT_CONVERSIONS с исходными формулами"""
+        openmeteo_obj = OpenMeteo(synthetic_meteo_data())
+        wrappers = {'temperature_2m': openmeteo_obj.fah_to_cel, 'wind_speed_10m': openmeteo_obj.kn_to_mps,
+                    'rain': openmeteo_obj.inch_to_mm, 'visibility': openmeteo_obj.ft_to_m}
+        for unit, wrapper in wrappers.items():
+            pd.testing.assert_frame_equal(wrapper([unit]), self.baseline(openmeteo_obj, [unit]), check_exact=True)
+
+        units = list(self.BASELINE)
+        expected = self.baseline(openmeteo_obj, units)
+        units_new = openmeteo_obj.convert_units(units)
+        self.assertEqual(units_new, expected.columns.tolist())
+        pd.testing.assert_frame_equal(openmeteo_obj.hourly.set_index(openmeteo_obj.hourly_keys)[units_new], expected, check_exact=True)
+        logger.info("Тест конвертации единиц измерения пройден")
+
+    def test_unknown_unit(self):
+        """Тест ошибки конвертации столбцов без правила либо в другой единице измерения"""
+        openmeteo_obj = OpenMeteo(synthetic_meteo_data())
+        with self.assertRaises(ValueError):
+            openmeteo_obj.convert_units(['temperature_2m', 'relative_humidity_2m'])
+        with self.assertRaises(ValueError):
+            openmeteo_obj.fah_to_cel(['rain'])
+        # Столбцы не изменяются при ошибке
+        self.assertIn('temperature_2m', openmeteo_obj.hourly.columns)
+        logger.info("Тест ошибки конвертации пройден")
+
+class TestCompactDtypes(unittest.TestCase):
+    def test_fractional_values(self):
+        """Тест компактной схемы типов для целочисленных переменных с дробными значениями"""
+        meteo_data = synthetic_meteo_data()
+        meteo_data["hourly"]["relative_humidity_2m"][0] = 55.5
+        openmeteo_obj = OpenMeteo(meteo_data, compact=True)
+
+        # Столбец с дробными значениями хранится в float32 без потери значений, целочисленный - в Int8
+        self.assertEqual(str(openmeteo_obj.hourly['relative_humidity_2m'].dtype), 'float32')
+        self.assertEqual(openmeteo_obj.hourly['relative_humidity_2m'].iloc[0], 55.5)
+        self.assertEqual(str(OpenMeteo(synthetic_meteo_data(), compact=True).hourly['relative_humidity_2m'].dtype), 'Int8')
+        logger.info("Тест компактной схемы типов пройден")
+
+    def test_memory_report(self):
+        """Тест отчета о памяти столбцов почасовых и суточных данных"""
+        report = OpenMeteo(synthetic_meteo_data(), compact=True).memory_report()
+        full_report = OpenMeteo(synthetic_meteo_data()).memory_report()
+
+        self.assertEqual(report.index.names, ['frame', 'column'])
+        self.assertEqual(report.loc[('hourly', 'time'), 'dtype'], 'int64')
+        self.assertEqual(report.loc[('hourly', 'visibility'), 'bytes'], 4*(30*24-5))
+        self.assertLess(report.loc['hourly', 'bytes'].sum(), full_report.loc['hourly', 'bytes'].sum()*0.7)
+        logger.info("Тест memory_report пройден")
+
+    def test_compact_dtypes_after_2038(self):
+        """Тест независимости типов компактной схемы от значений: время после 2038 года и коды вне диапазона"""
+        frame = pd.DataFrame({'time': [2**31 - 3600, 2**31 + 3600], 'sunrise': [2**31 + 60, None],
+                              'relative_humidity_2m': [55, 300], 'weather_code': [3, 61]})
+        result = apply_compact_dtypes(frame)
+
+        self.assertEqual(result['time'].dtype, np.int64)
+        self.assertEqual(result['time'].tolist(), [2**31 - 3600, 2**31 + 3600])
+        self.assertEqual(result['sunrise'].dtype, pd.Int64Dtype())
+        self.assertEqual(result['sunrise'].iloc[0], 2**31 + 60)
+        self.assertEqual(result['relative_humidity_2m'].dtype, np.float32)
+        self.assertEqual(result['weather_code'].dtype, pd.Int8Dtype())
+        logger.info("Тест компактной схемы после 2038 года пройден")
+
+class TestArrayCore(unittest.TestCase):
+    def test_array_parity(self):
+        """Тест совпадения итоговых таблиц ArrayMeteo и OpenMeteo для одного и нескольких местоположений"""
+        spec = {'hourly': ['temperature_2m', 'relative_humidity_2m', 'rain'], 'avg': ['temperature_2m', 'wind_speed_10m', 'visibility'],
+                'total': ['rain'], 'daily': ['sunrise', 'sunset']}
+        meteo_data = synthetic_meteo_data()
+        meteo_data["daily"]["sunset"][3] = None
+
+        for data in (meteo_data, [meteo_data, synthetic_meteo_data(days=10, seed=1)]):
+            for native in (False, True):
+                expected = build_tables(OpenMeteo(data), native_timestamps=native, spec=spec)
+                result = build_array_tables(ArrayMeteo(data), native_timestamps=native, spec=spec)
+                for table, expected_table in zip(result, expected):
+                    pd.testing.assert_frame_equal(table, expected_table, check_exact=True)
+        logger.info("Тест ArrayMeteo пройден")
+
+class TestRollup(unittest.TestCase):
+    """Тесты свертки суточных агрегатов в БД (требуется БД test)"""
+    schema = 'rollup_test'
+    spec = {'hourly': ['temperature_2m', 'rain'], 'avg': ['temperature_2m', 'relative_humidity_2m', 'wind_speed_10m', 'visibility'],
+            'total': ['rain'], 'daily': ['sunrise', 'sunset']}
+
+    def setUp(self):
+        try:
+            self.conn = psycopg2.connect("dbname=test user=admin password=admin host=localhost port=5433")
+        except psycopg2.OperationalError as e:
+            self.skipTest(f'БД test недоступна: {e}')
+
+    def tearDown(self):
+        self.conn.rollback()
+        self.conn.close()
+
+    def test_rollup_parity(self):
+        """Тест совпадения суточных агрегатов, вычисленных в БД, с build_tables"""
+        meteo_data = synthetic_meteo_data()
+        table1, _ = build_tables(OpenMeteo(meteo_data), spec=self.spec)
+        _, source, sun = rollup_inputs(OpenMeteo(meteo_data), spec=self.spec)
+
+        with self.conn.cursor() as cursor:
+            cursor.execute(sql.SQL('DROP SCHEMA IF EXISTS {} CASCADE; CREATE SCHEMA {}').format(sql.Identifier(self.schema), sql.Identifier(self.schema)))
+            cursor.execute(sql.SQL('CREATE TABLE {}.daily (date_unix integer PRIMARY KEY, {})').format(
+                sql.Identifier(self.schema),
+                sql.SQL(', ').join(sql.SQL('{} {}').format(sql.Identifier(column), sql.SQL('varchar(25)' if column.endswith('_iso') else 'numeric'))
+                                   for column in table1.columns[1:])
+            ))
+
+        daily = load_rollup(self.conn, self.schema, source, sun, spec=self.spec)
+        pd.testing.assert_frame_equal(daily, table1, check_dtype=False, check_exact=True)
+
+        # Пересчет затронутых суток по новым часам (последние сутки были неполными)
+        hours = source['time_unix'].iloc[-1] + 3600*np.arange(1, 6)
+        new_source = pd.DataFrame({'time_unix': hours} | {column: 1.0 for column in source.columns[1:]})
+        daily = load_rollup(self.conn, self.schema, new_source, sun.iloc[-1:], spec=self.spec)
+        self.assertEqual(daily['date_unix'].tolist(), [sun['date_unix'].iloc[-1]])
+        self.assertFalse(daily[['avg_temperature_2m_24h', 'total_rain_24h']].isna().any(axis=None))
+        logger.info("Тест rollup пройден")
+
+class TestIncrementalWindow(unittest.TestCase):
+    # Сутки 2025-05-16, 2025-05-17, 2025-05-18 (unix время местоположения)
+    DAYS = [1747353600, 1747440000, 1747526400]
+
+    def test_start_date(self):
+        """Тест выбора начальной даты инкрементальной загрузки по водяным знакам местоположений"""
+        # Пустые таблицы любого местоположения - интервал запрашивается с начальной даты
+        self.assertEqual(incremental_start_date('2025-05-16', [(None, None)]), '2025-05-16')
+        self.assertEqual(incremental_start_date('2025-05-16', [(self.DAYS[2]+82800, self.DAYS[2]), (self.DAYS[1], None)]), '2025-05-16')
+        # Сутки водяного знака запрашиваются повторно, для нескольких местоположений - сутки самого раннего
+        self.assertEqual(incremental_start_date('2025-05-01', [(self.DAYS[2]+82800, self.DAYS[2])]), '2025-05-18')
+        self.assertEqual(incremental_start_date('2025-05-01', [(self.DAYS[2]+82800, self.DAYS[2]), (self.DAYS[1]+3600, self.DAYS[1])]), '2025-05-17')
+        logger.info("Тест incremental_start_date пройден")
+
+    @patch('etl.extract.open_meteo_api')
+    @patch('etl.load.get_watermark')
+    @patch('etl.load.ensure_tables')
+    @patch('etl.load.db_session')
+    def test_no_new_data(self, mock_db_session, mock_ensure_tables, mock_get_watermark, mock_api):
+        """Тест завершения инкрементальной загрузки без запроса API, если данные загружены по конечную дату"""
+        mock_get_watermark.side_effect = [self.DAYS[2]+82800, self.DAYS[2]]
+
+        self.assertIs(open_meteo_etl(start_date='2025-05-01', end_date='2025-05-17', incremental=True), True)
+        mock_api.assert_not_called()
+        logger.info("Тест инкрементальной загрузки без новых данных пройден")
+
+    def test_rows(self):
+        """Тест отбора часов с суток водяного знака и затронутых ими суток"""
+        hourly_table = pd.DataFrame({'time_unix': [day + 3600*hour for day in self.DAYS for hour in range(24)]})
+        daily_table = pd.DataFrame({'date_unix': self.DAYS})
+
+        # Пустые таблицы - выгружаются все строки
+        hourly, daily = incremental_rows(hourly_table, daily_table, None, None)
+        self.assertEqual((len(hourly), len(daily)), (72, 3))
+
+        # Часы суток водяного знака hourly выгружаются повторно, сутки 2025-05-17 затронуты только часами,
+        # сутки 2025-05-18 не старше водяного знака daily
+        hourly, daily = incremental_rows(hourly_table, daily_table, self.DAYS[1] + 10*3600, self.DAYS[2])
+        self.assertEqual(hourly['time_unix'].tolist(), hourly_table['time_unix'].iloc[24:].tolist())
+        self.assertEqual(daily['date_unix'].tolist(), self.DAYS[1:])
+
+        hourly, daily = incremental_rows(hourly_table, daily_table, self.DAYS[2] + 23*3600, self.DAYS[2])
+        self.assertEqual(len(hourly), 24)
+        self.assertEqual(daily['date_unix'].tolist(), self.DAYS[2:])
+        logger.info("Тест incremental_rows пройден")
+
+class MeteoDatabaseTestCase(unittest.TestCase):
+    """Основа тестов ETL процесса с выгрузкой в БД open_meteo_stats (таблицы схем создаются по схеме-шаблону)"""
+    schemas = ()
+
+    def setUp(self):
+        try:
+            self.conn = psycopg2.connect("dbname=open_meteo_stats user=admin password=admin host=localhost port=5433")
+        except psycopg2.OperationalError as e:
+            self.skipTest(f'БД open_meteo_stats недоступна: {e}')
+        self.conn.autocommit = True
+        self.drop_schemas()
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.drop_schemas()
+        self.conn.close()
+        self.directory.cleanup()
+
+    def drop_schemas(self):
+        with self.conn.cursor() as cursor:
+            for schema in self.schemas:
+                cursor.execute(sql.SQL('DROP SCHEMA IF EXISTS {} CASCADE').format(sql.Identifier(schema)))
+
+    def file_path(self, name):
+        return [os.path.join(self.directory.name, name, file_name) for file_name in ('hourly.csv', 'daily.csv')]
+
+    def fetch_table(self, schema, table_name, table_key):
+        """Читает таблицу схемы в порядке ключа"""
+        with self.conn.cursor() as cursor:
+            cursor.execute(sql.SQL('SELECT * FROM {}.{} ORDER BY {}').format(
+                sql.Identifier(schema), sql.Identifier(table_name), sql.Identifier(table_key)))
+            return pd.DataFrame(cursor.fetchall(), columns=[column.name for column in cursor.description])
+
+    def assert_table_values(self, table, expected, table_key):
+        """Сравнивает числовые столбцы таблицы БД с итоговой таблицей (столбцы real хранят значения с точностью float32)"""
+        columns = [column for column in expected.select_dtypes('number').columns if column != table_key]
+        self.assertEqual(len(table), len(expected))
+        np.testing.assert_allclose(table[columns].astype(float).to_numpy(), expected[columns].astype(float).to_numpy(), rtol=1e-6)
+
+class TestMultipleLocations(MeteoDatabaseTestCase):
+    """Тесты выгрузки нескольких местоположений в схемы местоположений (требуется БД open_meteo_stats)"""
+    schemas = ('location_a', 'location_b')
+
+    def test_location_schemas(self):
+        """Тест выгрузки строк каждого местоположения в его схему и подкаталог файлов"""
+        meteo_data = synthetic_response(years=3/365, locations=2, start='2025-05-16')
+        locations = [('55.0344', '82.9434', self.schemas[0]), ('54.9833', '73.3667', self.schemas[1])]
+
+        with patch('etl.extract.open_meteo_api', return_value=meteo_data):
+            self.assertIsNone(open_meteo_etl(start_date='2025-05-16', end_date='2025-05-18', locations=locations,
+                                             file_path=self.file_path('multiple')))
+
+        for i, schema in enumerate(self.schemas):
+            table1, table2 = build_tables(OpenMeteo(meteo_data[i]))
+            self.assert_table_values(self.fetch_table(schema, 'hourly', 'time_unix'), table2, 'time_unix')
+            self.assert_table_values(self.fetch_table(schema, 'daily', 'date_unix'), table1, 'date_unix')
+
+            # Файлы местоположения сохраняются в подкаталог его схемы
+            hourly_path, daily_path = [os.path.join(os.path.dirname(path), schema, os.path.basename(path)) for path in self.file_path('multiple')]
+            pd.testing.assert_frame_equal(pd.read_csv(hourly_path)[['time_unix', 'temperature_2m_celsius']],
+                                          table2[['time_unix', 'temperature_2m_celsius']].reset_index(drop=True))
+            self.assertEqual(pd.read_csv(daily_path)['date_unix'].tolist(), table1['date_unix'].tolist())
+        logger.info("Тест выгрузки нескольких местоположений пройден")
+
+class TestIncremental(MeteoDatabaseTestCase):
+    """Тесты инкрементальной загрузки (требуется БД open_meteo_stats)"""
+    schemas = ('incremental_test',)
+
+    def test_refresh_watermark_day(self):
+        """Тест обновления часов и суточных агрегатов суток водяного знака повторным инкрементальным запуском"""
+        first = synthetic_response(years=3/365, start='2025-05-16')
+        # Повторный ответ API за сутки водяного знака с измененными (фактическими вместо прогнозных) значениями
+        second = synthetic_response(years=1/365, start='2025-05-18', seed=1)
+        schema = self.schemas[0]
+
+        with patch('etl.extract.open_meteo_api', side_effect=[first, second]) as mock_api:
+            for _ in range(2):
+                self.assertIsNone(open_meteo_etl(start_date='2025-05-16', end_date='2025-05-18', locations=[('55.0344', '82.9434', schema)],
+                                                 incremental=True, file_path=self.file_path(schema)))
+        self.assertEqual(mock_api.call_args.kwargs['start_date'], '2025-05-18')
+
+        (daily1, hourly1), (daily2, hourly2) = build_tables(OpenMeteo(first)), build_tables(OpenMeteo(second))
+        self.assert_table_values(self.fetch_table(schema, 'hourly', 'time_unix'), pd.concat([hourly1.iloc[:48], hourly2]), 'time_unix')
+        self.assert_table_values(self.fetch_table(schema, 'daily', 'date_unix'), pd.concat([daily1.iloc[:2], daily2]), 'date_unix')
+        logger.info("Тест инкрементальной загрузки пройден")
+
+class TestSingleTransaction(MeteoDatabaseTestCase):
+    """Тесты общей транзакции выгрузки таблиц hourly и daily (требуется БД open_meteo_stats)"""
+    schemas = ('transaction_test',)
+
+    def run_etl(self):
+        with patch('etl.extract.open_meteo_api', return_value=synthetic_response(years=3/365, start='2025-05-16')):
+            return open_meteo_etl(start_date='2025-05-16', end_date='2025-05-18', locations=[('55.0344', '82.9434', self.schemas[0])],
+                                  file_path=self.file_path(self.schemas[0]), single_transaction=True)
+
+    def count_rows(self, table_name):
+        with self.conn.cursor() as cursor:
+            cursor.execute(sql.SQL('SELECT count(*) FROM {}.{}').format(sql.Identifier(self.schemas[0]), sql.Identifier(table_name)))
+            return cursor.fetchone()[0]
+
+    def test_rollback(self):
+        """Тест отката выгрузки обеих таблиц при ошибке выгрузки одной из них"""
+        # Таблицы схемы местоположения создаются первым запуском
+        self.assertIsNone(self.run_etl())
+        self.assertEqual((self.count_rows('hourly'), self.count_rows('daily')), (72, 3))
+
+        # Вставка строк в daily нарушает ограничение NOT NULL столбца, отсутствующего в итоговой таблице
+        with self.conn.cursor() as cursor:
+            cursor.execute(sql.SQL('TRUNCATE {0}.hourly, {0}.daily; ALTER TABLE {0}.daily ADD COLUMN required integer NOT NULL')
+                           .format(sql.Identifier(self.schemas[0])))
+
+        self.assertIs(self.run_etl(), False)
+        self.assertEqual((self.count_rows('hourly'), self.count_rows('daily')), (0, 0))
+        logger.info("Тест отката общей транзакции пройден")
+
+class StubMeteoDataHandler(BaseHTTPRequestHandler):
+    """Локальная заглушка API: отвечает срезом ответа meteo_data (одно местоположение) за запрошенный интервал"""
+    protocol_version = 'HTTP/1.1'
+    meteo_data = None
+    requests = []
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        self.requests.append((query['start_date'][0], query['end_date'][0]))
+        # Сутки интервала - местные, время ответа - unix время UTC
+        offset = self.meteo_data['utc_offset_seconds']
+        start = int(pd.Timestamp(query['start_date'][0]).timestamp()) - offset
+        end = int(pd.Timestamp(query['end_date'][0]).timestamp()) - offset + 86400
+
+        response = {key: value for key, value in self.meteo_data.items() if key not in ('hourly', 'daily')}
+        for section in ('hourly', 'daily'):
+            values = self.meteo_data[section]
+            rows = (values['time'] >= start) & (values['time'] < end)
+            response[section] = {name: [None if np.isnan(value) else value for value in column[rows].tolist()]
+                                 if column.dtype.kind == 'f' else column[rows].tolist() for name, column in values.items()}
+        body = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class TestStreamParity(MeteoDatabaseTestCase):
+    """Тесты потоковой обработки интервала частями (требуется БД open_meteo_stats)"""
+    schemas = ('stream_whole', 'stream_parts', 'stream_overlap')
+
+    def setUp(self):
+        super().setUp()
+        StubMeteoDataHandler.meteo_data = synthetic_response(years=7/365, start='2025-05-16')
+        StubMeteoDataHandler.requests = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubMeteoDataHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}/v1/forecast'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        super().tearDown()
+
+    def run_etl(self, schema, **kwargs):
+        with patch('etl.extract.open_meteo_api', partial(etl_extract.open_meteo_api, base_url=self.base_url)):
+            self.assertIsNone(open_meteo_etl(start_date='2025-05-16', end_date='2025-05-22', locations=[('55.0344', '82.9434', schema)],
+                                             file_path=self.file_path(schema), rate_limit=60000, **kwargs))
+
+    def test_stream_parity(self):
+        """Тест совпадения файлов и строк БД потоковой обработки частями (с overlap и без) с обработкой интервала целиком"""
+        self.run_etl('stream_whole')
+        self.run_etl('stream_parts', stream_days=3)
+        self.run_etl('stream_overlap', stream_days=3, overlap=True)
+        self.assertEqual(StubMeteoDataHandler.requests[1:4], [('2025-05-16', '2025-05-18'), ('2025-05-19', '2025-05-21'), ('2025-05-22', '2025-05-22')])
+
+        self.assertEqual(len(self.fetch_table('stream_whole', 'hourly', 'time_unix')), 7*24)
+        for schema in self.schemas[1:]:
+            for path, expected_path in zip(self.file_path(schema), self.file_path('stream_whole')):
+                pd.testing.assert_frame_equal(pd.read_csv(path), pd.read_csv(expected_path), check_exact=True)
+            for table_name, table_key in (('hourly', 'time_unix'), ('daily', 'date_unix')):
+                pd.testing.assert_frame_equal(self.fetch_table(schema, table_name, table_key),
+                                              self.fetch_table('stream_whole', table_name, table_key), check_exact=True)
+        logger.info("Тест потоковой обработки частями пройден")
+
+class TestSchemaMigrations(unittest.TestCase):
+    """Тесты схем init.sql/init_typed.sql и миграций (требуется БД test, для каждого теста создается отдельная БД)"""
+    db = 'migration_test'
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    def setUp(self):
+        try:
+            self.admin_conn = psycopg2.connect("dbname=test user=admin password=admin host=localhost port=5433")
+        except psycopg2.OperationalError as e:
+            self.skipTest(f'БД test недоступна: {e}')
+        self.admin_conn.autocommit = True
+        with self.admin_conn.cursor() as cursor:
+            cursor.execute(sql.SQL('DROP DATABASE IF EXISTS {} WITH (FORCE)').format(sql.Identifier(self.db)))
+            cursor.execute(sql.SQL("CREATE DATABASE {} ENCODING 'UTF8' TEMPLATE template0").format(sql.Identifier(self.db)))
+        self.conn = psycopg2.connect(f"dbname={self.db} user=admin password=admin host=localhost port=5433")
+
+        # Почасовые и суточные таблицы за 20 суток (с 2025-05-20, вторая половина - в следующем месяце)
+        self.table1, self.table2 = build_tables(OpenMeteo(synthetic_response(years=20/365, start='2025-05-20')))
+
+    def tearDown(self):
+        close_pools()
+        self.conn.close()
+        with self.admin_conn.cursor() as cursor:
+            cursor.execute(sql.SQL('DROP DATABASE IF EXISTS {} WITH (FORCE)').format(sql.Identifier(self.db)))
+        self.admin_conn.close()
+
+    def run_script(self, *path):
+        with open(os.path.join(self.root, *path), encoding='utf-8') as file, self.conn.cursor() as cursor:
+            cursor.execute(file.read())
+        self.conn.commit()
+
+    def load(self, days):
+        """Выгружает строки первых days суток таблиц в схему nsk_plus_7gt"""
+        hourly, daily = self.table2.iloc[:24*days], self.table1.iloc[:days]
+        self.assertTrue(load_to_db(hourly, 'hourly', 'time_unix', db=self.db))
+        self.assertTrue(load_to_db(daily, 'daily', 'date_unix', db=self.db))
+        return hourly['time_unix'].max(), daily['date_unix'].max()
+
+    def watermarks(self):
+        with self.conn:
+            return get_watermark(self.conn, 'hourly', 'time_unix'), get_watermark(self.conn, 'daily', 'date_unix')
+
+    def column_types(self, table_name):
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute("SELECT column_name, data_type FROM information_schema.columns "
+                           "WHERE table_schema = 'nsk_plus_7gt' AND table_name = %s", (table_name,))
+            return dict(cursor.fetchall())
+
+    def partitions(self):
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute("SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                           "WHERE i.inhparent = 'nsk_plus_7gt.hourly'::regclass ORDER BY 1")
+            return [row[0] for row in cursor.fetchall()]
+
+    def count_rows(self, table_name):
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute(sql.SQL('SELECT count(*) FROM nsk_plus_7gt.{}').format(sql.Identifier(table_name)))
+            return cursor.fetchone()[0]
+
+    def test_typed_schema(self):
+        """Тест выгрузки в типизированную схему init_typed.sql с созданием месячных партиций"""
+        self.run_script('init_typed.sql')
+
+        self.assertEqual(self.watermarks(), (None, None))
+        self.assertEqual(self.load(5), self.watermarks())
+        self.assertEqual(self.partitions(), ['hourly_2025_05'])
+        self.assertEqual(self.load(20), self.watermarks())
+        self.assertEqual(self.partitions(), ['hourly_2025_05', 'hourly_2025_06'])
+        self.assertEqual((self.count_rows('hourly'), self.count_rows('daily')), (20*24, 20))
+        logger.info("Тест типизированной схемы пройден")
+
+    def test_migrate_numeric_schema(self):
+        """Тест перевода ранее созданной схемы init.sql на типизированную миграциями 001 и 002"""
+        self.run_script('init.sql')
+        watermarks = self.load(10)
+        self.assertEqual(self.watermarks(), watermarks)
+
+        self.run_script('migrations', '001_sun_timestamptz.sql')
+        self.assertEqual(self.column_types('daily')['sunrise_iso'], 'timestamp with time zone')
+        self.run_script('migrations', '002_typed_schema.sql')
+        self.assertEqual(self.column_types('hourly')['time_unix'], 'timestamp with time zone')
+        self.assertEqual(self.column_types('hourly')['rain_mm'], 'real')
+        self.assertEqual(self.column_types('daily')['avg_temperature_2m_24h'], 'double precision')
+
+        # Данные перенесены, водяные знаки совпадают, исходные таблицы сохранены
+        self.assertEqual(self.watermarks(), watermarks)
+        self.assertEqual([self.count_rows(name) for name in ('hourly', 'daily', 'hourly_numeric', 'daily_numeric')], [240, 10, 240, 10])
+        self.assertEqual(self.partitions(), ['hourly_2025_05'])
+
+        # Выгрузка после миграции пропускает загруженные строки и создает партицию следующего месяца
+        self.assertEqual(self.load(20), self.watermarks())
+        self.assertEqual(self.partitions(), ['hourly_2025_05', 'hourly_2025_06'])
+        self.assertEqual((self.count_rows('hourly'), self.count_rows('daily')), (20*24, 20))
+        logger.info("Тест миграций схемы пройден")
+
+class TestUnixToIso(unittest.TestCase):
+    def test_unix_to_iso(self):
+        """Тест совпадения векторного форматирования ISO 8601 с strftime и меток времени timestamptz"""
+        meteo_data = synthetic_meteo_data()
+        meteo_data["daily"]["sunset"][3] = None
+        openmeteo_obj = OpenMeteo(meteo_data)
+
+        expected = openmeteo_obj.daily[['sunrise', 'sunset']].apply(pd.to_datetime, unit='s').apply(lambda col: col.dt.strftime('%Y-%m-%dT%H:%M:%SZ'))
+        result = openmeteo_obj.unix_to_iso(['sunrise', 'sunset'])
+        native = openmeteo_obj.unix_to_iso(['sunrise', 'sunset'], native=True)
+
+        pd.testing.assert_frame_equal(result.reset_index(drop=True), expected.set_axis(['sunrise_iso', 'sunset_iso'], axis=1))
+        self.assertEqual(str(native['sunset_iso'].dtype), 'datetime64[s, UTC]')
+        self.assertTrue(pd.isna(native['sunset_iso'].iloc[3]))
+        self.assertEqual(native['sunrise_iso'].iloc[0].isoformat().replace('+00:00', 'Z'), result['sunrise_iso'].iloc[0])
+        logger.info("Тест unix_to_iso пройден")
+
+class TestStreamDecode(unittest.TestCase):
+    def test_decode_stream(self):
+        """Тест потокового разбора ответа, разрезанного на части в произвольных местах"""
+        meteo_data = synthetic_meteo_data(days=5)
+        meteo_data["timezone"] = "Asia/Novosibirsk \\ \"[quoted]\""
+        body = json.dumps([meteo_data, meteo_data]).encode()
+
+        for size in (1, 7, 4096):
+            result = decode_stream(body[i:i+size] for i in range(0, len(body), size))
+
+            self.assertEqual(result[1]["timezone"], meteo_data["timezone"])
+            self.assertEqual(result[0]["hourly"]["time"].dtype, np.int64)
+            self.assertEqual(result[0]["hourly"]["time"].tolist(), meteo_data["hourly"]["time"])
+            np.testing.assert_array_equal(result[0]["hourly"]["rain"],
+                                          np.array(meteo_data["hourly"]["rain"], dtype=np.float64))
+        logger.info("Тест decode_stream пройден")
+
+class TestStartup(unittest.TestCase):
+    # Время импорта main (мкс, python -X importtime) при импорте pandas, numpy, psycopg2 и requests на уровне модулей
+    BASELINE_US = 510000
+
+    def test_lazy_imports(self):
+        """Тест запуска main без импорта тяжелых зависимостей"""
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'], cwd=root,
+                                capture_output=True, text=True, check=True)
+
+        cumulative = {}
+        for line in result.stderr.splitlines():
+            parts = line.split('|')
+            if line.startswith('import time:') and parts[1].strip().isdigit():
+                cumulative[parts[2].strip()] = int(parts[1])
+
+        self.assertFalse({'pandas', 'numpy', 'psycopg2', 'requests'} & cumulative.keys())
+        self.assertLess(cumulative['main'], self.BASELINE_US/2)
+        logger.info(f"Тест запуска пройден: импорт main {cumulative['main']/1000:.1f} мс (базовое время {self.BASELINE_US/1000:.0f} мс)")
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -1,7 +1,43 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 from typing import List
 import pandas as pd
 import numpy as np
 
+from etl.metrics import METRICS
+
+# Реестр конвертации единиц измерения почасовых данных: единица из hourly_units -> правило конвертации
+# Значение конвертируется как ((x + offset) * factor / divisor) с округлением до decimals знаков,
+# к имени столбца добавляется окончание suffix
+UNIT_CONVERSIONS = {
+    '°F': {'target': '°C', 'offset': -32, 'factor': 5, 'divisor': 9, 'decimals': 1, 'suffix': '_celsius'},
+    'kn': {'target': 'm/s', 'offset': 0, 'factor': 0.514, 'divisor': 1, 'decimals': 1, 'suffix': '_m_per_s'},
+    'inch': {'target': 'mm', 'offset': 0, 'factor': 25.4, 'divisor': 1, 'decimals': 1, 'suffix': '_mm'},
+    'ft': {'target': 'm', 'offset': 0, 'factor': 0.3048, 'divisor': 1, 'decimals': 1, 'suffix': '_m'},
+}
+
+# Компактная схема типов данных (OpenMeteo(compact=True)): временные данные (ключи и время восхода/заката) сохраняют
+# секунды эпохи int64 (в int32 они переполняются в 2038 году), целочисленные коды и проценты - nullable целые типы,
+# остальные измерения - float32
+COMPACT_DTYPES = {
+    'time': 'int64', 'time_utc': 'int64', 'date': 'int64', 'location': 'int16',
+    'sunrise': 'Int64', 'sunset': 'Int64', 'sunrise_utc': 'Int64', 'sunset_utc': 'Int64',
+    'weather_code': 'Int8', 'relative_humidity_2m': 'Int8', 'wind_direction_10m': 'Int16', 'wind_direction_80m': 'Int16',
+}
+COMPACT_MEASUREMENT_DTYPE = 'float32'
+
+# Описание итоговых таблиц через исходные переменные API: hourly - почасовые столбцы table2 (в порядке столбцов таблицы),
+# avg и total - переменные суточных средних и сумм table1, daily - суточные переменные (время восхода и заката).
+# Из описания выводится минимальный набор запрашиваемых переменных (required_variables), остальные не запрашиваются и не обрабатываются
+OUTPUT_SPEC = {
+    'hourly': ['wind_speed_10m','wind_speed_80m','temperature_2m','apparent_temperature','temperature_80m','temperature_120m'
+               ,'soil_temperature_0cm','soil_temperature_6cm','rain','showers','snowfall'],
+    'avg': ['temperature_2m','relative_humidity_2m','dew_point_2m','apparent_temperature','temperature_80m','temperature_120m'
+            ,'wind_speed_10m','wind_speed_80m','visibility'],
+    'total': ['rain','showers','snowfall'],
+    'daily': ['sunrise','sunset'],
+}
+
 
 class OpenMeteo:
     '''
@@ -9,15 +45,31 @@ class OpenMeteo:
     Класс содержит методы вычисления, конвертации, агрегации и преобразования данных
 
     Атрибуты:
-        meteo_data (dict): Raw данные запроса в формате json
+        meteo_data (dict | List[dict]): Raw данные запроса в формате json (список - для нескольких местоположений)
         hourly (pd.DataFrame): Преобразованные в датафрейм, почасовые данные из запроса
         daily (pd.DataFrame): Преобразованные в датафрейм, суточные данные из запроса
+        keys (List[str]): Ключ суточных данных (['date'] либо ['location', 'date'] для нескольких местоположений)
+        hourly_keys (List[str]): Ключ почасовых данных
+        compact (bool): Признак хранения данных в компактной схеме типов COMPACT_DTYPES
     '''
 
-    def __init__(self, meteo_data):
-        self.json_data = meteo_data
-        self.hourly = pd.DataFrame(self.json_data['hourly'])      
-        self.daily = pd.DataFrame(self.json_data['daily'])
+    @METRICS.timed()
+    def __init__(self, meteo_data, compact: bool = False):
+        # Ответ API по нескольким координатам приходит списком словарей, по одной координате - словарем
+        self.locations = meteo_data if isinstance(meteo_data, list) else [meteo_data]
+        self.json_data = self.locations[0]
+
+        # Массивы NumPy (при потоковом разборе ответа) используются без копирования
+        if len(self.locations) == 1:
+            self.hourly = pd.DataFrame(self.json_data['hourly'], copy=False)
+            self.daily = pd.DataFrame(self.json_data['daily'], copy=False)
+            self.keys = ['date']
+        else:
+            # Данные всех местоположений объединяются в один датафрейм с номером местоположения в столбце location
+            self.hourly = pd.concat([pd.DataFrame(loc['hourly'], copy=False).assign(location=i) for i, loc in enumerate(self.locations)], ignore_index=True)
+            self.daily = pd.concat([pd.DataFrame(loc['daily'], copy=False).assign(location=i) for i, loc in enumerate(self.locations)], ignore_index=True)
+            self.keys = ['location', 'date']
+        self.hourly_keys = self.keys[:-1] + ['time', 'date']
 
         # Перенос временных данных в новый столбец с окончанием "_utc"
         self.hourly['time_utc'] = self.hourly['time']
@@ -25,47 +77,91 @@ class OpenMeteo:
         self.daily['sunrise_utc'] = self.daily['sunrise']
         self.daily['sunset_utc'] = self.daily['sunset']
 
+        # Сдвиг временных данных с учетом временной зоны каждого местоположения
+        hourly_shift = self.utc_shift(self.hourly)
+        daily_shift = self.utc_shift(self.daily)
+
         # Преобразование временных данный с учетом временной зоны
         if self.json_data['hourly_units']['time'] == 'unixtime':
-            if '+' in self.json_data['timezone_abbreviation']:
-                self.hourly['time'] = self.hourly['time']+self.json_data['utc_offset_seconds']
-            else:
-                self.hourly['time'] = self.hourly['time']-self.json_data['utc_offset_seconds']
-            self.hourly['date'] = pd.to_datetime(self.hourly['time'], unit='s').dt.normalize().astype('int64')//10**9
+            self.hourly['time'] = self.hourly['time']+hourly_shift
+            self.hourly['date'] = self.hourly['time']//86400*86400
         else:
-            self.hourly['time'] = pd.to_datetime(self.hourly['time'])
-            if '+' in self.json_data['timezone_abbreviation']:
-                self.hourly['time'] = self.hourly['time']+pd.to_timedelta(self.json_data['utc_offset_seconds'],unit='s')
-            else:
-                self.hourly['time'] = self.hourly['time']-pd.to_timedelta(self.json_data['utc_offset_seconds'],unit='s')
+            self.hourly['time'] = pd.to_datetime(self.hourly['time'])+pd.to_timedelta(hourly_shift,unit='s')
             self.hourly['date'] = self.hourly['time'].dt.date
 
         if self.json_data['daily_units']['time'] == 'unixtime':
-            if '+' in self.json_data['timezone_abbreviation']:
-                self.daily['date'] = self.daily['time']+self.json_data['utc_offset_seconds']
-            else:
-                self.daily['date'] = self.daily['time']-self.json_data['utc_offset_seconds']
+            self.daily['date'] = self.daily['time']+daily_shift
         else:
-            self.hourly['time'] = pd.to_datetime(self.hourly['time'])
-            if '+' in self.json_data['timezone_abbreviation']:
-                self.hourly['time'] = self.hourly['time']+pd.to_timedelta(self.json_data['utc_offset_seconds'],unit='s')
-            else:
-                self.hourly['time'] = self.hourly['time']-pd.to_timedelta(self.json_data['utc_offset_seconds'],unit='s')
+            self.hourly['time'] = pd.to_datetime(self.hourly['time'])+pd.to_timedelta(hourly_shift,unit='s')
             self.hourly['date'] = self.hourly['time'].dt.date
 
         if 'sunset' in self.json_data['daily_units'] and self.json_data['daily_units']['sunset'] == 'unixtime':
-            if '+' in self.json_data['timezone_abbreviation']:
-
-                self.daily['sunset'] = self.daily['sunset']+self.json_data['utc_offset_seconds']
-            else:
-                self.daily['sunset'] = self.daily['sunset']-self.json_data['utc_offset_seconds']
+            self.daily['sunset'] = self.daily['sunset']+daily_shift
 
         if 'sunrise' in self.json_data['daily_units'] and self.json_data['daily_units']['sunrise'] == 'unixtime':
-            if '+' in self.json_data['timezone_abbreviation']:
-                self.daily['sunrise'] = self.daily['sunrise']+self.json_data['utc_offset_seconds']
-            else:
-                self.daily['sunrise'] = self.daily['sunrise']-self.json_data['utc_offset_seconds']
+            self.daily['sunrise'] = self.daily['sunrise']+daily_shift
+
+        self.compact = compact
+        if compact:
+            self.hourly = apply_compact_dtypes(self.hourly)
+            self.daily = apply_compact_dtypes(self.daily)
+
+    @classmethod
+    def from_frames(cls, hourly: pd.DataFrame, daily: pd.DataFrame, json_data: dict, keys: List[str], compact: bool = False):
+        '''
+        Создает экземпляр класса из уже подготовленных (сдвинутых по временной зоне) почасовых и суточных данных,
+        например, из части данных другого экземпляра.
+
+        Параметры:
+            hourly (pd.DataFrame): Почасовые данные
+            daily (pd.DataFrame): Суточные данные
+            json_data (dict): Данные запроса с описанием единиц измерения (hourly_units, daily_units)
+            keys (List[str]): Ключ суточных данных
+            compact (bool): Признак компактной схемы типов
+        Возвращает:
+            OpenMeteo
+        '''
+
+        om_obj = cls.__new__(cls)
+        om_obj.locations = [json_data]
+        om_obj.json_data = json_data
+        om_obj.hourly = hourly
+        om_obj.daily = daily
+        om_obj.keys = keys
+        om_obj.hourly_keys = keys[:-1] + ['time', 'date']
+        om_obj.compact = compact
+        return om_obj
+
+    def memory_report(self):
+        '''
+        Формирует отчет о памяти, занимаемой столбцами почасовых и суточных данных.
 
+        Возвращает:
+            pd.DataFrame (индекс - датафрейм и столбец, столбцы - тип данных и размер в байтах)
+        '''
+
+        return pd.concat(
+            {name: pd.DataFrame({'dtype': frame.dtypes.astype(str), 'bytes': frame.memory_usage(index=False, deep=True)})
+             for name, frame in (('hourly', self.hourly), ('daily', self.daily))},
+            names=['frame', 'column']
+        )
+
+    def utc_shift(self, frame: pd.DataFrame):
+        '''
+        Вычисляет сдвиг (в секундах) временных данных относительно UTC для строк датафрейма.
+
+        Параметры:
+            frame (pd.DataFrame): Датафрейм hourly или daily
+        Возвращает:
+            Число для одного местоположения, np.ndarray по строкам для нескольких
+        '''
+
+        shifts = [location_shift(loc) for loc in self.locations]
+        if len(shifts) == 1:
+            return shifts[0]
+        return np.array(shifts)[frame['location'].to_numpy()]
+
+    @METRICS.timed()
     def avg_for_24h(self, units: List[str]):
         '''
         Вычисляет средние значения за 24 часа.
@@ -83,7 +179,7 @@ class OpenMeteo:
         rename_dict = {unit:unit_new for unit,unit_new in zip(units,units_new)}
 
         avg_units_24h = (
-            self.hourly.groupby('date')
+            self.hourly.groupby(self.keys)
             .agg(agg_dict|{'time':'count'})
             .round(3)
             .reset_index()
@@ -91,8 +187,9 @@ class OpenMeteo:
 
         avg_units_24h.loc[avg_units_24h['time'] != 24, units] = np.nan
 
-        return avg_units_24h.drop('time', axis=1).rename(columns=rename_dict).set_index('date')
+        return avg_units_24h.drop('time', axis=1).rename(columns=rename_dict).set_index(self.keys)
 
+    @METRICS.timed()
     def avg_for_daylight(self, units: List[str]):
         '''
         Вычисляет средние значения за промежуток светового дня.
@@ -110,8 +207,8 @@ class OpenMeteo:
         rename_dict = {unit:unit_new for unit,unit_new in zip(units,units_new)}
         
         hourly_dl = (
-            self.hourly[['time','date']+units].set_index('date')
-            .join(self.daily[['date','sunrise','sunset']].set_index('date'))
+            self.hourly[self.hourly_keys+units].set_index(self.keys)
+            .join(self.daily[self.keys+['sunrise','sunset']].set_index(self.keys))
             .reset_index()
         )
 
@@ -120,7 +217,7 @@ class OpenMeteo:
                 (hourly_dl['time'] <= hourly_dl['sunset'])) |
                 (hourly_dl['sunrise'].isna()) |
                 (hourly_dl['sunset'].isna())    
-            ].groupby('date')
+            ].groupby(self.keys)
             .agg(agg_dict|{'sunrise':'mean', 'sunset':'mean'})
             .round(3)
             .reset_index()
@@ -128,8 +225,9 @@ class OpenMeteo:
 
         avg_units_dl.loc[avg_units_dl['sunrise'].isna() | avg_units_dl['sunset'].isna(), units] = np.nan
 
-        return avg_units_dl.drop(['sunrise','sunset'], axis=1).rename(columns=rename_dict).set_index('date')
+        return avg_units_dl.drop(['sunrise','sunset'], axis=1).rename(columns=rename_dict).set_index(self.keys)
 
+    @METRICS.timed()
     def total_for_24h(self, units: List[str]):
         '''
         Вычисляет общие значения за 24 часа.
@@ -147,7 +245,7 @@ class OpenMeteo:
         rename_dict = {unit:unit_new for unit,unit_new in zip(units,units_new)}
 
         total_units_24h = (
-            self.hourly.groupby('date')
+            self.hourly.groupby(self.keys)
             .agg(agg_dict|{'time':'count'})
             .round(3)
             .reset_index()
@@ -155,8 +253,9 @@ class OpenMeteo:
 
         total_units_24h.loc[total_units_24h['time'] != 24, units] = np.nan
 
-        return total_units_24h.drop('time', axis=1).rename(columns=rename_dict).set_index('date')
+        return total_units_24h.drop('time', axis=1).rename(columns=rename_dict).set_index(self.keys)
 
+    @METRICS.timed()
     def total_for_daylight(self, units: List[str]):
         '''
         Вычисляет общие значения за промежуток светового дня.
@@ -174,8 +273,8 @@ class OpenMeteo:
         rename_dict = {unit:unit_new for unit,unit_new in zip(units,units_new)}
 
         hourly_dl = (
-            self.hourly[['time','date']+units].set_index('date')
-            .join(self.daily[['date','sunrise','sunset']].set_index('date'))
+            self.hourly[self.hourly_keys+units].set_index(self.keys)
+            .join(self.daily[self.keys+['sunrise','sunset']].set_index(self.keys))
             .reset_index()
         )
 
@@ -184,7 +283,7 @@ class OpenMeteo:
                 (hourly_dl['time'] <= hourly_dl['sunset'])) |
                 (hourly_dl['sunrise'].isna()) |
                 (hourly_dl['sunset'].isna())    
-            ].groupby('date')
+            ].groupby(self.keys)
             .agg(agg_dict|{'sunrise':'mean','sunset':'mean'})
             .round(3)
             .reset_index()
@@ -192,7 +291,99 @@ class OpenMeteo:
 
         total_units_dl.loc[total_units_dl['sunrise'].isna() | total_units_dl['sunset'].isna(), units] = np.nan
 
-        return total_units_dl.drop(['sunrise','sunset'], axis=1).rename(columns=rename_dict).set_index('date')
+        return total_units_dl.drop(['sunrise','sunset'], axis=1).rename(columns=rename_dict).set_index(self.keys)
+
+    @METRICS.timed()
+    def aggregate(self, avg_units: List[str], total_units: List[str]):
+        '''
+        Вычисляет средние и общие значения за 24 часа и за промежуток светового дня за один проход.
+        Маска светового дня вычисляется один раз, суммы, количества значений и часов по суткам
+        считаются через np.bincount по кодам суток сразу для всех столбцов.
+        Результат совпадает с объединением avg_for_24h, total_for_24h, avg_for_daylight и total_for_daylight.
+
+        Параметры:
+            avg_units (List[str]): Список имен столбцов для вычисления средних значений
+            total_units (List[str]): Список имен столбцов для вычисления общих значений
+        Возвращает:
+            pd.DataFrame
+        '''
+
+        units = avg_units+total_units
+
+        # Код суток каждой почасовой строки - номер строки daily с тем же ключом (-1, если суток нет в daily)
+        if len(self.keys) == 1:
+            codes = pd.Index(self.daily['date']).get_indexer(self.hourly['date'])
+        else:
+            codes = pd.MultiIndex.from_frame(self.daily[self.keys]).get_indexer(pd.MultiIndex.from_frame(self.hourly[self.keys]))
+
+        result = aggregate_arrays(
+            codes,
+            self.hourly[units].to_numpy(dtype=np.float64, na_value=np.nan),
+            self.hourly['time'].to_numpy(dtype=np.float64),
+            self.daily['sunrise'].to_numpy(dtype=np.float64, na_value=np.nan),
+            self.daily['sunset'].to_numpy(dtype=np.float64, na_value=np.nan),
+            len(avg_units)
+        )
+
+        return pd.DataFrame(
+            result,
+            columns=aggregate_columns(avg_units, total_units),
+            index=pd.MultiIndex.from_frame(self.daily[self.keys]) if len(self.keys) > 1 else pd.Index(self.daily['date'], name='date')
+        )
+
+    @METRICS.timed()
+    def convert_units(self, units: List[str]):
+        '''
+        Конвертирует столбцы почасовых данных по реестру UNIT_CONVERSIONS на месте.
+        Столбцы всех единиц измерения извлекаются одним блоком float64, конвертируются векторно
+        и возвращаются в датафрейм hourly под новыми именами (с окончанием целевой единицы).
+
+        Параметры:
+            units (List[str]): Список имен столбцов
+        Возвращает:
+            Список новых имен столбцов в порядке units
+        '''
+
+        hourly_units = self.json_data['hourly_units']
+        unknown = [unit for unit in units if hourly_units.get(unit) not in UNIT_CONVERSIONS]
+        if unknown:
+            raise ValueError(f'Для столбцов {unknown} нет правила конвертации единиц измерения, обновите список!')
+
+        block = self.hourly[units].to_numpy(dtype=np.float64, na_value=np.nan)
+        for source_unit in dict.fromkeys(hourly_units[unit] for unit in units):
+            positions = [i for i, unit in enumerate(units) if hourly_units[unit] == source_unit]
+            block[:, positions] = convert_values(block[:, positions], source_unit)
+        if self.compact:
+            block = block.astype(COMPACT_MEASUREMENT_DTYPE)
+
+        units_new = [unit+UNIT_CONVERSIONS[hourly_units[unit]]['suffix'] for unit in units]
+        self.hourly = pd.concat(
+            [self.hourly.drop(columns=units), pd.DataFrame(block, columns=units_new, index=self.hourly.index)],
+            axis=1
+        )
+
+        return units_new
+
+    @METRICS.timed()
+    def converted(self, units: List[str], source_unit: str):
+        '''
+        Возвращает копию столбцов почасовых данных, сконвертированных по правилу реестра UNIT_CONVERSIONS.
+
+        Параметры:
+            units (List[str]): Список имен столбцов
+            source_unit (str): Исходная единица измерения столбцов
+        Возвращает:
+            pd.DataFrame либо None, если столбцы представлены не в source_unit
+        '''
+
+        if not all((attr,source_unit) in self.json_data['hourly_units'].items() for attr in units):
+            return None
+
+        converted_units = self.hourly[self.hourly_keys+units].copy()
+        converted_units[units] = convert_values(converted_units[units].to_numpy(dtype=np.float64, na_value=np.nan), source_unit)
+        rename_dict = {unit:unit+UNIT_CONVERSIONS[source_unit]['suffix'] for unit in units}
+
+        return converted_units.rename(columns=rename_dict).set_index(self.hourly_keys)
 
     def fah_to_cel(self, units: List[str]):
         '''
@@ -203,18 +394,11 @@ class OpenMeteo:
         Возвращает:
             pd.DataFrame
         '''
-        
-        if all((attr,'°F') in self.json_data['hourly_units'].items() for attr in units):
-            if all('avg' not in unit or 'total' not in unit for unit in units):
-                units_new = [unit+'_celsius' for unit in units]
-                rename_dict = {unit:unit_new for unit,unit_new in zip(units,units_new)}
-            else: rename_dict = {}
 
-            fah_units = self.hourly[['time','date']+units]
-            fah_units.loc[:,units] = ((fah_units.loc[:,units]-32)*5/9).round(1)
-
-            return fah_units.rename(columns=rename_dict).set_index(['time','date'])
-        else: raise ValueError('Передаваемый список столбцов представлены не в Фаренгейтах(°F), обновите список!')
+        fah_units = self.converted(units, '°F')
+        if fah_units is None:
+            raise ValueError('Передаваемый список столбцов представлены не в Фаренгейтах(°F), обновите список!')
+        return fah_units
 
     def kn_to_mps(self, units: List[str]):
         '''
@@ -225,18 +409,11 @@ class OpenMeteo:
         Возвращает:
             pd.DataFrame
         '''
-    
-        if all((attr,'kn') in self.json_data['hourly_units'].items() for attr in units):
-            if all('avg' not in unit or 'total' not in unit for unit in units):
-                units_new = [unit+'_m_per_s' for unit in units]
-                rename_dict = {unit:unit_new for unit,unit_new in zip(units,units_new)}
-            else: rename_dict = {}
-
-            kn_units = self.hourly[['time','date']+units]
-            kn_units.loc[:,units] = (kn_units.loc[:,units]*0.514).round(1)
 
-            return kn_units.rename(columns=rename_dict).set_index(['time','date'])
-        else: raise ValueError('Передаваемый список столбцов представлены не в Узлах(knots/kn), обновите список!')
+        kn_units = self.converted(units, 'kn')
+        if kn_units is None:
+            raise ValueError('Передаваемый список столбцов представлены не в Узлах(knots/kn), обновите список!')
+        return kn_units
 
     def inch_to_mm(self, units: List[str]):
         '''
@@ -247,18 +424,11 @@ class OpenMeteo:
         Возвращает:
             pd.DataFrame
         '''
-    
-        if all((attr,'inch') in self.json_data['hourly_units'].items() for attr in units):
-            if all('avg' not in unit or 'total' not in unit for unit in units):
-                units_new = [unit+'_mm' for unit in units]
-                rename_dict = {unit:unit_new for unit,unit_new in zip(units,units_new)}
-            else: rename_dict = {}
-
-            inch_units = self.hourly[['time','date']+units]
-            inch_units.loc[:,units] = (inch_units.loc[:,units]*25.4).round(1)
 
-            return inch_units.rename(columns=rename_dict).set_index(['time','date'])
-        else: raise ValueError('Передаваемый список столбцов представлены не в Дюймах(inch), обновите список!')
+        inch_units = self.converted(units, 'inch')
+        if inch_units is None:
+            raise ValueError('Передаваемый список столбцов представлены не в Дюймах(inch), обновите список!')
+        return inch_units
 
     def ft_to_m(self, units: List[str]):
         '''
@@ -269,19 +439,13 @@ class OpenMeteo:
         Возвращает:
             pd.DataFrame
         '''
-    
-        if all((attr,'ft') in self.json_data['hourly_units'].items() for attr in units):
-            if all('avg' not in unit or 'total' not in unit for unit in units):
-                units_new = [unit+'_m' for unit in units]
-                rename_dict = {unit:unit_new for unit,unit_new in zip(units,units_new)}
-            else: rename_dict = {}
 
-            ft_units = self.hourly[['time','date']+units]
-            ft_units.loc[:,units] = (ft_units.loc[:,units]*0.3048).round(1)
-
-            return ft_units.rename(columns=rename_dict).set_index(['time','date'])
-        else: raise ValueError('Передаваемый список столбцов представлены не в Футах(ft), обновите список!')
+        ft_units = self.converted(units, 'ft')
+        if ft_units is None:
+            raise ValueError('Передаваемый список столбцов представлены не в Футах(ft), обновите список!')
+        return ft_units
 
+    @METRICS.timed()
     def daylight_hours(self):
         '''
         Вычисляет промежуток светого дня, как разницу между временем восхода и временем заката солнца.
@@ -293,35 +457,470 @@ class OpenMeteo:
         '''
 
         if self.json_data['daily_units']['sunrise'] == 'unixtime' and self.json_data['daily_units']['sunset'] == 'unixtime':
-            daylight_duration = self.daily[['date','sunrise','sunset']]
+            daylight_duration = self.daily[self.keys+['sunrise','sunset']]
             daylight_duration['daylight_hours'] = ((daylight_duration.loc[:,'sunset']-daylight_duration.loc[:,'sunrise'])/3600).round(1)
 
-        return daylight_duration.drop(columns=['sunrise','sunset']).set_index('date')
+        return daylight_duration.drop(columns=['sunrise','sunset']).set_index(self.keys)
 
-    def unix_to_iso(self, units:List[str]):
+    @METRICS.timed()
+    def unix_to_iso(self, units:List[str], native: bool = False):
         '''
         Преобразует временные данные из unix формата в формат ISO 8601 ('YYYY-mm-ddTHH:MM:SSZ').
+        Строки формируются векторно (np.datetime_as_string) без поэлементного strftime.
 
         Параметры:
             units (List[str]): Список имен столбцов
+            native (bool): Вернуть метки времени UTC (datetime64) вместо строк, например, для столбцов timestamptz
         Возвращает:
             pd.DataFrame
         '''
-                
-        units_new = [unit+'_iso' for unit in units]
-        rename_dict = {unit:unit_new for unit,unit_new in zip(units,units_new)}
 
         if all(unit in self.json_data['daily_units'].keys() for unit in units):
-            iso_df = self.daily[['date']+units]
-            iso_df.loc[:,units] = iso_df[units].apply(pd.to_datetime, unit='s').apply(lambda col: col.dt.strftime('%Y-%m-%dT%H:%M:%SZ'))
-            return iso_df.rename(columns=rename_dict).set_index('date')
+            frame, keys = self.daily, self.keys
         elif all(unit in self.json_data['hourly_units'].keys() for unit in units):
-            iso_df = self.hourly[['time']+units]
-            iso_df.loc[:,units] = iso_df[units].apply(pd.to_datetime, unit='s').apply(lambda col: col.dt.strftime('%Y-%m-%dT%H:%M:%SZ'))
-            return iso_df.rename(columns=rename_dict).set_index('time')
+            frame, keys = self.hourly, self.hourly_keys[:-1]
         else:
             raise ValueError('Передаваемый список столбцов невозможно перевести в ISO 8601 формат, обновите список столбцов')
 
+        iso_df = frame[keys].copy()
+        for unit in units:
+            iso_df[unit+'_iso'] = unix_to_timestamp(frame[unit]) if native else format_iso(frame[unit])
+        return iso_df.set_index(keys)
+
+def location_shift(location: dict):
+    '''
+    Вычисляет сдвиг (в секундах) временных данных местоположения относительно UTC.
+
+    Параметры:
+        location (dict): Ответ API по местоположению
+    Возвращает:
+        Число
+    '''
+
+    return location['utc_offset_seconds'] if '+' in location['timezone_abbreviation'] else -location['utc_offset_seconds']
+
+def unix_seconds(values: pd.Series):
+    '''
+    Приводит столбец unix времени к массиву datetime64[s] (пропуски - NaT).
+
+    Параметры:
+        values (pd.Series | np.ndarray): Столбец unix времени в секундах
+    Возвращает:
+        Кортеж (np.ndarray datetime64[s], маска пропусков)
+    '''
+
+    seconds = values.to_numpy(dtype=np.float64, na_value=np.nan) if isinstance(values, pd.Series) else np.asarray(values, dtype=np.float64)
+    missing = np.isnan(seconds)
+    stamps = np.where(missing, 0, seconds).astype(np.int64).astype('datetime64[s]')
+    stamps[missing] = np.datetime64('NaT')
+    return stamps, missing
+
+def format_iso(values: pd.Series):
+    '''
+    Форматирует столбец unix времени в строки ISO 8601 ('YYYY-mm-ddTHH:MM:SSZ'), пропуски - NaN.
+
+    Параметры:
+        values (pd.Series | np.ndarray): Столбец unix времени в секундах
+    Возвращает:
+        np.ndarray строк
+    '''
+
+    stamps, missing = unix_seconds(values)
+    iso = np.datetime_as_string(stamps, unit='s', timezone='UTC').astype(object)
+    iso[missing] = np.nan
+    return iso
+
+def unix_to_timestamp(values: pd.Series):
+    '''
+    Преобразует столбец unix времени в метки времени UTC.
+
+    Параметры:
+        values (pd.Series): Столбец unix времени в секундах
+    Возвращает:
+        pd.Series datetime64[s, UTC]
+    '''
+
+    stamps, _ = unix_seconds(values)
+    return pd.Series(stamps, index=values.index).dt.tz_localize('UTC')
+
+def apply_compact_dtypes(frame: pd.DataFrame):
+    '''
+    Приводит столбцы датафрейма к компактной схеме типов COMPACT_DTYPES.
+    Числовые столбцы вне схемы и измерения целочисленных типов схемы с дробными значениями либо значениями
+    вне диапазона типа (например, относительная влажность или направление ветра, усредненные моделью)
+    приводятся к COMPACT_MEASUREMENT_DTYPE. Временные данные всегда хранятся в int64.
+
+    Параметры:
+        frame (pd.DataFrame): Датафрейм почасовых или суточных данных
+    Возвращает:
+        pd.DataFrame
+    '''
+
+    dtypes = {}
+    for column in frame.columns:
+        dtype = COMPACT_DTYPES.get(column)
+        if dtype is None:
+            if pd.api.types.is_numeric_dtype(frame[column]):
+                dtypes[column] = COMPACT_MEASUREMENT_DTYPE
+            continue
+        if not pd.api.types.is_numeric_dtype(frame[column]):
+            continue
+        values = frame[column].dropna()
+        info = np.iinfo(dtype.lower())
+        integral = pd.api.types.is_integer_dtype(values) or (values % 1 == 0).all()
+        fits = values.empty or (values.min() >= info.min and values.max() <= info.max)
+        dtypes[column] = dtype if integral and fits else COMPACT_MEASUREMENT_DTYPE
+    return frame.astype(dtypes)
+
+def convert_values(values: np.ndarray, source_unit: str):
+    '''
+    Конвертирует массив значений по правилу реестра UNIT_CONVERSIONS.
+
+    Параметры:
+        values (np.ndarray): Массив значений в исходной единице измерения
+        source_unit (str): Исходная единица измерения
+    Возвращает:
+        np.ndarray
+    '''
+
+    conversion = UNIT_CONVERSIONS[source_unit]
+    if conversion['offset']:
+        values = values+conversion['offset']
+    values = values*conversion['factor']
+    if conversion['divisor'] != 1:
+        values = values/conversion['divisor']
+    return np.round(values, conversion['decimals'])
+
+def group_sum(codes: np.ndarray, values: np.ndarray, groups: int):
+    '''
+    Суммирует значения столбцов по группам, пропуская NaN.
+    Суммирование выполняется с компенсацией ошибки округления (алгоритм Кахана) в порядке строк,
+    как в groupby pandas, поэтому результат совпадает с ним до последнего знака.
+    Строки всех групп обрабатываются векторно по шагам - номеру строки внутри группы.
+
+    Параметры:
+        codes (np.ndarray): Коды групп строк (от 0 до groups-1)
+        values (np.ndarray): Двумерный массив значений (строки x столбцы)
+        groups (int): Количество групп
+    Возвращает:
+        Кортеж (суммы по группам и столбцам, количество не пустых значений, количество строк в группах)
+    '''
+
+    sums = np.zeros((groups, values.shape[1]))
+    compensation = np.zeros((groups, values.shape[1]))
+    counts = np.zeros((groups, values.shape[1]), dtype=np.int64)
+    rows = np.bincount(codes, minlength=groups)
+
+    # Номер каждой строки внутри своей группы с сохранением исходного порядка строк
+    order = np.argsort(codes, kind='stable')
+    rank = np.empty(len(codes), dtype=np.int64)
+    rank[order] = np.arange(len(codes)) - (np.cumsum(rows)-rows)[codes[order]]
+
+    for step in range(rows.max() if len(codes) else 0):
+        step_rows = np.flatnonzero(rank == step)
+        group, value = codes[step_rows], values[step_rows]
+        notna = ~np.isnan(value)
+
+        y = value - compensation[group]
+        t = sums[group] + y
+        step_compensation = t - sums[group] - y
+        step_compensation[np.isnan(step_compensation)] = 0.0
+
+        sums[group] = np.where(notna, t, sums[group])
+        compensation[group] = np.where(notna, step_compensation, compensation[group])
+        counts[group] += notna
+
+    return sums, counts, rows
+
+def aggregate_arrays(codes: np.ndarray, values: np.ndarray, time: np.ndarray, sunrise: np.ndarray, sunset: np.ndarray, avg_count: int):
+    '''
+    Вычисляет средние и общие значения за 24 часа и за промежуток светового дня по массивам почасовых и суточных данных.
+
+    Параметры:
+        codes (np.ndarray): Номер суток (строки суточных данных) каждой почасовой строки, -1 - суток нет в суточных данных
+        values (np.ndarray): Двумерный массив float64 почасовых значений (строки x столбцы средних, затем общих значений)
+        time (np.ndarray): Время почасовых строк
+        sunrise (np.ndarray): Время восхода по суткам (NaN - нет данных)
+        sunset (np.ndarray): Время заката по суткам (NaN - нет данных)
+        avg_count (int): Количество столбцов средних значений в values
+    Возвращает:
+        Двумерный массив (сутки x столбцы aggregate_columns)
+    '''
+
+    days_count = len(sunrise)
+    matched = codes >= 0
+    codes, values, time = codes[matched], values[matched], time[matched]
+    sun_missing = np.isnan(sunrise) | np.isnan(sunset)
+
+    daylight = ((time >= sunrise[codes]) & (time <= sunset[codes])) | sun_missing[codes]
+
+    def grouped(rows):
+        sums, counts, hours = group_sum(codes[rows], values[rows], days_count)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = sums/counts
+        return np.round(np.hstack([means[:, :avg_count], sums[:, avg_count:]]), 3), hours
+
+    result_24h, hours_24h = grouped(np.ones(len(codes), dtype=bool))
+    result_24h[hours_24h != 24] = np.nan
+
+    result_dl, hours_dl = grouped(daylight)
+    result_dl[(hours_dl == 0) | sun_missing] = np.nan
+
+    return np.hstack([result_24h, result_dl])
+
+def aggregate_columns(avg_units: List[str], total_units: List[str]):
+    '''
+    Формирует имена столбцов суточных агрегатов (aggregate_arrays) в порядке: средние и общие значения за 24 часа,
+    затем за световой день.
+
+    Параметры:
+        avg_units (List[str]): Список имен столбцов средних значений
+        total_units (List[str]): Список имен столбцов общих значений
+    Возвращает:
+        Список имен столбцов
+    '''
+
+    return (
+        [transform_unit(unit, ['_celsius','_m_per_s','_m'], 'avg_', '_24h') for unit in avg_units]
+        + [transform_unit(unit, ['_mm'], 'total_', '_24h') for unit in total_units]
+        + [transform_unit(unit, ['_celsius','_m_per_s','_m'], 'avg_', '_daylight') for unit in avg_units]
+        + [transform_unit(unit, ['_mm'], 'total_', '_daylight') for unit in total_units]
+    )
+
+@METRICS.timed()
+def build_tables(om_obj: OpenMeteo, workers: int = 1, native_timestamps: bool = False, spec: dict = OUTPUT_SPEC):
+    '''
+    Формирует итоговые таблицы из данных класса OpenMeteo по описанию spec.
+    Для нескольких местоположений таблицы содержат столбец location с номером местоположения.
+
+    Параметры:
+        om_obj: Экземпляр класса OpenMeteo
+        workers: Количество процессов. При workers > 1 данные разбиваются на части по суткам
+                 и обрабатываются параллельно (build_tables_parallel)
+        native_timestamps: Время восхода и заката (sunrise_iso, sunset_iso) в виде меток времени UTC
+                           для столбцов timestamptz вместо строк ISO 8601
+        spec: Описание итоговых таблиц (OUTPUT_SPEC). Переменные ответа, не используемые в описании, отбрасываются без конвертации
+    Возвращает:
+        Кортеж (table1 - суточные агрегированные метрики, table2 - почасовые конвертированные метрики)
+    '''
+
+    if workers > 1:
+        return build_tables_parallel(om_obj, workers, native_timestamps, spec)
+
+    days = om_obj.daily[om_obj.keys].set_index(om_obj.keys)
+
+    # Конвертация единиц измерения используемых почасовых переменных на месте и отбор столбцов итоговых таблиц
+    names = convert_output_units(om_obj, spec)
+
+    avg_units = [names.get(unit, unit) for unit in spec['avg']]
+    total_units = [names.get(unit, unit) for unit in spec['total']]
+
+    # Переменная table1 содержит датафрейм с агрегированными метриками итоговой таблицы
+    table1 = (
+        days.join(om_obj.aggregate(avg_units, total_units))
+        .join(om_obj.daylight_hours())
+        .join(om_obj.unix_to_iso(['sunrise', 'sunset'], native=native_timestamps))
+        .reset_index()
+        .rename(columns={'date':'date_unix'})
+    )
+
+    # Переменная table2 содержит датафрейм с конвертированными метриками итоговой таблицы
+    table2 = hourly_output(om_obj, [names.get(unit, unit) for unit in spec['hourly']])
+
+    return table1, table2
+
+def convert_output_units(om_obj: OpenMeteo, spec: dict = OUTPUT_SPEC):
+    '''
+    Конвертирует единицы измерения почасовых переменных описания spec на месте и отбрасывает неиспользуемые столбцы.
+
+    Параметры:
+        om_obj: Экземпляр класса OpenMeteo
+        spec: Описание итоговых таблиц (OUTPUT_SPEC)
+    Возвращает:
+        Словарь новых имен сконвертированных столбцов {переменная: столбец}
+    '''
+
+    hourly_variables, _ = required_variables(spec)
+    convertible = [unit for unit in hourly_variables if om_obj.json_data['hourly_units'].get(unit) in UNIT_CONVERSIONS]
+    names = dict(zip(convertible, om_obj.convert_units(convertible)))
+    om_obj.hourly = om_obj.hourly[om_obj.hourly_keys+[names.get(unit, unit) for unit in hourly_variables]]
+    return names
+
+def hourly_output(om_obj: OpenMeteo, columns: List[str]):
+    '''
+    Отбирает почасовые столбцы с ключом time_unix (и номером местоположения) для выгрузки.
+
+    Параметры:
+        om_obj: Экземпляр класса OpenMeteo
+        columns: Список столбцов
+    Возвращает:
+        pd.DataFrame
+    '''
+
+    return om_obj.hourly[[key for key in om_obj.hourly_keys if key != 'date']+columns].rename(columns={'time':'time_unix'})
+
+def required_variables(spec: dict = OUTPUT_SPEC):
+    '''
+    Выводит из описания итоговых таблиц минимальный набор переменных запроса API.
+
+    Параметры:
+        spec: Описание итоговых таблиц (OUTPUT_SPEC)
+    Возвращает:
+        Кортеж (почасовые переменные, суточные переменные)
+    '''
+
+    return list(dict.fromkeys(spec['hourly']+spec['avg']+spec['total'])), list(spec['daily'])
+
+@METRICS.timed()
+def build_tables_parallel(om_obj: OpenMeteo, workers: int, native_timestamps: bool = False, spec: dict = OUTPUT_SPEC):
+    '''
+    Формирует итоговые таблицы, обрабатывая части данных по суткам в пуле процессов.
+    Суточные данные делятся на workers последовательных частей, почасовые - по границам суток частей,
+    поэтому агрегаты суток вычисляются целиком в одной части. Почасовые столбцы передаются процессам
+    через общую память без сериализации, части объединяются в исходном порядке строк,
+    результат совпадает с build_tables.
+
+    Параметры:
+        om_obj: Экземпляр класса OpenMeteo
+        workers: Количество процессов
+        native_timestamps: Время восхода и заката в виде меток времени UTC (см. build_tables)
+        spec: Описание итоговых таблиц (OUTPUT_SPEC)
+    Возвращает:
+        Кортеж (table1 - суточные агрегированные метрики, table2 - почасовые конвертированные метрики)
+    '''
+
+    bounds = partition_bounds(om_obj, workers)
+    if bounds is None:
+        return build_tables(om_obj, native_timestamps=native_timestamps, spec=spec)
+
+    shm, layout = share_frame(om_obj.hourly)
+    try:
+        units = {'hourly_units': om_obj.json_data['hourly_units'], 'daily_units': om_obj.json_data['daily_units']}
+        with ProcessPoolExecutor(max_workers=len(bounds)) as executor:
+            futures = [
+                executor.submit(_build_partition, shm.name, layout, hourly_start, hourly_stop,
+                                om_obj.daily.iloc[daily_start:daily_stop], units, om_obj.keys, om_obj.compact, native_timestamps, spec)
+                for (daily_start, daily_stop), (hourly_start, hourly_stop) in bounds
+            ]
+            parts = [future.result() for future in futures]
+    finally:
+        shm.close()
+        shm.unlink()
+
+    table1 = pd.concat([table1 for table1, _ in parts], ignore_index=True)
+    table2 = pd.concat([table2 for _, table2 in parts])
+    return table1, table2
+
+def partition_bounds(om_obj: OpenMeteo, parts: int):
+    '''
+    Делит суточные и почасовые данные на последовательные части по границам суток.
+
+    Параметры:
+        om_obj: Экземпляр класса OpenMeteo
+        parts: Количество частей
+    Возвращает:
+        Список пар ((начало, конец) строк daily, (начало, конец) строк hourly)
+        либо None, если данные нельзя разделить (менее двух суток или время не в формате unixtime)
+    '''
+
+    parts = min(parts, len(om_obj.daily))
+    if parts < 2 or not all(pd.api.types.is_integer_dtype(frame['date']) for frame in (om_obj.hourly, om_obj.daily)):
+        return None
+
+    # Ключ суток (номер местоположения и дата) должен возрастать по строкам обоих датафреймов
+    def day_key(frame):
+        key = frame['date'].to_numpy(dtype=np.int64)
+        if len(om_obj.keys) > 1:
+            key = key + (frame['location'].to_numpy(dtype=np.int64) << 40)
+        return key
+
+    daily_key, hourly_key = day_key(om_obj.daily), day_key(om_obj.hourly)
+    if np.any(np.diff(daily_key) <= 0) or np.any(np.diff(hourly_key) < 0):
+        return None
+
+    daily_bounds = np.linspace(0, len(daily_key), parts+1).astype(np.int64)
+    hourly_bounds = np.searchsorted(hourly_key, daily_key[daily_bounds[1:-1]], side='left')
+    hourly_bounds = np.concatenate([[0], hourly_bounds, [len(hourly_key)]])
+    return [((int(daily_bounds[i]), int(daily_bounds[i+1])), (int(hourly_bounds[i]), int(hourly_bounds[i+1])))
+            for i in range(parts)]
+
+def share_frame(frame: pd.DataFrame):
+    '''
+    Копирует столбцы датафрейма в один блок общей памяти.
+    Для nullable столбцов (Int8, Int64, ...) сохраняются значения и маска пропусков.
+
+    Параметры:
+        frame (pd.DataFrame): Датафрейм с числовыми столбцами
+    Возвращает:
+        Кортеж (shared_memory.SharedMemory, схема размещения: список (столбец, тип, смещение значений, смещение маски))
+    '''
+
+    arrays, layout, offset = [], [], 0
+    for column in frame.columns:
+        values = frame[column]
+        if isinstance(values.dtype, pd.api.extensions.ExtensionDtype):
+            data = values.to_numpy(dtype=values.dtype.numpy_dtype, na_value=0)
+            mask = values.isna().to_numpy()
+        else:
+            data, mask = values.to_numpy(), None
+        layout.append((column, str(values.dtype), offset, offset+data.nbytes if mask is not None else None))
+        arrays.append(data)
+        offset += data.nbytes
+        if mask is not None:
+            arrays.append(mask)
+            offset += mask.nbytes
+
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    position = 0
+    for array in arrays:
+        shm.buf[position:position+array.nbytes] = np.ascontiguousarray(array).view(np.uint8).reshape(-1)
+        position += array.nbytes
+    return shm, layout
+
+def attach_frame(shm: shared_memory.SharedMemory, layout: list, start: int, stop: int):
+    '''
+    Восстанавливает строки start:stop датафрейма из блока общей памяти, созданного share_frame.
+    Столбцы датафрейма - представления блока без копирования, поэтому блок закрывается только после того,
+    как датафрейм и производные от него объекты больше не используются.
+
+    Параметры:
+        shm (shared_memory.SharedMemory): Открытый блок общей памяти
+        layout (list): Схема размещения столбцов
+        start, stop (int): Границы строк
+    Возвращает:
+        pd.DataFrame с индексом start:stop
+    '''
+
+    columns = {}
+    for column, dtype, offset, mask_offset in layout:
+        dtype = pd.api.types.pandas_dtype(dtype)
+        numpy_dtype = dtype.numpy_dtype if isinstance(dtype, pd.api.extensions.ExtensionDtype) else dtype
+        data = np.ndarray(stop, dtype=numpy_dtype, buffer=shm.buf, offset=offset)[start:]
+        if mask_offset is not None:
+            mask = np.ndarray(stop, dtype=np.bool_, buffer=shm.buf, offset=mask_offset)[start:]
+            data = dtype.construct_array_type()(data, mask)
+        columns[column] = data
+    return pd.DataFrame(columns, index=pd.RangeIndex(start, stop), copy=False)
+
+def _build_partition(name, layout, start, stop, daily, json_data, keys, compact, native_timestamps, spec):
+    '''
+    Формирует итоговые таблицы части данных в процессе пула (build_tables_parallel)
+    '''
+
+    # Блок остается открытым, пока почасовые данные части используются трансформацией
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        hourly = attach_frame(shm, layout, start, stop)
+        tables = build_tables(OpenMeteo.from_frames(hourly, daily, json_data, keys, compact), native_timestamps=native_timestamps, spec=spec)
+        del hourly
+    finally:
+        try:
+            shm.close()
+        except BufferError:
+            # При ошибке трансформации на столбцы блока ссылается трассировка, блок закрывается при завершении процесса
+            pass
+    return tables
+
 def transform_unit(unit, replace_array, agg, replace_val):
     '''
     Преобразует передаваемые имена столбцов в новые.
@@ -0,0 +1,55 @@
+-- Схема с типизированными столбцами: измерения - real, агрегаты - double precision, время - timestamptz.
+-- Таблица hourly разбита на месячные партиции по time_unix (партиции создаются при выгрузке), диапазонные
+-- запросы по времени используют BRIN индекс. Используется вместо init.sql при создании новой БД,
+-- ранее созданная БД переводится на схему миграцией migrations/002_typed_schema.sql
+
+CREATE SCHEMA IF NOT EXISTS NSK_PLUS_7GT;
+
+CREATE TABLE IF NOT EXISTS NSK_PLUS_7GT.daily(
+date_unix	timestamptz	NOT NULL PRIMARY KEY,
+avg_temperature_2m_24h	double precision,
+avg_relative_humidity_2m_24h	double precision,
+avg_dew_point_2m_24h	double precision,
+avg_apparent_temperature_24h	double precision,
+avg_temperature_80m_24h	double precision,
+avg_temperature_120m_24h	double precision,
+avg_wind_speed_10m_24h	double precision,
+avg_wind_speed_80m_24h	double precision,
+avg_visibility_24h	double precision,
+total_rain_24h	double precision,
+total_showers_24h	double precision,
+total_snowfall_24h	double precision,
+avg_temperature_2m_daylight	double precision,
+avg_relative_humidity_2m_daylight	double precision,
+avg_dew_point_2m_daylight	double precision,
+avg_apparent_temperature_daylight	double precision,
+avg_temperature_80m_daylight	double precision,
+avg_temperature_120m_daylight	double precision,
+avg_wind_speed_10m_daylight	double precision,
+avg_wind_speed_80m_daylight	double precision,
+avg_visibility_daylight	double precision,
+total_rain_daylight	double precision,
+total_showers_daylight	double precision,
+total_snowfall_daylight	double precision,
+daylight_hours	real,
+sunrise_iso	timestamptz,
+sunset_iso	timestamptz
+);
+
+CREATE TABLE IF NOT EXISTS NSK_PLUS_7GT.hourly(
+time_unix	timestamptz	NOT NULL PRIMARY KEY,
+wind_speed_10m_m_per_s	real,
+wind_speed_80m_m_per_s	real,
+temperature_2m_celsius	real,
+apparent_temperature_celsius	real,
+temperature_80m_celsius	real,
+temperature_120m_celsius	real,
+soil_temperature_0cm_celsius	real,
+soil_temperature_6cm_celsius	real,
+rain_mm	real,
+showers_mm	real,
+snowfall_mm	real
+) PARTITION BY RANGE (time_unix);
+
+CREATE INDEX IF NOT EXISTS hourly_time_unix_brin ON NSK_PLUS_7GT.hourly USING brin (time_unix);
+CREATE INDEX IF NOT EXISTS daily_date_unix_brin ON NSK_PLUS_7GT.daily USING brin (date_unix);
\ No newline at end of file
@@ -1,69 +1,372 @@
 import argparse
-import pandas as pd
+import os
+from contextlib import ExitStack, nullcontext
+from datetime import datetime, timezone
 
-from etl import extract,transform,load
+from etl import extract,load,cache,pipeline,metrics,scheduler
 
-def open_meteo_etl(start_date='2025-05-16',end_date='2025-05-30',file_path = ['res/hourly.csv','res/daily.csv'], conflict_resolve = 'NOTHING'):
+# Местоположения по умолчанию: (широта, долгота, схема БД)
+LOCATIONS = [('55.0344', '82.9434', 'nsk_plus_7gt')]
+
+def open_meteo_etl(start_date='2025-05-16',end_date='2025-05-30',file_path = ['res/hourly.csv','res/daily.csv'], conflict_resolve = 'NOTHING'
+                   , single_transaction = False, chunk_days = None, locations = LOCATIONS, cache_dir = None
+                   , incremental = False, compact_dtypes = False, file_format = None, compression = None, partition_by = None
+                   , stream_days = None, workers = 1, overlap = False, rate_limit = extract.OPEN_METEO_RATE_LIMIT, metrics_path = None
+                   , native_timestamps = False, load_workers = 4, push_down = False, client = None, array_core = False):
     '''
     Запуск ETL процесса OpenMeteoAPI данных
     Параметры:
     start_date: Дата начала интервала выгрузки данных по API (например, '2025-05-16')
     end_date: Крайняя дата интервала выгрузки данных по API (например, '2025-05-16')
-    file_path: Путь/ти в системе выгрузки .csv файлов
+    file_path: Пути в системе выгрузки файлов таблиц hourly и daily
     conflict_resolve: Вариант решения проблемы выгрузки дубликатов в БД ('NOTHING' - игнорирование дублирующих записей
                                                                          'UPDATE' - обновление дублирующих записей)
+    single_transaction: Выгрузка таблиц hourly и daily в одной транзакции (при ошибке не сохраняется ни одна из таблиц)
+    chunk_days: Длина части интервала в сутках для параллельного извлечения данных по API (по умолчанию интервал запрашивается целиком)
+    locations: Список местоположений (широта, долгота, схема БД). Данные всех местоположений запрашиваются одним запросом
+               и трансформируются совместно, таблицы каждого местоположения выгружаются в его схему
+    cache_dir: Каталог локального кэша ответов API (по умолчанию кэш не используется)
+    incremental: Инкрементальная загрузка: данные запрашиваются начиная с суток водяного знака (максимальных time_unix/date_unix)
+                 таблиц hourly и daily, выгружаются часы начиная с суток водяного знака и пересчитанные сутки, затронутые ими.
+                 Ранее загруженные строки этих суток обновляются (прогнозные значения заменяются актуальными)
+    compact_dtypes: Хранение почасовых/суточных данных в компактной схеме типов (float32, целые типы кодов, время - int64) для длинных интервалов
+    file_format: Формат файлов ('csv', 'parquet', 'feather'), по умолчанию - по расширению file_path
+    compression: Кодек сжатия файлов (например, 'zstd' или 'snappy' для parquet), по умолчанию - кодек формата по умолчанию
+    partition_by: Разбиение файлов по времени ('month', 'date'), по умолчанию файлы не разбиваются
+    stream_days: Потоковая обработка интервала частями по stream_days суток: каждая часть извлекается, трансформируется
+                 и выгружается до запроса следующей, объем памяти не зависит от длины интервала (по умолчанию интервал обрабатывается целиком)
+    workers: Количество процессов для параллельной трансформации данных частями по суткам (по умолчанию трансформация в одном процессе)
+    overlap: Одновременное выполнение стадий для соседних частей интервала (stream_days): извлечение части N+1, трансформация части N
+             и выгрузка части N-1 выполняются в отдельных потоках, соединенных ограниченными очередями
+    rate_limit: Ограничение частоты запросов к API в минуту (по умолчанию - ограничение бесплатного тарифа open-meteo)
+    metrics_path: Путь файла метрик запуска (время стадий, строки, байты, пиковая память): .prom - текстовый формат Prometheus,
+                  иначе строка JSON добавляется в файл (по умолчанию метрики не сохраняются)
+    native_timestamps: Время восхода и заката выгружается метками времени (timestamptz) без форматирования в строки ISO 8601
+                       (для таблиц daily после миграции migrations/001_sun_timestamptz.sql)
+    load_workers: Количество потоков выгрузки: файлы и таблицы hourly/daily выгружаются одновременно, таблицы - по отдельным
+                  соединениям пула (1 - последовательная выгрузка). При single_transaction транзакции соединений фиксируются
+                  после выгрузки всех таблиц и откатываются при ошибке любой из них
+    push_down: Вычисление суточных агрегатов в БД: выгружаются почасовые переменные агрегатов и время восхода/заката
+               (таблицы hourly_source, daily_sun), таблица daily пересчитывается запросом для суток части интервала
+               (при incremental - для суток, затронутых новыми часами). Файлы daily сохраняются по результату пересчета
+    client: HTTP клиент API (extract.OpenMeteoClient), переиспользуемый между запусками (по умолчанию клиент создается на время запуска)
+    array_core: Трансформация на массивах NumPy (etl.arrays.ArrayMeteo) без промежуточных датафреймов, итоговые таблицы
+                совпадают с OpenMeteo (несовместимо с compact_dtypes, workers > 1 и push_down)
     '''
+    metrics.METRICS.reset()
     try:
-        om_obj = transform.OpenMeteo(extract.open_meteo_api(start_date=start_date,end_date=end_date))
-
-        # В отдельных переменных определим столбцы времени/дат, для дальнейших соединений транформированных столбцов
-        hours = pd.DataFrame(om_obj.hourly[['time','relative_humidity_2m']]).set_index('time')
-        days = pd.DataFrame(om_obj.daily[['date']]).set_index('date')
-
-        # Обновление данных датафрейма hourly класса OpenMeteo 
-        om_obj.hourly = (
-            hours.join(om_obj.kn_to_mps(['wind_speed_10m', 'wind_speed_80m']))
-            .join(om_obj.ft_to_m(['visibility']))
-            .join(om_obj.fah_to_cel(['temperature_2m','dew_point_2m','apparent_temperature','temperature_80m','temperature_120m','soil_temperature_0cm','soil_temperature_6cm']))
-            .join(om_obj.inch_to_mm(['rain', 'showers', 'snowfall']))
-            .reset_index()
-        )
-
-        # Список новых столбцов таблицы hourly класса OpenMeteo
-        columns = om_obj.hourly.columns.tolist()
-
-        # Переменная table1 содержит датафрейм с агрегированными метриками итоговой таблицы
-        table1 = (
-            days.join(om_obj.avg_for_24h([columns[6]]+[columns[2]]+columns[7:11]+columns[3:6]))
-            .join(om_obj.total_for_24h(columns[13:]))
-            .join(om_obj.avg_for_daylight([columns[6]]+[columns[2]]+columns[7:11]+columns[3:6]))
-            .join(om_obj.total_for_daylight(columns[13:]))
-            .join(om_obj.daylight_hours())
-            .join(om_obj.unix_to_iso(['sunrise', 'sunset']))
-            .reset_index()
-            .rename(columns={'date':'date_unix'})
-        )
-
-        # Переменная table2 содержит датафрейм с конвертированными метриками итоговой таблицы
-        table2 = (
-            om_obj.hourly.drop(['date','relative_humidity_2m','dew_point_2m_celsius','visibility_m'],axis=1)
-            .rename(columns={'time':'time_unix'})
-        )
-
-        print(f'Выгрузка первой части итоговой таблицы по пути {file_path[0]}')
-        load.load_to_csv(table2.set_index('time_unix'), file_path[0])
-
-        print(f'Выгрузка второй части итоговой таблицы по пути {file_path[1]}')
-        load.load_to_csv(table1.set_index('date_unix'), file_path[1])
-
-        print(f'Выгрузка в БД')
-        load.load_to_db(table2, 'hourly', 'time_unix', conflict_resolve = conflict_resolve)
-        load.load_to_db(table1, 'daily', 'date_unix', conflict_resolve= conflict_resolve)
+        if array_core and (compact_dtypes or workers > 1 or push_down):
+            raise ValueError('Трансформация на массивах NumPy несовместима с компактной схемой типов, workers > 1 и push_down')
+
+        multiple = len(locations) > 1
+
+        watermarks = {}
+        # Таблицы местоположений, отличных от схемы-шаблона, создаются перед первой выгрузкой
+        if incremental or any(schema != load.TEMPLATE_SCHEMA for _, _, schema in locations):
+            with load.db_session() as conn:
+                for _, _, schema in locations:
+                    load.ensure_tables(conn, schema)
+                    if incremental:
+                        watermarks[schema] = (load.get_watermark(conn, 'hourly', 'time_unix', schema = schema),
+                                              load.get_watermark(conn, 'daily', 'date_unix', schema = schema))
+
+        if incremental:
+            start_date = incremental_start_date(start_date, watermarks.values())
+            if start_date > end_date:
+                print(f'Новых данных для выгрузки нет (данные загружены по {start_date})')
+                return True
+            print(f'Инкрементальная выгрузка данных начиная с {start_date}')
+
+        # Модули трансформации (pandas, NumPy) импортируются, только если есть данные для обработки
+        from etl import transform
+        if push_down:
+            from etl import rollup
+        if array_core:
+            from etl import arrays
+
+        # Интервал обрабатывается частями по stream_days суток: часть извлекается, трансформируется и выгружается
+        # до запроса следующей. Части выровнены по суткам, поэтому суточные агрегаты не пересекают границ частей
+        date_ranges = extract.plan_date_ranges(start_date, end_date, stream_days) if stream_days else [(start_date, end_date)]
+        response_cache = cache.ResponseCache(cache_dir) if cache_dir else None
+        # Запрашиваются только переменные, используемые в итоговых таблицах
+        hourly_variables, daily_variables = transform.required_variables()
+
+        # Часы суток водяного знака и агрегаты затронутых ими суток получены повторно и должны заменить ранее загруженные
+        incremental_conflict_resolve = 'UPDATE' if incremental else conflict_resolve
+
+        with ExitStack() as stack:
+            # Файлы открыты на все время выгрузки, каждая часть дописывается в них новой группой строк
+            sinks = {
+                schema: [stack.enter_context(load.FileSink(location_path(path, schema, multiple), file_format, compression, partition_by))
+                         for path in file_path]
+                for _, _, schema in locations
+            }
+            # Таблицы hourly и daily выгружаются по отдельным соединениям группы с общей фиксацией в конце выгрузки
+            transaction = stack.enter_context(load.TransactionGroup()) if single_transaction else None
+            # Запросы всех частей выполняются через одну сессию с постоянными соединениями
+            if client is None:
+                client = stack.enter_context(open_meteo_client(rate_limit))
+
+            @metrics.METRICS.timed('extract')
+            def extract_part(date_range):
+                range_start, range_end = date_range
+                if stream_days:
+                    print(f'Извлечение части интервала {range_start} - {range_end}')
+                return extract.open_meteo_api(
+                    latitude=[latitude for latitude, _, _ in locations],
+                    longitude=[longitude for _, longitude, _ in locations],
+                    hourly=hourly_variables, daily=daily_variables,
+                    start_date=range_start,end_date=range_end,chunk_days=chunk_days,
+                    cache=response_cache,
+                    stream=True,
+                    client=client
+                )
+
+            @metrics.METRICS.timed('transform')
+            def transform_part(meteo_data):
+                if push_down:
+                    # Суточные агрегаты вычисляются в БД: вместо table1 выгружаются почасовые переменные агрегатов и время восхода/заката
+                    table2, source, sun = rollup.rollup_inputs(transform.OpenMeteo(meteo_data, compact=compact_dtypes))
+                    tables = []
+                    for i, (_, _, schema) in enumerate(locations):
+                        hourly_table, location_sun = location_table(table2, i, multiple), location_table(sun, i, multiple)
+                        # Пересчитываются сутки части интервала либо сутки, затронутые новыми часами
+                        hourly_table, dates = (incremental_rows(hourly_table, location_sun, *watermarks[schema]) if incremental
+                                               else (hourly_table, location_sun))
+                        tables.append((schema, hourly_table, (location_table(source, i, multiple), location_sun, dates['date_unix'])))
+                else:
+                    # Переменная table1 содержит агрегированные метрики, table2 - конвертированные метрики итоговой таблицы
+                    if array_core:
+                        # Конвертации и агрегации добавляют столбцы в блоки массивов, датафреймы формируются один раз
+                        table1, table2 = arrays.build_tables(arrays.ArrayMeteo(meteo_data), native_timestamps = native_timestamps)
+                    else:
+                        om_obj = transform.OpenMeteo(meteo_data, compact=compact_dtypes)
+                        table1, table2 = transform.build_tables(om_obj, workers = workers, native_timestamps = native_timestamps)
+
+                    tables = [
+                        (schema, location_table(table2, i, multiple), location_table(table1, i, multiple))
+                        for i, (_, _, schema) in enumerate(locations)
+                    ]
+                    if incremental:
+                        tables = [(schema, *incremental_rows(hourly_table, daily_table, *watermarks[schema]))
+                                  for schema, hourly_table, daily_table in tables]
+
+                for _, hourly_table, daily_table in tables:
+                    metrics.METRICS.count('rows_out', len(hourly_table), stage='transform', table='hourly')
+                    metrics.METRICS.count('rows_out', len(daily_table[2] if push_down else daily_table), stage='transform', table='daily')
+                return tables
+
+            @metrics.METRICS.timed('load')
+            def load_part(tables):
+                def file_task(table, table_key, sink):
+                    def task():
+                        print(f'Выгрузка таблицы по пути {sink.file_path}')
+                        return load.load_to_file(table.set_index(table_key), sink.file_path, sink = sink)
+                    return task
+
+                def db_task(position, table_name, table_key, table_conflict_resolve):
+                    # Таблица всех местоположений выгружается последовательно по одному соединению
+                    def task():
+                        conn = transaction.connection(table_name) if transaction else None
+                        return all([load.load_to_db(location_tables[position], table_name, table_key, schema = schema,
+                                                    conflict_resolve = table_conflict_resolve, conn = conn)
+                                    for schema, *location_tables in tables])
+                    return task
+
+                def rollup_task():
+                    # Суточные агрегаты всех местоположений пересчитываются в БД по одному соединению и сохраняются в файлы daily
+                    def task():
+                        results = []
+                        for schema, _, daily_part in tables:
+                            with nullcontext(transaction.connection('daily')) if transaction else load.db_session() as conn:
+                                daily_table = rollup.load_rollup(conn, schema, *daily_part)
+                            results.append(file_task(daily_table, 'date_unix', sinks[schema][1])())
+                        return all(results)
+                    return task
+
+                tasks = [file_task(hourly_table, 'time_unix', sinks[schema][0]) for schema, hourly_table, _ in tables]
+                if not push_down:
+                    tasks += [file_task(daily_table, 'date_unix', sinks[schema][1]) for schema, _, daily_table in tables]
+                tasks += [db_task(0, 'hourly', 'time_unix', incremental_conflict_resolve),
+                          rollup_task() if push_down else db_task(1, 'daily', 'date_unix', incremental_conflict_resolve)]
+
+                print(f'Выгрузка в файлы и БД')
+                results = load.run_parallel(tasks, max_workers = load_workers)
+                # Ошибка выгрузки любой таблицы завершает ETL процесс с ошибкой (в том числе для планировщика)
+                if single_transaction and not all(results[-2:]):
+                    raise RuntimeError('Выгрузка таблиц в БД прервана, транзакция отменена')
+                if not all(results):
+                    raise RuntimeError('Выгрузка таблиц в файлы или БД завершилась с ошибкой')
+
+            # При overlap извлечение, трансформация и выгрузка соседних частей выполняются одновременно
+            pipeline.Pipeline([extract_part, transform_part, load_part], threaded = overlap).run(date_ranges)
+
+            if client.latencies:
+                print(f'Задержка запросов API (сек): {client.latency_report()}')
 
     except Exception as e:
         print(f"Ошибка в ETL процессе: {e}")
         return False
-    
+    finally:
+        if metrics_path:
+            metrics.METRICS.write(metrics_path)
+
+def serve(intervals = None, status_port = None, locations = LOCATIONS, file_path = ['res/hourly.csv','res/daily.csv']
+          , rate_limit = extract.OPEN_METEO_RATE_LIMIT, **etl_options):
+    '''
+    Запуск ETL процесса в режиме планировщика: инкрементальное обновление данных каждого местоположения
+    с заданным интервалом в одном процессе. Модули, HTTP сессия и пул соединений с БД переиспользуются всеми запусками,
+    запуски, наступившие во время выполнения задания, объединяются в один
+    Параметры:
+    intervals: Интервалы запуска в минутах по схеме местоположения (ключ None - интервал по умолчанию, 60 минут)
+    status_port: Порт HTTP сервера состояния заданий (GET /status: состояние, длительность и ошибка последнего запуска)
+    locations: Список местоположений (широта, долгота, схема БД)
+    file_path: Пути файлов таблиц hourly и daily (при нескольких местоположениях - в подкаталогах схем)
+    rate_limit: Ограничение частоты запросов к API в минуту
+    etl_options: Остальные параметры open_meteo_etl (start_date - начало интервала для местоположений без загруженных данных)
+    '''
+    intervals = intervals or {}
+    default_interval = intervals.get(None, 60)
+    multiple = len(locations) > 1
+
+    with open_meteo_client(rate_limit) as client:
+        def run(location):
+            # Данные запрашиваются по текущие сутки начиная с водяного знака таблиц местоположения
+            with client.lock:
+                client.latencies.clear()
+            return open_meteo_etl(end_date = datetime.now(timezone.utc).date().isoformat(), locations = [location], incremental = True,
+                                  file_path = [location_path(path, location[2], multiple) for path in file_path], client = client,
+                                  **etl_options)
+
+        jobs = [scheduler.Job(location, intervals.get(location[2], default_interval)*60) for location in locations]
+        etl_scheduler = scheduler.Scheduler(run, jobs)
+        server = scheduler.serve_status(etl_scheduler, status_port) if status_port is not None else None
+        print(f'Планировщик запущен: {", ".join(f"{job.name} каждые {job.interval/60:g} мин" for job in jobs)}')
+        try:
+            etl_scheduler.run_forever()
+        except KeyboardInterrupt:
+            print('Планировщик остановлен')
+        finally:
+            if server is not None:
+                server.shutdown()
+            load.close_pools()
+
+def open_meteo_client(rate_limit = extract.OPEN_METEO_RATE_LIMIT):
+    '''
+    Создает HTTP клиент API с ограничением частоты запросов rate_limit в минуту
+    (для ограничения по умолчанию - с общим ограничителем процесса).
+
+    Returns:
+        extract.OpenMeteoClient
+    '''
+
+    return extract.OpenMeteoClient(rate_limiter = extract.RateLimiter(rate_limit/60)
+                                   if rate_limit != extract.OPEN_METEO_RATE_LIMIT else extract.RATE_LIMITER)
+
+def incremental_start_date(start_date, watermarks):
+    '''
+    Определяет начальную дату запроса для инкрементальной загрузки - сутки самого раннего водяного знака.
+    Сутки водяного знака запрашиваются повторно, чтобы пересчитать их агрегаты по полному набору часов.
+
+    Параметры:
+        start_date: Начальная дата интервала, используемая, если у местоположения еще нет загруженных данных
+        watermarks: Водяные знаки (time_unix таблицы hourly, date_unix таблицы daily) каждого местоположения
+    Returns:
+        Дату в формате ISO
+    '''
+
+    dates = []
+    for hourly_watermark, daily_watermark in watermarks:
+        if hourly_watermark is None or daily_watermark is None:
+            return start_date
+        dates.append(min(hourly_watermark, daily_watermark))
+    return datetime.fromtimestamp(min(dates), tz=timezone.utc).date().isoformat()
+
+def incremental_rows(hourly_table, daily_table, hourly_watermark, daily_watermark):
+    '''
+    Отбирает строки итоговых таблиц, которые нужно выгрузить при инкрементальной загрузке:
+    часы начиная с суток водяного знака hourly (часы этих суток могли быть загружены прогнозными значениями)
+    и сутки, затронутые отобранными часами либо не старше водяного знака daily.
+
+    Параметры:
+        hourly_table: Таблица почасовых метрик
+        daily_table: Таблица суточных метрик
+        hourly_watermark: Максимальный time_unix таблицы hourly в БД (None - таблица пуста)
+        daily_watermark: Максимальный date_unix таблицы daily в БД (None - таблица пуста)
+    Returns:
+        Кортеж (hourly_table, daily_table)
+    '''
+
+    if hourly_watermark is not None:
+        hourly_table = hourly_table[hourly_table['time_unix'] >= hourly_watermark//86400*86400]
+    if daily_watermark is not None:
+        touched_dates = hourly_table['time_unix']//86400*86400
+        daily_table = daily_table[daily_table['date_unix'].isin(touched_dates) | (daily_table['date_unix'] >= daily_watermark)]
+    return hourly_table, daily_table
+
+def location_table(table, index, multiple):
+    '''
+    Выбирает из итоговой таблицы строки одного местоположения.
+
+    Параметры:
+        table: Итоговая таблица (со столбцом location при нескольких местоположениях)
+        index: Номер местоположения
+        multiple: Признак выгрузки нескольких местоположений
+    Returns:
+        pd.DataFrame
+    '''
+
+    if not multiple:
+        return table
+    return table[table['location'] == index].drop(columns='location')
+
+def location_path(path, schema, multiple):
+    '''
+    Формирует путь файла местоположения: при нескольких местоположениях файлы размещаются в подкаталоге схемы.
+
+    Параметры:
+        path: Путь файла
+        schema: Схема БД местоположения
+        multiple: Признак выгрузки нескольких местоположений
+    Returns:
+        Строку
+    '''
+
+    if not multiple:
+        return path
+    directory, name = os.path.split(path)
+    return os.path.join(directory, schema, name)
+
+def parse_location(value):
+    '''
+    Разбирает местоположение из аргумента командной строки вида 'широта,долгота,схема'.
+
+    Returns:
+        Кортеж (широта, долгота, схема)
+    '''
+
+    parts = value.split(',')
+    if len(parts) != 3:
+        raise argparse.ArgumentTypeError(f'Местоположение {value} должно быть задано в виде широта,долгота,схема')
+    return tuple(part.strip() for part in parts)
+
+def parse_interval(value):
+    '''
+    Разбирает интервал запуска планировщика из аргумента командной строки вида 'минуты' либо 'схема=минуты'.
+
+    Returns:
+        Кортеж (схема либо None для интервала по умолчанию, минуты)
+    '''
+
+    schema, _, minutes = value.rpartition('=')
+    try:
+        minutes = float(minutes)
+    except ValueError:
+        minutes = 0
+    if minutes <= 0:
+        raise argparse.ArgumentTypeError(f'Интервал {value} должен быть задан в виде минуты либо схема=минуты')
+    return schema or None, minutes
+
 def parse_arguments():
     '''
     Настраивает и парсит аргументы командной строки.
@@ -75,6 +378,14 @@ def parse_arguments():
         description="ETL-процесс для извлечения данных из API, их трансформации и сохранения в CSV."
     )
     
+    parser.add_argument(
+        'command',
+        nargs='?',
+        choices=['run', 'serve'],
+        default='run',
+        help='run - однократный запуск ETL процесса, serve - запуск планировщика инкрементальных обновлений (по умолчанию: run)'
+    )
+
     # Обязательный аргумент
     parser.add_argument(
         '--start_date','-sdt',
@@ -93,8 +404,32 @@ def parse_arguments():
     parser.add_argument(
         '--file_path',
         type=str,
+        nargs=2,
         default=['res/hourly.csv','res/daily.csv'],
-        help='Путь для сохранения CSV-файлов (по умолчанию: res/daily.csv, res/hourly.csv)'
+        help='Пути для сохранения файлов таблиц hourly и daily (по умолчанию: res/hourly.csv res/daily.csv)'
+    )
+
+    parser.add_argument(
+        '--file_format',
+        type=str,
+        choices=list(load.FILE_FORMATS),
+        default=None,
+        help='Формат файлов: csv, parquet или feather (по умолчанию: по расширению --file_path)'
+    )
+
+    parser.add_argument(
+        '--compression',
+        type=str,
+        default=None,
+        help='Кодек сжатия файлов, например zstd, snappy, lz4, gzip (по умолчанию: кодек формата по умолчанию)'
+    )
+
+    parser.add_argument(
+        '--partition_by',
+        type=str,
+        choices=list(load.PARTITIONS),
+        default=None,
+        help='Разбиение файлов по месяцам или суткам в подкаталоги вида month=2025-05 (по умолчанию: без разбиения)'
     )
 
     parser.add_argument(
@@ -105,6 +440,120 @@ def parse_arguments():
         'Варианты: - ''NOTHING'' - игнорирование дублирующий по ключу записей,' \
         '          - ''UPDATE'' - обновление дублирующий по ключу записей'
     )
+
+    parser.add_argument(
+        '--location',
+        type=parse_location,
+        action='append',
+        default=None,
+        help='Местоположение в виде широта,долгота,схема; аргумент можно повторять (по умолчанию: 55.0344,82.9434,nsk_plus_7gt)'
+    )
+
+    parser.add_argument(
+        '--chunk_days',
+        type=int,
+        default=None,
+        help='Длина части интервала в сутках для параллельного извлечения данных по API (по умолчанию: весь интервал одним запросом)'
+    )
+
+    parser.add_argument(
+        '--stream_days',
+        type=int,
+        default=None,
+        help='Потоковая обработка интервала частями по указанному числу суток с выгрузкой каждой части до запроса следующей (по умолчанию: интервал целиком)'
+    )
+
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Количество процессов для параллельной трансформации данных частями по суткам (по умолчанию: 1)'
+    )
+
+    parser.add_argument(
+        '--overlap',
+        action='store_true',
+        help='Одновременное извлечение, трансформация и выгрузка соседних частей интервала --stream_days в отдельных потоках'
+    )
+
+    parser.add_argument(
+        '--rate_limit',
+        type=int,
+        default=extract.OPEN_METEO_RATE_LIMIT,
+        help=f'Ограничение частоты запросов к API в минуту (по умолчанию: {extract.OPEN_METEO_RATE_LIMIT})'
+    )
+
+    parser.add_argument(
+        '--metrics_path',
+        type=str,
+        default=None,
+        help='Путь файла метрик запуска: .prom - формат Prometheus, иначе журнал JSON, например res/metrics.jsonl (по умолчанию: не сохраняются)'
+    )
+
+    parser.add_argument(
+        '--native_timestamps',
+        action='store_true',
+        help='Выгрузка времени восхода и заката метками времени timestamptz без форматирования в строки (после миграции migrations/001_sun_timestamptz.sql)'
+    )
+
+    parser.add_argument(
+        '--load_workers',
+        type=int,
+        default=4,
+        help='Количество потоков одновременной выгрузки файлов и таблиц hourly/daily (1 - последовательная выгрузка, по умолчанию: 4)'
+    )
+
+    parser.add_argument(
+        '--push_down',
+        action='store_true',
+        help='Вычисление суточных агрегатов таблицы daily запросом в БД по выгруженным почасовым данным'
+    )
+
+    parser.add_argument(
+        '--array_core',
+        action='store_true',
+        help='Трансформация на массивах NumPy без промежуточных датафреймов (результат совпадает с трансформацией по умолчанию)'
+    )
+
+    parser.add_argument(
+        '--cache_dir',
+        type=str,
+        default=None,
+        help='Каталог локального кэша ответов API, например .cache/open_meteo (по умолчанию: кэш не используется)'
+    )
+
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help='Инкрементальная загрузка: запрос и выгрузка часов и затронутых ими суток начиная с суток водяного знака таблиц БД'
+    )
+
+    parser.add_argument(
+        '--compact_dtypes',
+        action='store_true',
+        help='Хранение данных при трансформации в компактной схеме типов (float32 для измерений, int64 для времени)'
+    )
+
+    parser.add_argument(
+        '--single_transaction',
+        action='store_true',
+        help='Выгрузка таблиц hourly и daily с общей фиксацией транзакций: при ошибке не сохраняется ни одна из таблиц'
+    )
+
+    parser.add_argument(
+        '--interval',
+        type=parse_interval,
+        action='append',
+        default=None,
+        help='Интервал запуска планировщика (serve) в минутах: для всех местоположений либо схема=минуты; аргумент можно повторять (по умолчанию: 60)'
+    )
+
+    parser.add_argument(
+        '--status_port',
+        type=int,
+        default=None,
+        help='Порт HTTP сервера состояния планировщика (serve), GET /status (по умолчанию: сервер не запускается)'
+    )
     
     return parser.parse_args()
 
@@ -112,8 +561,30 @@ if __name__ == '__main__':
 
     args = parse_arguments()
 
-    open_meteo_etl(
+    options = dict(
         start_date = args.start_date,
-        end_date = args.end_date,
-        file_path = args.file_path
-    )
\ No newline at end of file
+        file_path = args.file_path,
+        conflict_resolve = args.conflict_resolve,
+        single_transaction = args.single_transaction,
+        chunk_days = args.chunk_days,
+        locations = args.location or LOCATIONS,
+        cache_dir = args.cache_dir,
+        compact_dtypes = args.compact_dtypes,
+        file_format = args.file_format,
+        compression = args.compression,
+        partition_by = args.partition_by,
+        stream_days = args.stream_days,
+        workers = args.workers,
+        overlap = args.overlap,
+        rate_limit = args.rate_limit,
+        metrics_path = args.metrics_path,
+        native_timestamps = args.native_timestamps,
+        load_workers = args.load_workers,
+        push_down = args.push_down,
+        array_core = args.array_core
+    )
+
+    if args.command == 'serve':
+        serve(intervals = dict(args.interval or []), status_port = args.status_port, **options)
+    else:
+        open_meteo_etl(end_date = args.end_date, incremental = args.incremental, **options)
@@ -0,0 +1,21 @@
+-- Хранение времени восхода и заката (sunrise_iso, sunset_iso) таблиц daily в типе timestamptz вместо varchar(25).
+-- После миграции выгрузка с ключом --native_timestamps передает метки времени без форматирования в строки,
+-- строки ISO 8601 (запуск без ключа) приводятся к timestamptz при вставке.
+-- Миграция применяется ко всем схемам с таблицей daily, новые схемы создаются по образцу nsk_plus_7gt.
+
+DO $$
+DECLARE
+    schema_name text;
+BEGIN
+    FOR schema_name IN
+        SELECT table_schema FROM information_schema.columns
+        WHERE table_name = 'daily' AND column_name = 'sunrise_iso' AND data_type = 'character varying'
+    LOOP
+        EXECUTE format(
+            'ALTER TABLE %I.daily
+                 ALTER COLUMN sunrise_iso TYPE timestamptz USING sunrise_iso::timestamptz,
+                 ALTER COLUMN sunset_iso TYPE timestamptz USING sunset_iso::timestamptz',
+            schema_name
+        );
+    END LOOP;
+END $$;
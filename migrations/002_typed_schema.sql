@@ -0,0 +1,107 @@
+-- Перевод таблиц hourly и daily на типизированную схему init_typed.sql: измерения - real, агрегаты - double precision,
+-- ключи time_unix/date_unix и время восхода/заката - timestamptz, hourly разбита на месячные партиции, BRIN индексы по времени.
+-- Миграция применяется ко всем схемам, в которых time_unix таблицы hourly еще имеет тип integer.
+-- Исходные таблицы сохраняются под именами hourly_numeric и daily_numeric и удаляются вручную после проверки данных.
+
+DO $$
+DECLARE
+    schema_name text;
+    month_start timestamptz;
+    last_month timestamptz;
+BEGIN
+    FOR schema_name IN
+        SELECT table_schema FROM information_schema.columns
+        WHERE table_name = 'hourly' AND column_name = 'time_unix' AND data_type = 'integer'
+    LOOP
+        EXECUTE format('ALTER TABLE %I.hourly RENAME TO hourly_numeric', schema_name);
+        EXECUTE format('ALTER TABLE %I.daily RENAME TO daily_numeric', schema_name);
+        EXECUTE format('ALTER INDEX IF EXISTS %I.hourly_pkey RENAME TO hourly_numeric_pkey', schema_name);
+        EXECUTE format('ALTER INDEX IF EXISTS %I.daily_pkey RENAME TO daily_numeric_pkey', schema_name);
+
+        EXECUTE format(
+            'CREATE TABLE %I.daily(
+                date_unix timestamptz NOT NULL PRIMARY KEY,
+                avg_temperature_2m_24h double precision,
+                avg_relative_humidity_2m_24h double precision,
+                avg_dew_point_2m_24h double precision,
+                avg_apparent_temperature_24h double precision,
+                avg_temperature_80m_24h double precision,
+                avg_temperature_120m_24h double precision,
+                avg_wind_speed_10m_24h double precision,
+                avg_wind_speed_80m_24h double precision,
+                avg_visibility_24h double precision,
+                total_rain_24h double precision,
+                total_showers_24h double precision,
+                total_snowfall_24h double precision,
+                avg_temperature_2m_daylight double precision,
+                avg_relative_humidity_2m_daylight double precision,
+                avg_dew_point_2m_daylight double precision,
+                avg_apparent_temperature_daylight double precision,
+                avg_temperature_80m_daylight double precision,
+                avg_temperature_120m_daylight double precision,
+                avg_wind_speed_10m_daylight double precision,
+                avg_wind_speed_80m_daylight double precision,
+                avg_visibility_daylight double precision,
+                total_rain_daylight double precision,
+                total_showers_daylight double precision,
+                total_snowfall_daylight double precision,
+                daylight_hours real,
+                sunrise_iso timestamptz,
+                sunset_iso timestamptz
+            )', schema_name);
+
+        EXECUTE format(
+            'CREATE TABLE %I.hourly(
+                time_unix timestamptz NOT NULL PRIMARY KEY,
+                wind_speed_10m_m_per_s real,
+                wind_speed_80m_m_per_s real,
+                temperature_2m_celsius real,
+                apparent_temperature_celsius real,
+                temperature_80m_celsius real,
+                temperature_120m_celsius real,
+                soil_temperature_0cm_celsius real,
+                soil_temperature_6cm_celsius real,
+                rain_mm real,
+                showers_mm real,
+                snowfall_mm real
+            ) PARTITION BY RANGE (time_unix)', schema_name);
+
+        EXECUTE format('CREATE INDEX hourly_time_unix_brin ON %I.hourly USING brin (time_unix)', schema_name);
+        EXECUTE format('CREATE INDEX daily_date_unix_brin ON %I.daily USING brin (date_unix)', schema_name);
+
+        -- Месячные партиции (по UTC) для всего диапазона загруженных данных, имена - как у партиций, создаваемых load_to_db
+        EXECUTE format(
+            'SELECT date_trunc(''month'', to_timestamp(min(time_unix)) AT TIME ZONE ''UTC'') AT TIME ZONE ''UTC'',
+                    date_trunc(''month'', to_timestamp(max(time_unix)) AT TIME ZONE ''UTC'') AT TIME ZONE ''UTC''
+             FROM %I.hourly_numeric', schema_name)
+        INTO month_start, last_month;
+
+        WHILE month_start <= last_month LOOP
+            EXECUTE format(
+                'CREATE TABLE %I.%I PARTITION OF %I.hourly FOR VALUES FROM (%L) TO (%L)',
+                schema_name, 'hourly_' || to_char(month_start AT TIME ZONE 'UTC', 'YYYY_MM'), schema_name,
+                month_start, month_start + interval '1 month'
+            );
+            month_start := month_start + interval '1 month';
+        END LOOP;
+
+        EXECUTE format(
+            'INSERT INTO %1$I.hourly
+             SELECT to_timestamp(time_unix), wind_speed_10m_m_per_s, wind_speed_80m_m_per_s, temperature_2m_celsius,
+                    apparent_temperature_celsius, temperature_80m_celsius, temperature_120m_celsius,
+                    soil_temperature_0cm_celsius, soil_temperature_6cm_celsius, rain_mm, showers_mm, snowfall_mm
+             FROM %1$I.hourly_numeric', schema_name);
+
+        EXECUTE format(
+            'INSERT INTO %1$I.daily
+             SELECT to_timestamp(date_unix), avg_temperature_2m_24h, avg_relative_humidity_2m_24h, avg_dew_point_2m_24h,
+                    avg_apparent_temperature_24h, avg_temperature_80m_24h, avg_temperature_120m_24h, avg_wind_speed_10m_24h,
+                    avg_wind_speed_80m_24h, avg_visibility_24h, total_rain_24h, total_showers_24h, total_snowfall_24h,
+                    avg_temperature_2m_daylight, avg_relative_humidity_2m_daylight, avg_dew_point_2m_daylight,
+                    avg_apparent_temperature_daylight, avg_temperature_80m_daylight, avg_temperature_120m_daylight,
+                    avg_wind_speed_10m_daylight, avg_wind_speed_80m_daylight, avg_visibility_daylight, total_rain_daylight,
+                    total_showers_daylight, total_snowfall_daylight, daylight_hours,
+                    sunrise_iso::timestamptz, sunset_iso::timestamptz
+             FROM %1$I.daily_numeric', schema_name);
+    END LOOP;
+END $$;